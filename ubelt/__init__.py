@@ -73,7 +73,7 @@ else:  # pragma: nobranch
     from ubelt import progiter
 
     from ubelt.util_arg import (argflag, argval,)
-    from ubelt.util_cache import (Cacher,)
+    from ubelt.util_cache import (CacheStats, Cacher, cache_stats, memoize_disk,)
     from ubelt.util_colors import (color_text, highlight_code,)
     from ubelt.util_const import (NoParam,)
     from ubelt.util_cmd import (cmd,)
@@ -89,7 +89,7 @@ else:  # pragma: nobranch
     from ubelt.util_list import (allsame, argmax, argmin, argsort, argunique,
                                  boolmask, chunks, compress, flatten, iter_window,
                                  iterable, take, unique, unique_flags,)
-    from ubelt.util_hash import (hash_data, hash_file,)
+    from ubelt.util_hash import (Hasher, hash_data, hash_file, hash_files,)
     from ubelt.util_import import (import_module_from_name,
                                    import_module_from_path, modname_to_modpath,
                                    modpath_to_modname, split_modpath,)
@@ -108,20 +108,22 @@ else:  # pragma: nobranch
     from ubelt.orderedset import (OrderedSet, oset,)
     from ubelt.progiter import (ProgIter,)
 
-    __all__ = ['AutoDict', 'AutoOrderedDict', 'Cacher', 'CaptureStdout', 'DARWIN',
-               'LINUX', 'NiceRepr', 'NoParam', 'OrderedSet', 'POSIX', 'ProgIter',
-               'TempDir', 'Timer', 'Timerit', 'WIN32', 'allsame', 'argflag',
+    __all__ = ['AutoDict', 'AutoOrderedDict', 'CacheStats', 'Cacher',
+               'CaptureStdout', 'DARWIN',
+               'Hasher', 'LINUX', 'NiceRepr', 'NoParam', 'OrderedSet', 'POSIX',
+               'ProgIter', 'TempDir', 'Timer', 'Timerit', 'WIN32', 'allsame',
+               'argflag',
                'argmax', 'argmin', 'argsort', 'argunique', 'argval', 'augpath',
-               'boolmask', 'chunks', 'cmd', 'codeblock', 'color_text', 'compress',
+               'boolmask', 'cache_stats', 'chunks', 'cmd', 'codeblock', 'color_text', 'compress',
                'compressuser', 'ddict', 'delete', 'dict_hist', 'dict_subset',
                'dict_take', 'dict_union', 'download', 'dzip', 'editfile',
                'ensure_app_cache_dir', 'ensure_app_resource_dir', 'ensure_unicode',
                'ensuredir', 'find_duplicates', 'flatten', 'get_app_cache_dir',
                'get_app_resource_dir', 'grabdata', 'group_items', 'hash_data',
-               'hash_file', 'highlight_code', 'hzcat', 'identity',
+               'hash_file', 'hash_files', 'highlight_code', 'hzcat', 'identity',
                'import_module_from_name', 'import_module_from_path', 'indent',
                'inject_method', 'invert_dict', 'iter_window', 'iterable',
-               'map_keys', 'map_vals', 'memoize', 'memoize_method',
+               'map_keys', 'map_vals', 'memoize', 'memoize_disk', 'memoize_method',
                'modname_to_modpath', 'modpath_to_modname', 'odict', 'orderedset',
                'oset', 'platform_cache_dir', 'platform_resource_dir', 'progiter',
                'readfrom', 'repr2', 'split_modpath', 'startfile', 'symlink',
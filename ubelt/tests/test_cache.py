@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-from os.path import exists
+from os.path import exists, basename, join
+import os
 import ubelt as ub
 import pytest
 
@@ -16,15 +17,16 @@ def test_noexist_meta_clear():
     cacher.ensure(func)
 
     data_fpath = cacher.get_fpath()
-    meta_fpath = data_fpath + '.meta'
+    key = basename(data_fpath)
+    index = cacher.backend.index
     assert exists(data_fpath)
-    assert exists(meta_fpath)
+    assert not exists(data_fpath + '.meta')
+    assert key in index.keys('name')
 
-    ub.delete(meta_fpath)
-    assert not exists(meta_fpath)
+    index.delete(key)
+    assert key not in index.keys('name')
     cacher.clear()
 
-    assert not exists(meta_fpath)
     assert not exists(data_fpath)
 
 
@@ -146,6 +148,718 @@ def test_disable():
     assert cacher.tryload(func) is None
 
 
+def test_cacher_hasher():
+    cfgstr = 'long-cfg' * 32
+    cacher1 = ub.Cacher('name', cfgstr, verbose=0)
+    cacher2 = ub.Cacher('name', cfgstr, verbose=0, hasher='fast')
+    assert cacher1.get_fpath() != cacher2.get_fpath()
+    cacher2.save('data')
+    assert cacher2.load() == 'data'
+    cacher2.clear()
+
+
+def test_sqlite_backend():
+    import os
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_sqlite_backend')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    for i in range(100):
+        cacher = ub.Cacher('entry', str(i), dpath=dpath, verbose=0,
+                           backend='sqlite')
+        cacher.save({'index': i})
+    # all entries are in one database
+    assert not any(f.endswith('.pkl') for f in os.listdir(dpath))
+    cacher = ub.Cacher('entry', '7', dpath=dpath, verbose=0, backend='sqlite')
+    assert cacher.exists()
+    assert cacher.load() == {'index': 7}
+    assert len(list(cacher.existing_versions())) == 100
+    assert cacher.backend.find('entry', '7') == ['entry_7.pkl']
+    other = ub.Cacher('other', '7', dpath=dpath, verbose=0, backend='sqlite')
+    assert not other.exists()
+    assert other.tryload() is None
+    with pytest.raises(IOError):
+        other.load()
+    # long cfgstrs are condensed in the key but stored in full
+    long_cfgstr = 'long-cfg' * 32
+    cacher = ub.Cacher('entry', long_cfgstr, dpath=dpath, verbose=0,
+                       backend='sqlite')
+    cacher.ensure(lambda: 'long')
+    assert cacher.backend.find('entry', long_cfgstr) == [
+        basename(cacher.get_fpath())]
+    cacher.clear()
+    assert not cacher.exists()
+    # the entries and their metadata share a single database
+    assert [f for f in os.listdir(dpath) if f.endswith('.sqlite')] == [
+        'cacher_index.sqlite']
+
+
+def test_index_is_lazy():
+    from ubelt.util_cache import FileBackend, _MetadataIndex
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_index_is_lazy')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    # reading from a directory does not create an index
+    cacher = ub.Cacher('lazy', 'a', dpath=dpath, verbose=0)
+    assert cacher.tryload() is None
+    assert list(cacher.existing_versions()) == []
+    assert FileBackend(dpath).keys('lazy', '.pkl') == []
+    assert os.listdir(dpath) == []
+    cacher.save('a')
+    assert exists(join(dpath, _MetadataIndex.FNAME))
+
+
+def test_index_on_network_path(monkeypatch):
+    from ubelt import util_cache
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_index_on_network_path')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    # write-ahead logging is not used on network filesystems
+    monkeypatch.setattr(util_cache, '_is_network_path', lambda dpath: True)
+    conn = util_cache._sqlite_connect(join(dpath, 'test.sqlite'))
+    mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    conn.close()
+    assert mode.lower() != 'wal'
+
+
+def _ensure_worker(args):
+    """ Computes an entry, recording each computation in a log file """
+    dpath, backend = args
+    import time
+    from os.path import join
+
+    def func():
+        with open(join(dpath, 'computed.log'), 'a') as file:
+            file.write('computed\n')
+        time.sleep(0.2)
+        return 'expensive result'
+    cacher = ub.Cacher('shared', 'params', dpath=dpath, verbose=0,
+                       backend=backend)
+    return cacher.ensure(func)
+
+
+@pytest.mark.parametrize('backend', ['file', 'sqlite'])
+def test_concurrent_ensure(backend):
+    from multiprocessing import Pool
+    from os.path import join
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_concurrent_ensure')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    pool = Pool(4)
+    try:
+        results = pool.map(_ensure_worker, [(dpath, backend)] * 4)
+    finally:
+        pool.close()
+        pool.join()
+    assert results == ['expensive result'] * 4
+    with open(join(dpath, 'computed.log'), 'r') as file:
+        assert file.read().count('computed') == 1
+
+
+def test_lock_files_are_striped():
+    import os
+    from ubelt.util_cache import _NUM_LOCK_STRIPES
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_lock_stripes')
+    ub.delete(dpath)
+    for backend in ['file', 'sqlite']:
+        for idx in range(200):
+            cacher = ub.Cacher('stripes', str(idx), dpath=dpath, verbose=0,
+                               backend=backend)
+            cacher.ensure(lambda: idx)
+    # both backends share the same lock files
+    lock_fnames = os.listdir(join(dpath, '.locks'))
+    assert len(lock_fnames) <= _NUM_LOCK_STRIPES
+
+    # nested ensures do not deadlock when their keys share a stripe
+    def inner():
+        return ub.Cacher('stripes', 'inner', dpath=dpath,
+                         verbose=0).ensure(lambda: 'inner')
+    outer = ub.Cacher('stripes', 'outer', dpath=dpath, verbose=0)
+    assert outer.ensure(inner) == 'inner'
+    ub.delete(dpath)
+
+
+def test_atomic_save():
+    import os
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_atomic_save')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    cacher = ub.Cacher('name', 'params', dpath=dpath, verbose=0)
+    cacher.save('data1')
+
+    class Unpicklable(object):
+        def __reduce__(self):
+            raise ValueError('cannot pickle')
+
+    with pytest.raises(ValueError):
+        cacher.save(['data2', Unpicklable()])
+    # The failed save leaves the previous entry intact and no temp files
+    assert cacher.load() == 'data1'
+    assert not [f for f in os.listdir(dpath) if f.endswith('.tmp')]
+
+
+def test_serializers():
+    import numpy as np
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_serializers')
+    arr = np.arange(1000, dtype=np.float32).reshape(10, 100)
+    cases = [
+        ('.npy', arr),
+        ('.npy.gz', arr),
+        ('.npz', {'a': arr, 'b': arr[0]}),
+        ('.json', {'a': [1, 2.5, 'c'], 'b': None}),
+        ('.json.xz', {'a': [1, 2.5, 'c']}),
+        ('.pkl.gz', {'a': arr, 'b': 'text'}),
+        ('.pkl.xz', ['data']),
+        ('.pkl5', {'a': arr, 'b': 'text', 'c': [arr[1:3]]}),
+        ('.pkl5.gz', {'a': arr}),
+    ]
+    for backend in ['file', 'sqlite']:
+        for ext, data in cases:
+            cacher = ub.Cacher('serial', 'params', dpath=dpath, ext=ext,
+                               verbose=0, backend=backend)
+            cacher.save(data)
+            recon = cacher.load()
+            assert ub.hash_data(recon) == ub.hash_data(data), ext
+            cacher.clear()
+
+
+def test_legacy_pickled_entries():
+    import pickle
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_legacy_pickled')
+    for ext in ['.npy', '.json', '.json.gz']:
+        cacher = ub.Cacher('legacy', 'params', dpath=dpath, ext=ext,
+                           verbose=0)
+        # older versions pickled every entry regardless of the extension
+        with open(cacher.get_fpath(), 'wb') as file:
+            pickle.dump({'a': [1, 2]}, file, protocol=2)
+        assert cacher.load() == {'a': [1, 2]}, ext
+        # entries that cannot be decoded at all are a cache miss
+        with open(cacher.get_fpath(), 'wb') as file:
+            file.write(b'garbage')
+        assert cacher.tryload() is None
+        assert cacher.ensure(lambda: [3]) == [3]
+        assert cacher.load() == [3]
+        cacher.clear()
+
+
+def test_mmap_loads():
+    import numpy as np
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_serializers')
+    arr = np.arange(10000, dtype=np.float64)
+
+    cacher = ub.Cacher('mmap', 'params', dpath=dpath, ext='.npy', verbose=0)
+    cacher.save(arr)
+    recon = cacher.load()
+    assert isinstance(recon, np.memmap)
+    assert not recon.flags.writeable
+    assert np.all(recon == arr)
+    cacher.clear()
+
+    cacher = ub.Cacher('mmap', 'params', dpath=dpath, ext='.pkl5', verbose=0)
+    cacher.save({'arr': arr, 'other': [1, 2]})
+    recon = cacher.load()
+    # the array is a view into the memory mapped file
+    assert not recon['arr'].flags.owndata
+    assert not recon['arr'].flags.writeable
+    assert recon['arr'].ctypes.data % 64 == 0
+    assert np.all(recon['arr'] == arr)
+    assert recon['other'] == [1, 2]
+    cacher.clear()
+
+    # corrupted entries are a cache miss
+    cacher.save({'arr': arr})
+    with open(cacher.get_fpath(), 'wb') as file:
+        file.write(b'')
+    assert cacher.tryload() is None
+
+
+def test_cache_manager_lru():
+    from ubelt.util_cache import CacheManager
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_cache_manager_lru')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    manager = CacheManager(dpath, maxentries=3)
+
+    def cacher(cfgstr):
+        return ub.Cacher('lru', cfgstr, manager=manager, verbose=0)
+
+    for cfgstr in ['a', 'b', 'c']:
+        cacher(cfgstr).save(cfgstr)
+    # loading 'a' makes 'b' the least recently used entry
+    assert cacher('a').load() == 'a'
+    cacher('d').save('d')
+    assert cacher('a').exists()
+    assert not cacher('b').exists()
+    assert manager.info()['entries'] == 3
+    cacher('a').clear()
+    assert manager.info()['entries'] == 2
+
+    # the byte limit keeps the newest entry even if it is too big
+    manager.maxentries = None
+    manager.maxbytes = 1000
+    cacher('big').save('x' * 2000)
+    assert cacher('big').exists()
+    assert manager.info()['entries'] == 1
+    assert manager.info()['bytes'] == cacher('big').backend.size(
+        basename(cacher('big').get_fpath()))
+    manager.clear()
+    assert manager.info() == {'entries': 0, 'bytes': 0}
+    assert not cacher('big').exists()
+    # the manager reads the index written by the backend
+    assert [f for f in os.listdir(dpath) if f.endswith('.sqlite')] == [
+        'cacher_index.sqlite']
+
+
+def test_cache_manager_ttl():
+    import time
+    from ubelt.util_cache import CacheManager
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_cache_manager_ttl')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    manager = CacheManager(dpath, ttl={'short': 0.1}, backend='sqlite')
+    short = ub.Cacher('short', 'params', manager=manager, verbose=0)
+    long_ = ub.Cacher('long', 'params', manager=manager, verbose=0)
+    short.save('data')
+    long_.save('data')
+    assert short.tryload() == 'data'
+    time.sleep(0.2)
+    # expired entries are a cache miss
+    assert short.tryload() is None
+    assert not short.exists()
+    assert long_.tryload() == 'data'
+    short.save('data')
+    time.sleep(0.2)
+    assert manager.evict() == 1
+    assert not short.exists()
+    assert long_.exists()
+
+
+def test_cache_manager_sweep_interval():
+    import time
+    from ubelt.util_cache import CacheManager
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_cache_manager_sweep')
+    ub.delete(dpath)
+    ub.ensuredir(dpath)
+    manager = CacheManager(dpath, ttl=0.05, sweep_interval=3600)
+    first = ub.Cacher('sweep', 'first', manager=manager, verbose=0)
+    second = ub.Cacher('sweep', 'second', manager=manager, verbose=0)
+    first.save('data')
+    time.sleep(0.1)
+    # saves within the interval do not sweep, but expired entries are
+    # still a cache miss
+    second.save('data')
+    assert first.exists()
+    assert manager.info()['entries'] == 2
+    time.sleep(0.1)
+    # explicit calls always sweep
+    assert manager.evict() == 2
+    assert not first.exists()
+    assert not second.exists()
+
+    # expired entries are found through an index
+    plan = manager.index._connect().execute(
+        'EXPLAIN QUERY PLAN SELECT key FROM records WHERE timestamp < ?',
+        (0,)).fetchall()
+    assert 'records_timestamp' in str(plan)
+
+
+def test_memory_layer():
+    from ubelt.util_cache import MemoryCache
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_memory_layer')
+    memory = MemoryCache(maxbytes=2 ** 20)
+    cacher = ub.Cacher('mem', 'params', dpath=dpath, verbose=0,
+                       memory=memory)
+    cacher.clear()
+    assert cacher.tryload() is None
+    info = memory.info()
+    assert info['misses'] == 1 and info['disk_misses'] == 1
+
+    data = ['data']
+    cacher.save(data)
+    # saved data is served from memory without touching the disk
+    ub.delete(cacher.get_fpath())
+    assert cacher.load() is data
+    assert memory.info()['hits'] == 1
+
+    # clear removes the entry from memory as well
+    cacher.save(data)
+    cacher.clear()
+    assert cacher.tryload() is None
+
+    # other cachers of the same entry share the layer
+    ub.Cacher('mem', 'params', dpath=dpath, verbose=0).save('other')
+    other = ub.Cacher('mem', 'params', dpath=dpath, verbose=0, memory=memory)
+    assert other.load() == 'other'
+    assert other.load() == 'other'
+    info = memory.info()
+    assert info['disk_hits'] == 1
+    assert info['hits'] == 2
+    assert info['entries'] == 1
+    other.clear()
+
+    # entries larger than the budget are not kept in memory
+    small = MemoryCache(maxbytes=10)
+    cacher = ub.Cacher('mem', 'big', dpath=dpath, verbose=0, memory=small)
+    cacher.save('x' * 100)
+    assert small.info()['entries'] == 0
+    assert cacher.load() == 'x' * 100
+    cacher.clear()
+
+    with pytest.raises(TypeError):
+        ub.Cacher('mem', 'params', dpath=dpath, memory=100)
+
+
+def test_memory_layer_with_manager():
+    import time
+    from ubelt.util_cache import CacheManager, MemoryCache
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_memory_manager')
+    memory = MemoryCache()
+
+    # evicted entries are removed from the memory layer
+    manager = CacheManager(dpath, maxentries=1)
+    manager.clear()
+    cacher1 = ub.Cacher('mm', 'a', manager=manager, memory=memory, verbose=0)
+    cacher2 = ub.Cacher('mm', 'b', manager=manager, memory=memory, verbose=0)
+    cacher1.save('a')
+    cacher2.save('b')
+    assert not cacher1.exists()
+    assert cacher1.tryload() is None
+    assert cacher2.tryload() == 'b'
+
+    # expired entries are not served from memory
+    manager = CacheManager(dpath, ttl=0.05)
+    manager.clear()
+    cacher = ub.Cacher('mm', 'ttl', manager=manager, memory=memory,
+                       verbose=0)
+    cacher.save('data')
+    assert cacher.tryload() == 'data'
+    time.sleep(0.06)
+    assert cacher.tryload() is None
+    assert not cacher.exists()
+
+    # memory hits refresh the access time of the manager
+    manager = CacheManager(dpath, maxentries=2)
+    manager.clear()
+    hot = ub.Cacher('mm', 'hot', manager=manager, memory=memory, verbose=0)
+    hot.save('hot')
+    ub.Cacher('mm', 'x', manager=manager, verbose=0).save('x')
+    assert hot.load() == 'hot'
+    ub.Cacher('mm', 'y', manager=manager, verbose=0).save('y')
+    assert hot.exists()
+    assert not ub.Cacher('mm', 'x', manager=manager, verbose=0).exists()
+    manager.clear()
+
+
+def test_memoize_disk():
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_memoize_disk')
+    calls = []
+
+    def func(a, b=1, *args, **kwargs):
+        calls.append(a)
+        return (a, b, args, kwargs)
+
+    cached = ub.memoize_disk(func, fname='func', dpath=dpath,
+                             exclude=['verbose'])
+    for a in [1, 'x', [1, 2], {'k': 3}]:
+        cached.cacher.clear(cached.cfgstr(a))
+        cached.cacher.clear(cached.cfgstr(a, 2, 3, c=4))
+
+    # positional, keyword, and default arguments give the same entry
+    assert cached(1) == (1, 1, (), {})
+    assert cached(1, 1) == (1, 1, (), {})
+    assert cached(a=1, b=1, verbose=True) == (1, 1, (), {})
+    assert calls == [1]
+    # scalar arguments give a readable cfgstr
+    scalar = ub.memoize_disk(fname='scalar', dpath=dpath)(
+        lambda a, b=1, **kw: None)
+    assert scalar.cfgstr(1) == 'a=1,b=1'
+    assert scalar.cfgstr('x', c=None) == "a='x',b=1,c=None"
+    assert scalar.cfgstr('1') != scalar.cfgstr(1)
+    assert cached.cfgstr(1, 2, 3, c=4) != cached.cfgstr(1, 2, 3, c=5)
+
+    # other arguments are hashed
+    assert cached([1, 2]) == ([1, 2], 1, (), {})
+    assert cached({'k': 3}) == ({'k': 3}, 1, (), {})
+    assert cached([1, 2]) == ([1, 2], 1, (), {})
+    assert cached(1, 2, 3, c=4) == (1, 2, (3,), {'c': 4})
+    assert cached(1, 2, 3, c=4) == (1, 2, (3,), {'c': 4})
+    assert calls == [1, [1, 2], {'k': 3}, 1]
+    assert cached.cfgstr([1, 2]) != cached.cfgstr([1, 3])
+
+    # include selects the arguments used in the cfgstr
+    only_a = ub.memoize_disk(func, fname='func', dpath=dpath, include=['a'])
+    assert only_a.cfgstr(1, 2) == only_a.cfgstr(1, 3) == 'a=1'
+
+    # the depends token versions the entries
+    v1 = ub.memoize_disk(func, fname='func', dpath=dpath, depends='v1')
+    v2 = ub.memoize_disk(func, fname='func', dpath=dpath, depends=('v', 2))
+    assert v1.cfgstr(1) != v2.cfgstr(1)
+    assert v1.cfgstr(1) != cached.cfgstr(1)
+
+    with pytest.raises(ValueError):
+        ub.memoize_disk(func, fname='func', include=['a'],
+                        exclude=['b'])
+    with pytest.raises(TypeError):
+        cached(1, 2, 3, b=4)
+    # nested functions need an explicit fname
+    with pytest.raises(ValueError):
+        ub.memoize_disk(func, dpath=dpath)
+
+
+class _Compute1(object):
+    def compute(self, x):
+        return 'A{}'.format(x)
+
+
+class _Compute2(object):
+    def compute(self, x):
+        return 'B{}'.format(x)
+
+
+def _returns_none(calls, x):
+    calls.append(x)
+
+
+def test_memoize_disk_names():
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_memoize_disk_names')
+    # methods with the same name in one module do not share entries
+    compute1 = ub.memoize_disk(dpath=dpath, exclude=['self'])(
+        _Compute1.compute)
+    compute2 = ub.memoize_disk(dpath=dpath, exclude=['self'])(
+        _Compute2.compute)
+    assert compute1.cacher.fname != compute2.cacher.fname
+    compute1.cacher.clear(compute1.cfgstr(None, 1))
+    compute2.cacher.clear(compute2.cfgstr(None, 1))
+    assert compute1(_Compute1(), 1) == 'A1'
+    assert compute2(_Compute2(), 1) == 'B1'
+
+
+def test_memoize_disk_none():
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_memoize_disk_none')
+    calls = []
+    cached = ub.memoize_disk(_returns_none, dpath=dpath, exclude=['calls'])
+    cached.cacher.clear(cached.cfgstr(calls, 1))
+    assert cached(calls, 1) is None
+    assert cached(calls, 1) is None
+    assert calls == [1]
+    cached.cacher.clear(cached.cfgstr(calls, 1))
+
+    # json cannot store the sentinel, so None results are recomputed
+    cached = ub.memoize_disk(_returns_none, dpath=dpath, exclude=['calls'],
+                             ext='.json')
+    cached.cacher.clear(cached.cfgstr(calls, 1))
+    assert cached(calls, 1) is None
+    assert cached(calls, 1) is None
+    assert calls == [1, 1, 1]
+
+
+def test_metadata_records():
+    import time
+    from ubelt.util_cache import FileBackend
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_metadata_records')
+    for fname in os.listdir(dpath):
+        ub.delete(join(dpath, fname))
+
+    for backend in ['file', 'sqlite']:
+        cacher = ub.Cacher('rec', dpath=dpath, backend=backend, verbose=0,
+                           meta={'note': 'x'}, hasher='sha1')
+        cacher.ensure(lambda: time.sleep(0.01) or 'a' * 10)
+        cacher.cfgstr = 'two'
+        cacher.save('b')
+        # other extensions are not listed
+        ub.Cacher('rec', 'three', dpath=dpath, backend=backend,
+                  ext='.json', verbose=0).save([1])
+
+        records = cacher.records()
+        assert [r['cfgstr'] for r in records] == ['', 'two']
+        first, second = records
+        assert first['duration'] >= 0.01
+        assert second['duration'] is None
+        assert first['meta'] == {'note': 'x'}
+        assert first['hasher'] == 'sha1'
+        assert first['version'] == ub.__version__
+        assert first['hash_version'] == ub.util_hash.HASH_VERSION
+        assert first['size'] == cacher.backend.size(first['key'])
+        assert first['timestamp'] <= second['timestamp']
+
+        stats = cacher.stats()
+        assert stats['entries'] == 2
+        assert stats['bytes'] == first['size'] + second['size']
+        assert stats['duration'] == first['duration']
+
+        cacher.clear()
+        assert [r['cfgstr'] for r in cacher.records()] == ['']
+    # the file backend does not write a metadata file per entry
+    assert not [f for f in os.listdir(dpath) if f.endswith('.meta')]
+
+    # entries described by .meta files are imported into a new index
+    legacy_dpath = join(dpath, 'legacy')
+    ub.ensuredir(legacy_dpath)
+    ub.writeto(join(legacy_dpath, 'old_cfg.pkl'), 'data')
+    ub.writeto(join(legacy_dpath, 'old_cfg.pkl.meta'),
+               '\n\nsaving T1\nold\ncfg\ncfg\nNone\n'
+               '\n\nsaving T2\nold\ncfg\ncfg\n{}\n')
+    backend = FileBackend(legacy_dpath)
+    assert backend.keys('old', '.pkl') == ['old_cfg.pkl']
+    record = backend.records('old')[0]
+    assert record['cfgstr'] == 'cfg' and record['size'] == 4
+    assert backend.delete('old_cfg.pkl')
+
+    # files deleted by other programs are not listed
+    cacher = ub.Cacher('untracked', 'a', dpath=legacy_dpath, verbose=0)
+    cacher.save('a')
+    os.remove(cacher.get_fpath())
+    assert list(cacher.existing_versions()) == []
+    assert cacher.records() == []
+    # files written without the index are listed once the directory changes
+    ub.writeto(join(legacy_dpath, 'untracked_b.pkl'), 'b')
+    assert list(cacher.existing_versions()) == [
+        join(legacy_dpath, 'untracked_b.pkl')]
+    assert cacher.records()[0]['cfgstr'] == 'b'
+    assert cacher.reconcile() == {'added': 0, 'removed': 0}
+    assert not [f for f in os.listdir(legacy_dpath) if f.startswith('old')]
+
+
+def test_write_behind():
+    import threading
+    from ubelt.util_cache import _PickleSerializer
+
+    class _BlockingSerializer(_PickleSerializer):
+        """ waits until it is released before writing """
+        def __init__(self):
+            super(_BlockingSerializer, self).__init__()
+            self.release = threading.Event()
+            self.started = threading.Event()
+
+        def dump(self, data, file):
+            self.started.set()
+            self.release.wait()
+            super(_BlockingSerializer, self).dump(data, file)
+
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_write_behind')
+    cacher = ub.Cacher('wb', 'cfg', dpath=dpath, verbose=0, write_behind=True)
+    cacher.clear()
+    cacher.serializer = serializer = _BlockingSerializer()
+
+    data = cacher.ensure(lambda: ['result'])
+    assert data == ['result']
+    # the write is in flight, but the entry is visible in this process
+    serializer.started.wait()
+    assert not exists(cacher.get_fpath())
+    assert cacher.exists()
+    assert cacher.tryload() is data
+    assert cacher.ensure(lambda: ['recomputed']) is data
+    # other cachers of the same entry see it as well
+    other = ub.Cacher('wb', 'cfg', dpath=dpath, verbose=0)
+    assert other.tryload() is data
+
+    serializer.release.set()
+    cacher.flush()
+    assert exists(cacher.get_fpath())
+    assert other.load() == ['result']
+    cacher.clear()
+    assert not cacher.exists()
+
+    # clearing an entry that is queued drops its write
+    serializer.release.clear()
+    serializer.started.clear()
+    cacher.save('first', cfgstr='a')
+    serializer.started.wait()
+    cacher.save('second', cfgstr='b')
+    assert cacher.tryload('b') == 'second'
+    cacher.clear('b')
+    assert cacher.tryload('b') is None
+    serializer.release.set()
+    cacher.flush()
+    assert cacher.load('a') == 'first'
+    assert not cacher.exists('b')
+    cacher.clear('a')
+
+    # failed writes are reported as warnings
+    cacher = ub.Cacher('wb', 'bad', dpath=dpath, verbose=0, write_behind=True)
+    with pytest.warns(RuntimeWarning):
+        cacher.save(lambda: None)
+        cacher.flush()
+    assert not cacher.exists()
+
+
+def test_write_behind_flush_at_exit():
+    import sys
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_write_behind_exit')
+    cacher = ub.Cacher('wb', 'exit', dpath=dpath, verbose=0)
+    cacher.clear()
+    code = ub.codeblock(
+        """
+        import ubelt as ub
+        cacher = ub.Cacher('wb', 'exit', dpath={!r}, verbose=0,
+                           write_behind=True)
+        cacher.save(list(range(100000)))
+        """).format(dpath)
+    info = ub.cmd([sys.executable, '-c', code])
+    assert info['ret'] == 0, info['err']
+    assert cacher.load() == list(range(100000))
+    cacher.clear()
+
+
+def test_cache_stats():
+    import json
+    import time
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_cache_stats')
+    ub.cache_stats(enable=True, reset=True)
+    try:
+        cacher = ub.Cacher('stats', 'cfg', dpath=dpath, verbose=0)
+        cacher.clear()
+        cacher.ensure(lambda: 'data')
+        cacher.ensure(lambda: 'data')
+        cacher.ensure(lambda: 'data')
+
+        @ub.memoize
+        def func(x):
+            return x
+
+        class Foo(object):
+            @ub.memoize_method
+            def method(self, x):
+                time.sleep(0.01)
+                return x
+
+        func(1), func(1), func(2)
+        foo = Foo()
+        foo.method(1), foo.method(1)
+
+        fpath = join(dpath, 'stats.json')
+        report = ub.cache_stats(reset=True, fpath=fpath)
+    finally:
+        ub.cache_stats(enable=False, reset=True)
+
+    stats = report['stats']
+    assert stats['hits'] == 2 and stats['misses'] == 1
+    assert stats['saves'] == 1
+    assert stats['saved_bytes'] == cacher.backend.size(
+        basename(cacher.get_fpath()))
+    assert stats['load']['count'] == 2
+    assert sum(stats['load']['hist'].values()) == 2
+    assert stats['compute']['count'] == 1
+    assert stats['save']['count'] == 1
+
+    from ubelt.util_memoize import _func_name
+    name = _func_name(func)
+    assert report[name]['hits'] == 1 and report[name]['misses'] == 2
+    assert report[name]['load'] is None
+    assert report[name]['compute']['count'] == 2
+    name = _func_name(Foo.method._func)
+    assert report[name]['hits'] == 1 and report[name]['misses'] == 1
+    assert report[name]['compute']['max'] >= 0.01
+
+    with open(fpath, 'r') as file_:
+        assert json.load(file_) == json.loads(json.dumps(report))
+
+    # nothing is recorded while collection is disabled
+    func(3)
+    cacher.tryload()
+    assert ub.cache_stats() == {}
+    cacher.clear()
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
@@ -4,10 +4,14 @@ import ubelt as ub
 import numpy as np
 import itertools as it
 import uuid
+import binascii
+import hashlib
+import pytest
 from os.path import join
 from ubelt.util_hash import _convert_hexstr_base, _ALPHABET_16
 from ubelt.util_hash import _hashable_sequence
 from ubelt.util_hash import _rectify_hasher
+from ubelt.util_hash import DEFAULT_CHUNKSIZE
 hash_sequence = _hashable_sequence
 
 
@@ -75,6 +79,201 @@ def _benchmark():
     """
 
 
+def _benchmark_hashers():
+    """
+    Reports the throughput (in MB/s) of each available hash algorithm.
+
+    CommandLine:
+        python -c "import ubelt.tests.test_hash as t; t._benchmark_hashers()"
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> _benchmark_hashers()
+    """
+    from ubelt.util_hash import _HASHERS
+    algos = ['md5', 'sha1', 'sha256', 'sha512'] + list(_HASHERS.keys())
+    algos = list(ub.unique(algos))
+    result = ub.AutoOrderedDict()
+    for n in [2 ** 10, 2 ** 16, 2 ** 20, 2 ** 24]:
+        data = b'8' * n
+        for key in algos:
+            hashtype = _rectify_hasher(key)
+            t1 = ub.Timerit(10, bestof=3, label=key, verbose=0)
+            for timer in t1:
+                with timer:
+                    hasher = hashtype()
+                    hasher.update(data)
+                    hasher.hexdigest()
+            result[key][n] = (n / 2 ** 20) / t1.min()
+    print('Throughput in MB/s (rows are bytes hashed per call)')
+    for key, row in result.items():
+        print('{:>10}: {}'.format(key, ', '.join(
+            '{:.1f}'.format(v) for v in row.values())))
+    return result
+
+
+def _benchmark_digest_encoding():
+    """
+    Compares the digit-by-digit hex conversion with direct digest encoding
+
+    CommandLine:
+        python -c "from ubelt.tests import test_hash; test_hash._benchmark_digest_encoding()"
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> _benchmark_digest_encoding()
+    """
+    from ubelt.util_hash import _encode_digest, _ALPHABET_26
+    hasher = hashlib.sha512(b'data')
+    digest = hasher.digest()
+    hexstr = hasher.hexdigest()
+    for hashlen in [None, 8, 32]:
+        for timer in ub.Timerit(1000, bestof=3, label='old hashlen={}'.format(hashlen)):
+            with timer:
+                _convert_hexstr_base(hexstr, _ALPHABET_26)[:hashlen]
+        for timer in ub.Timerit(1000, bestof=3, label='new hashlen={}'.format(hashlen)):
+            with timer:
+                _encode_digest(digest, hashlen, _ALPHABET_26)
+
+
+def _benchmark_type_dispatch():
+    """
+    Measures hashing of structures with many registered extension types
+
+    CommandLine:
+        python -c "from ubelt.tests import test_hash; test_hash._benchmark_type_dispatch()"
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> _benchmark_type_dispatch()
+    """
+    from collections import OrderedDict
+    items = [[uuid.UUID(int=i), np.int32(i), np.float32(i), OrderedDict(a=i),
+              {'b': i}] for i in range(20000)]
+    for timer in ub.Timerit(5, bestof=3, label='mixed types'):
+        with timer:
+            ub.hash_data(items)
+
+
+def _benchmark_hash_data_workers():
+    """
+    Compares flat hashing of a large list of records with tree hashing in a
+    process pool
+
+    CommandLine:
+        python -c "from ubelt.tests import test_hash; test_hash._benchmark_hash_data_workers()"
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> _benchmark_hash_data_workers()
+    """
+    records = [{'id': i, 'box': [i, i + 1, 10.5, 20], 'name': 'cat'}
+               for i in range(100000)]
+    for workers in [0, 2, 4, 8]:
+        label = 'workers={}'.format(workers)
+        for timer in ub.Timerit(3, bestof=1, label=label):
+            with timer:
+                ub.hash_data(records, chunksize=4096, workers=workers)
+
+
+def _benchmark_hash_file():
+    """
+    Compares reading files with buffered reads and with memory maps
+
+    CommandLine:
+        python -c "from ubelt.tests import test_hash; test_hash._benchmark_hash_file()"
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> _benchmark_hash_file()
+    """
+    import os
+    dpath = ub.ensure_app_cache_dir('ubelt', 'bench')
+    fpath = join(dpath, 'bench_hash_file.bin')
+    result = ub.AutoOrderedDict()
+    for n in [2 ** 10, 2 ** 16, 2 ** 20, 2 ** 24, 2 ** 28]:
+        with open(fpath, 'wb') as file:
+            file.write(os.urandom(n))
+        for use_mmap in [False, True]:
+            label = 'mmap' if use_mmap else 'read'
+            t1 = ub.Timerit(10, bestof=3, label=label, verbose=0)
+            for timer in t1:
+                with timer:
+                    ub.hash_file(fpath, hasher='sha1', use_mmap=use_mmap)
+            result[label][n] = (n / 2 ** 20) / t1.min()
+    ub.delete(fpath)
+    print('Throughput in MB/s (rows are file sizes in bytes)')
+    for key, row in result.items():
+        print('{:>6}: {}'.format(key, ', '.join(
+            '{}={:.1f}'.format(n, v) for n, v in row.items())))
+    return result
+
+
+def _benchmark_numeric_fastpath():
+    """
+    Compares hashing long lists of numbers with and without bulk encoding
+
+    CommandLine:
+        python -c "from ubelt.tests import test_hash; test_hash._benchmark_numeric_fastpath()"
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> _benchmark_numeric_fastpath()
+    """
+    from ubelt import util_hash
+    rng = np.random.RandomState(0)
+    datas = {
+        'int': rng.randint(-2 ** 31, 2 ** 31, size=10 ** 6).tolist(),
+        'float': rng.rand(10 ** 6).tolist(),
+    }
+    minlen = util_hash._NUMERIC_FASTPATH_MINLEN
+    for key, data in datas.items():
+        for label, fastpath_minlen in [('fast', minlen), ('slow', float('inf'))]:
+            util_hash._NUMERIC_FASTPATH_MINLEN = fastpath_minlen
+            try:
+                t1 = ub.Timerit(3, bestof=1, label=label, verbose=0)
+                for timer in t1:
+                    with timer:
+                        ub.hash_data(data)
+            finally:
+                util_hash._NUMERIC_FASTPATH_MINLEN = minlen
+            print('{} {}: {:.3f}s per 1M items'.format(key, label, t1.min()))
+
+
+def _benchmark_iterative_update_hasher():
+    """
+    Compares the iterative and recursive implementations of _update_hasher
+
+    CommandLine:
+        python -c "from ubelt.tests import test_hash; test_hash._benchmark_iterative_update_hasher()"
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> _benchmark_iterative_update_hasher()
+    """
+    import hashlib
+    from ubelt.util_hash import _update_hasher
+    deep = 1
+    for _ in range(900):
+        deep = [deep, 'a']
+    datas = {
+        'wide': [[i, str(i), (i, float(i))] for i in range(20000)],
+        'deep': deep,
+        'mixed': [_make_nested_data(np.random.RandomState(i), depth=8)
+                  for i in range(2000)],
+    }
+    impls = {
+        'recursive': _recursive_update_hasher,
+        'iterative': _update_hasher,
+    }
+    for key, data in datas.items():
+        for label, func in impls.items():
+            t1 = ub.Timerit(10, bestof=3, label=label, verbose=0)
+            for timer in t1:
+                with timer:
+                    func(hashlib.sha1(), data)
+            print('{:>6} {:>10}: {:.4f}s'.format(key, label, t1.min()))
+
 def test_hash_data():
     counter = [0]
     failed = []
@@ -188,6 +387,39 @@ def test_uuid():
         'the fact that it is a UUID should reflect in the hash')
 
 
+def test_dict_and_set():
+    data1 = {'a': 1, 2: [3, 4.0], (5, 6): {'b': b'c'}, None: {1, 'x'}}
+    data2 = dict(reversed(list(data1.items())))
+    assert ub.hash_data(data1) == ub.hash_data(data2)
+    assert ub.hash_data(data1) != ub.hash_data({'a': 1})
+    # values contribute to the hash
+    assert ub.hash_data({'a': 1}) != ub.hash_data({'a': 2})
+    assert ub.hash_data({'a': 1, 'b': 2}) != ub.hash_data({'a': 2, 'b': 1})
+    # keys and values are not interchangable
+    assert ub.hash_data({'a': 'b'}) != ub.hash_data({'b': 'a'})
+    # the type is part of the hash
+    assert ub.hash_data({}) != ub.hash_data(set())
+    assert ub.hash_data({1: 2}) != ub.hash_data(ub.odict([(1, 2)]))
+    assert ub.hash_data([1, 2]) != ub.hash_data({1, 2})
+    # sets with equal items have equal hashes
+    items = list(range(100)) + ['a', 'b', b'c']
+    assert ub.hash_data(set(items)) == ub.hash_data(set(items[::-1]))
+    assert ub.hash_data(set(items)) == ub.hash_data(frozenset(items))
+    assert ub.hash_data({1, 2}) != ub.hash_data({1, 3})
+
+
+def test_dict_memoize():
+    calls = []
+
+    @ub.memoize
+    def func(config):
+        calls.append(config)
+        return len(config)
+    func({'a': 1, 'b': {2, 3}})
+    func({'b': {3, 2}, 'a': 1})
+    assert len(calls) == 1
+
+
 def test_hash_data_custom_base():
     data = 1
     # A larger base means the string can be shorter
@@ -220,6 +452,360 @@ def test_hash_file():
     assert hashid1_a != hashid2_a
 
 
+def test_hash_file_tree():
+    dpath = ub.ensure_app_cache_dir('ubelt')
+    fpath = join(dpath, 'tmp_tree.txt')
+    ub.writeto(fpath, 'foobar' * 1000)
+    hashes = {ub.hash_file(fpath, chunksize=100, workers=workers)
+              for workers in [0, 1, 3, 8]}
+    assert len(hashes) == 1, 'workers should not change the hash'
+    assert hashes != {ub.hash_file(fpath, chunksize=101)}
+    with pytest.raises(ValueError):
+        ub.hash_file(fpath, chunksize=100, stride=2)
+
+    # Empty files and files smaller than a chunk are supported
+    empty_fpath = join(dpath, 'tmp_empty.txt')
+    ub.writeto(empty_fpath, '')
+    assert (ub.hash_file(empty_fpath, chunksize=DEFAULT_CHUNKSIZE,
+                         workers=2) ==
+            ub.hash_file(empty_fpath, chunksize=DEFAULT_CHUNKSIZE))
+
+    # workers are only used in tree mode and never change the flat hash
+    assert ub.hash_file(fpath, workers=2) == ub.hash_file(fpath)
+    assert ub.hash_file(fpath, workers=2) not in hashes
+
+
+def test_hash_file_mmap():
+    dpath = ub.ensure_app_cache_dir('ubelt')
+    fpath = join(dpath, 'tmp_mmap.txt')
+    for text in ['', 'foobar', 'foobar' * 10000]:
+        ub.writeto(fpath, text)
+        for kw in [{}, {'stride': 3, 'blocksize': 7}, {'chunksize': 999}]:
+            assert (ub.hash_file(fpath, use_mmap=True, **kw) ==
+                    ub.hash_file(fpath, use_mmap=False, **kw))
+    # the default blocksize does not change the hash when stride == 1
+    assert ub.hash_file(fpath) == ub.hash_file(fpath, blocksize=3)
+
+
+def test_hash_files():
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_hash_files_tree')
+    ub.delete(dpath)
+    ub.ensuredir(join(dpath, 'subdir'))
+    fpaths = [join(dpath, 'file{}.txt'.format(i)) for i in range(10)]
+    fpaths += [join(dpath, 'subdir', 'file{}.txt'.format(i)) for i in range(10)]
+    for i, fpath in enumerate(fpaths):
+        ub.writeto(fpath, 'data{}'.format(i) * i)
+    want = {fpath: ub.hash_file(fpath, hasher='sha1') for fpath in fpaths}
+
+    for mode in ['thread', 'process']:
+        got = dict(ub.hash_files(fpaths, workers=3, mode=mode, hasher='sha1'))
+        assert got == want
+    assert dict(ub.hash_files(dpath, hasher='sha1')) == want
+
+    # bad arguments raise when hash_files is called, not when iterated
+    with pytest.raises(KeyError):
+        ub.hash_files(fpaths, workers=2, mode='foo')
+    with pytest.raises(TypeError):
+        ub.hash_files(fpaths, hasher=hashlib.sha1())
+    with pytest.raises(KeyError):
+        ub.hash_files(fpaths, hasher='foo')
+    with pytest.raises(ValueError):
+        ub.hash_files(fpaths, workers=-1)
+    with pytest.raises(ValueError):
+        ub.hash_files(fpaths, fingerprint=True, stride=2)
+
+
+def test_hash_file_cache(monkeypatch):
+    from ubelt import util_hash
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_hash_file_cache')
+    cache = util_hash._HashFileCache(join(dpath, 'index.sqlite'))
+    cache.clear()
+    monkeypatch.setattr(util_hash, '_HASH_FILE_CACHE', cache)
+
+    fpath = join(dpath, 'file.txt')
+    ub.writeto(fpath, 'foobar')
+    hash1 = ub.hash_file(fpath, cache=True)
+    assert hash1 == ub.hash_file(fpath)
+    hex1 = ub.hash_file(fpath, base='hex', hashlen=8)
+
+    # A cache hit does not read the file
+    def _fail(*args, **kw):
+        raise AssertionError('should not read the file')
+    with monkeypatch.context() as m:
+        m.setattr(util_hash, '_hash_file_range', _fail)
+        assert ub.hash_file(fpath, cache=True) == hash1
+        # different bases and lengths share an entry
+        assert ub.hash_file(fpath, cache=True, base='hex', hashlen=8) == hex1
+        # but different hashers do not
+        with pytest.raises(AssertionError):
+            ub.hash_file(fpath, cache=True, hasher='sha1')
+
+    # Changing the file invalidates the entry
+    ub.writeto(fpath, 'foobarbaz')
+    hash2 = ub.hash_file(fpath, cache=True)
+    assert hash2 != hash1
+    assert hash2 == ub.hash_file(fpath)
+
+    ub.delete(fpath)
+    assert cache.prune() == 1
+
+
+def test_hash_file_cache_hasher_identity(monkeypatch):
+    import functools
+    from ubelt import util_hash
+    if not hasattr(hashlib, 'blake2b'):
+        pytest.skip('requires blake2b')
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_hash_file_cache')
+    cache = util_hash._HashFileCache(join(dpath, 'index.sqlite'))
+    cache.clear()
+    monkeypatch.setattr(util_hash, '_HASH_FILE_CACHE', cache)
+    fpath = join(dpath, 'file.txt')
+    ub.writeto(fpath, 'foobar')
+
+    # hashers with the same name but different digest sizes
+    short = functools.partial(hashlib.blake2b, digest_size=16)
+    want_short = ub.hash_file(fpath, hasher=short, base='hex')
+    want_long = ub.hash_file(fpath, hasher=hashlib.blake2b, base='hex')
+    assert len(want_short) == 32 and len(want_long) == 128
+    for _ in range(2):
+        assert ub.hash_file(fpath, hasher=short, base='hex',
+                            cache=True) == want_short
+        assert ub.hash_file(fpath, hasher=hashlib.blake2b, base='hex',
+                            cache=True) == want_long
+
+    # hashers without a stable name are not cached
+    ub.hash_file(fpath, hasher=lambda: hashlib.sha1(), cache=True)
+    with monkeypatch.context() as m:
+        m.setattr(util_hash, '_hash_file_range', None)
+        with pytest.raises(TypeError):
+            ub.hash_file(fpath, hasher=lambda: hashlib.sha1(), cache=True)
+
+
+def _slow_hashable_sequence(data, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(ub.util_hash, '_NUMERIC_FASTPATH_MINLEN', float('inf'))
+        return b''.join(hash_sequence(data))
+
+
+def test_numeric_fastpath(monkeypatch):
+    rng = np.random.RandomState(0)
+    ints = rng.randint(-2 ** 62, 2 ** 62, size=1000).tolist()
+    floats = (rng.randn(1000) * 10.0 ** rng.randint(-20, 20, size=1000)).tolist()
+    cases = [
+        list(range(-500, 500)),
+        ints,
+        tuple(ints),
+        ints + [2 ** 100, -2 ** 63],  # too big for int64
+        floats,
+        floats + [0.0, -0.0, 5e-324, 1e300],
+        [1] * 100 + [1.0],  # mixed types use the regular path
+        [True] * 100,
+        [[1] * 100, [1.0] * 100],
+    ]
+    for data in cases:
+        fast = b''.join(hash_sequence(data))
+        slow = _slow_hashable_sequence(data, monkeypatch)
+        assert fast == slow
+    assert (ub.hash_data(np.array(ints, dtype=object)) ==
+            ub.hash_data(ints))
+    with pytest.raises(OverflowError):
+        ub.hash_data([float('inf')] * 100)
+    with pytest.raises(ValueError):
+        ub.hash_data([float('nan')] * 100)
+
+
+def _recursive_update_hasher(hasher, data, use_prefix=True):
+    """
+    The original recursive implementation of ``_update_hasher``, which the
+    iterative implementation must agree with.
+    """
+    from ubelt.util_hash import _convert_to_hashable, _needs_iteration
+    if _needs_iteration(data):
+        SEP = b'_,_'
+        ITER_PREFIX = b'_[_'
+        ITER_SUFFIX = b'_]_'
+        iter_ = iter(data)
+        hasher.update(ITER_PREFIX)
+        try:
+            for item in iter_:
+                prefix, hashable = _convert_to_hashable(item, use_prefix)
+                binary_data = prefix + hashable + SEP
+                hasher.update(binary_data)
+        except TypeError:
+            _recursive_update_hasher(hasher, item, use_prefix)
+            for item in iter_:
+                _recursive_update_hasher(hasher, item, use_prefix)
+                hasher.update(SEP)
+        hasher.update(ITER_SUFFIX)
+    else:
+        prefix, hashable = _convert_to_hashable(data, use_prefix)
+        binary_data = prefix + hashable
+        hasher.update(binary_data)
+
+
+def _recursive_hashable_sequence(data, use_prefix=True):
+    hasher = ub.util_hash._HashTracer()
+    _recursive_update_hasher(hasher, data, use_prefix=use_prefix)
+    return hasher.sequence
+
+
+def _make_nested_data(rng, depth):
+    """ random nested lists and tuples with scalar leaves """
+    leaves = [1, 2.5, 'a', b'b', None, uuid.UUID(int=3),
+              np.array([1, 2], dtype=object), np.float32(3)]
+    if depth == 0 or rng.rand() < 0.3:
+        return leaves[rng.randint(len(leaves))]
+    type_ = [list, tuple][rng.randint(2)]
+    return type_(_make_nested_data(rng, depth - 1)
+                 for _ in range(rng.randint(5)))
+
+
+def test_iterative_update_hasher():
+    rng = np.random.RandomState(0)
+    for _ in range(200):
+        data = _make_nested_data(rng, depth=6)
+        for use_prefix in [True, False]:
+            want = b''.join(_recursive_hashable_sequence(data, use_prefix))
+            got = b''.join(hash_sequence(data, use_prefix))
+            assert got == want, repr(data)
+    # zip objects are consumed and cannot be traversed twice
+    got = b''.join(hash_sequence(zip([1, 2], [[3], 4])))
+    want = b''.join(_recursive_hashable_sequence(zip([1, 2], [[3], 4])))
+    assert got == want
+
+
+def test_deep_nesting():
+    import sys
+    data = [1]
+    for _ in range(sys.getrecursionlimit() * 2):
+        data = [data, 2]
+    hashid = ub.hash_data(data)
+    assert hashid != ub.hash_data(data[0])
+
+    class Unhashable(object):
+        pass
+    with pytest.raises(TypeError):
+        ub.hash_data([[1, [2, Unhashable()]]])
+
+
+def test_hash_memo(monkeypatch):
+    import gc
+    from ubelt import util_hash
+    store = util_hash._HashMemoStore(maxsize=4)
+    monkeypatch.setattr(util_hash, '_HASH_MEMO_STORE', store)
+
+    arr = np.arange(1000)
+    arr.flags.writeable = False
+    key = (1, 'a', (2.5, None))
+    data = [arr, key, 'new part']
+
+    hash1 = ub.hash_data(data, memo=True)
+    assert store.misses == 3 and store.hits == 0
+    hash2 = ub.hash_data(data, memo=True)
+    assert store.hits == 2, 'the array and the tuple should be reused'
+    assert hash1 == hash2
+
+    # The hash does not depend on the state of the cache
+    store.clear()
+    assert ub.hash_data(data, memo=True) == hash1
+    assert ub.hash_data(data, memo=True, hasher='sha1') != hash1
+
+    # Mutable values are never memoized
+    writeable = np.arange(1000)
+    store.clear()
+    ub.hash_data([writeable, (1, [2])], memo=True)
+    assert store.misses == 0
+
+    # Entries for arrays are removed when the array is collected
+    assert len(store._weak) == 0
+    ub.hash_data([arr], memo=True)
+    assert len(store._weak) == 1
+    del data, arr
+    gc.collect()
+    assert len(store._weak) == 0
+
+    # Tuples are kept in a bounded LRU cache
+    ub.hash_data([(i,) for i in range(10)], memo=True)
+    assert len(store._lru) == 4
+
+
+def test_hash_memo_hasher_identity(monkeypatch):
+    import functools
+    from ubelt import util_hash
+    if not hasattr(hashlib, 'blake2b'):
+        pytest.skip('requires blake2b')
+    store = util_hash._HashMemoStore()
+    monkeypatch.setattr(util_hash, '_HASH_MEMO_STORE', store)
+    arr = np.arange(1000)
+    arr.flags.writeable = False
+    data = [arr, (1, 'a')]
+
+    # hashers with the same name but different digest sizes
+    short = functools.partial(hashlib.blake2b, digest_size=16)
+    want = {}
+    for hasher in [short, hashlib.blake2b]:
+        store.clear()
+        want[hasher] = ub.hash_data(data, hasher=hasher, memo=True)
+    assert want[short] != want[hashlib.blake2b]
+
+    # the result does not depend on which hasher memoized the data first
+    store.clear()
+    for hasher in [hashlib.blake2b, short, hashlib.blake2b, short]:
+        assert ub.hash_data(data, hasher=hasher, memo=True) == want[hasher]
+
+
+def test_hasher_stream():
+    records = [{'id': i, 'values': list(range(i))} for i in range(50)]
+    hasher = ub.Hasher('sha1')
+    partial = None
+    for i, record in enumerate(records):
+        hasher.update(record)
+        if i == 24:
+            partial = hasher.copy()
+    # the copy does not see later updates, but can continue independently
+    assert partial.digest() != hasher.digest()
+    for record in records[25:]:
+        partial.update(record)
+    assert partial.digest() == hasher.digest()
+
+    # digests of one update agree with the one-shot functions
+    for data in [1, 'a', [1, (2, 3)], {'a': {1, 2}}]:
+        assert ub.Hasher().update(data).digest() == ub.hash_data(data)
+        got = ub.Hasher('fast').update(data).digest(hashlen=8, base='hex')
+        assert got == ub.hash_data(data, hasher='fast', hashlen=8, base='hex')
+
+    fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp_hasher.txt')
+    ub.writeto(fpath, 'foobar' * 100)
+    assert ub.Hasher().update_file(fpath).digest() == ub.hash_file(fpath)
+    assert (ub.Hasher().update_file(fpath, use_mmap=True).digest() ==
+            ub.hash_file(fpath))
+
+
+def test_fast_hasher():
+    fast = ub.hash_data([1, 2, 3], hasher='fast')
+    fast_hasher = ub.util_hash._fast_hasher()
+    assert fast == ub.hash_data([1, 2, 3], hasher=fast_hasher)
+    assert fast != ub.hash_data([1, 2, 3])
+
+    fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+    ub.writeto(fpath, 'foobar')
+    assert (ub.hash_file(fpath, hasher='fast') ==
+            ub.hash_file(fpath, hasher='fast'))
+
+
+def test_registered_hashers():
+    from ubelt.util_hash import _HASHERS
+    for name in _HASHERS.keys():
+        hashid = ub.hash_data('foobar', hasher=name, base='hex')
+        assert hashid == _HASHERS[name](b'TXTfoobar').hexdigest()
+
+
+def test_xxhash():
+    xxhash = pytest.importorskip('xxhash')
+    hashid = ub.hash_data(b'foobar', hasher='xxh64', base='hex')
+    assert hashid == xxhash.xxh64(b'TXTfoobar').hexdigest()
+
+
 def test_convert_base_hex():
     # Test that hex values are unchanged
     for i in it.chain(range(-10, 10), range(-1000, 1000, 7)):
@@ -249,6 +835,307 @@ def test_convert_base_simple():
     assert _convert_hexstr_base('aaa0111', base_10) == '178913553'
 
 
+def test_encode_digest():
+    from ubelt.util_hash import _encode_digest, _ALPHABET_10, _ALPHABET_26
+    from ubelt.util_hash import _ALPHABET_36
+    import random
+    rng = random.Random(0)
+    bases = [_ALPHABET_10, _ALPHABET_16, _ALPHABET_26, _ALPHABET_36,
+             list('01'), list('012')]
+    for nbytes in [1, 2, 16, 20, 32, 64]:
+        for _ in range(20):
+            digest = bytes(bytearray(rng.randint(0, 255) for _ in range(nbytes)))
+            hexstr = binascii.hexlify(digest).decode('ascii')
+            for base in bases:
+                full = _convert_hexstr_base(hexstr, base)
+                for hashlen in [None, 0, 1, 3, 8, 40, 1000, -2]:
+                    got = _encode_digest(digest, hashlen, base)
+                    assert got == full[:hashlen]
+    # Zero digests encode like the old conversion
+    assert _encode_digest(b'\x00\x00', None, _ALPHABET_26) == '0'
+
+
+def test_base32_base64():
+    import base64
+    digest = hashlib.sha256(b'TXTfoobar').digest()
+    want32 = base64.b32encode(digest).decode('ascii').lower().rstrip('=')
+    want64 = base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
+    assert ub.hash_data('foobar', hasher='sha256', base='base32') == want32
+    assert ub.hash_data('foobar', hasher='sha256', base=64) == want64
+    for hashlen in [1, 5, 7, 13]:
+        assert ub.hash_data('foobar', hasher='sha256', base=32,
+                            hashlen=hashlen) == want32[:hashlen]
+        assert ub.hash_data('foobar', hasher='sha256', base='base64',
+                            hashlen=hashlen) == want64[:hashlen]
+
+
+def _tobytes_hashable(data):
+    """ the original copying byte representation of an ndarray """
+    header = b''.join(hash_sequence((len(data.shape), data.shape)))
+    dtype = b''.join(hash_sequence(data.dtype.descr))
+    return b'NDARR' + header + dtype + data.tobytes()
+
+
+def test_ndarray_streaming():
+    base = np.arange(5 * 7 * 3, dtype=np.float32).reshape(5, 7, 3)
+    arrays = [base, base.T, base[:, ::2], base[::-1], base[1:4, 2],
+              np.asfortranarray(base), np.zeros((0, 3)), np.array(3.5),
+              np.arange(10).astype('datetime64[s]'), base.astype('>f2')]
+    for data in arrays:
+        want = hashlib.sha1(_tobytes_hashable(data)).hexdigest()
+        assert ub.hash_data(data, hasher='sha1', base='hex') == want
+        # nested arrays are streamed in the same way
+        nested = [1, data, (data, 'a')]
+        got = b''.join(hash_sequence(nested))
+        want_seq = (b'_[_INT\x01_,_' + _tobytes_hashable(data) + b'_,_' +
+                    b'_[_' + _tobytes_hashable(data) + b'_,_TXTa_,__]__]_')
+        assert got == want_seq
+
+
+def test_ndarray_streaming_memory():
+    import tracemalloc
+    data = np.ones((1024, 1024, 8), dtype=np.float64)  # 64 MB
+    tracemalloc.start()
+    try:
+        ub.hash_data(data, hasher='sha1')
+        _, peak = tracemalloc.get_traced_memory()
+        assert peak < data.nbytes // 16
+        # restart to reset the peak
+        tracemalloc.stop()
+        tracemalloc.start()
+        ub.hash_data(data.transpose(2, 0, 1), hasher='sha1')
+        _, peak = tracemalloc.get_traced_memory()
+        assert peak < data.nbytes // 16
+    finally:
+        tracemalloc.stop()
+
+
+def test_hash_file_fingerprint():
+    import time
+    dpath = ub.ensure_app_cache_dir('ubelt', 'test_fingerprint')
+    fpath = join(dpath, 'sparse.bin')
+    # A sparse file, so the test does not need disk space
+    with open(fpath, 'wb') as file:
+        file.truncate(100 * 2 ** 30)
+    try:
+        start = time.time()
+        hash1 = ub.hash_file(fpath, fingerprint=True, hasher='sha1')
+        assert time.time() - start < 1.0
+        assert hash1.startswith('fp64x4096-')
+        # changing a byte that is sampled changes the fingerprint
+        with open(fpath, 'r+b') as file:
+            file.seek(100 * 2 ** 30 - 1)
+            file.write(b'x')
+        hash2 = ub.hash_file(fpath, fingerprint=True, hasher='sha1')
+        assert hash1 != hash2
+        # the parameters are part of the result
+        hash3 = ub.hash_file(fpath, fingerprint=(8, 1024), hasher='sha1')
+        assert hash3.startswith('fp8x1024-')
+        assert hash3 != hash2
+        # the blocksize has no influence
+        assert hash2 == ub.hash_file(fpath, fingerprint=True, hasher='sha1',
+                                     blocksize=2 ** 10)
+        assert hash2 == ub.hash_file(fpath, fingerprint=True, hasher='sha1',
+                                     cache=True)
+        assert hash2 == ub.hash_file(fpath, fingerprint=True, hasher='sha1',
+                                     cache=True)
+    finally:
+        ub.delete(fpath)
+
+    # small files are hashed in full
+    ub.writeto(fpath, 'foobar')
+    hash4 = ub.hash_file(fpath, fingerprint=True, hasher='sha1', base='hex')
+    header = (b'FPRINT' + ub.util_hash._int_to_bytes(6) + b'_,_' +
+              ub.util_hash._int_to_bytes(64) + b'_,_' +
+              ub.util_hash._int_to_bytes(4096))
+    want = hashlib.sha1(header + b'foobar').hexdigest()
+    assert hash4 == 'fp64x4096-' + want
+    assert dict(ub.hash_files([fpath], fingerprint=True, hasher='sha1',
+                              base='hex')) == {fpath: hash4}
+
+    with pytest.raises(ValueError):
+        ub.hash_file(fpath, fingerprint=True, chunksize=1024)
+    with pytest.raises(ValueError):
+        ub.hash_file(fpath, fingerprint=True, stride=2)
+
+
+def test_hash_data_fingerprint():
+    data = np.arange(10 ** 6, dtype=np.int64).reshape(1000, 1000)
+    hash1 = ub.hash_data(data, fingerprint=True)
+    assert hash1.startswith('fp64x4096-')
+    assert hash1 != ub.hash_data(data)
+    # non-contiguous arrays are sampled in C order
+    assert hash1 == ub.hash_data(np.asfortranarray(data), fingerprint=True)
+    other = data.copy()
+    other[500, 0] = -1  # not in a sample
+    assert hash1 == ub.hash_data(other, fingerprint=True)
+    other[-1, -1] = -1  # in the tail
+    assert hash1 != ub.hash_data(other, fingerprint=True)
+    # nested arrays and memoized arrays are fingerprinted as well
+    data.flags.writeable = False
+    hash2 = ub.hash_data([data, 'a'], fingerprint=8)
+    assert hash2.startswith('fp8x4096-')
+    assert hash2 != ub.hash_data([data, 'a'])
+    assert ub.hash_data([data, 'a'], fingerprint=8, memo=True) != hash2
+    assert (ub.hash_data([data, 'a'], fingerprint=8, memo=True) ==
+            ub.hash_data([data, 'a'], fingerprint=8, memo=True))
+    # other data is unaffected
+    assert ub.hash_data([1, 2], fingerprint=True) == 'fp64x4096-' + ub.hash_data([1, 2])
+
+
+def test_subclass_dispatch():
+    from collections import OrderedDict
+
+    class MyOrderedDict(OrderedDict):
+        pass
+
+    class MyUUID(uuid.UUID):
+        pass
+
+    data = MyOrderedDict([('a', 1), ('b', 2)])
+    assert ub.hash_data(data) == ub.hash_data(OrderedDict(data))
+    uid = uuid.UUID(int=7)
+    assert ub.hash_data(MyUUID(int=7)) == ub.hash_data(uid)
+
+    class Unknown(object):
+        pass
+
+    with pytest.raises(TypeError):
+        ub.hash_data(Unknown())
+    # failed lookups are cached as well
+    with pytest.raises(TypeError):
+        ub.hash_data(Unknown())
+
+
+def test_dispatch_cache_invalidation():
+    from ubelt.util_hash import HashableExtensions
+    self = HashableExtensions()
+    self._register_builtin_class_extensions()
+
+    class Base(object):
+        pass
+
+    class Derived(Base):
+        pass
+
+    with pytest.raises(TypeError):
+        self.lookup(Derived())
+
+    @self.register(Base)
+    def _hash_base(data):
+        return b'BASE', b''
+    assert self.lookup(Derived()) is _hash_base
+
+    @self.register(Derived)
+    def _hash_derived(data):
+        return b'DERIVED', b''
+    assert self.lookup(Derived()) is _hash_derived
+    assert self.lookup(Base()) is _hash_base
+
+    # iterable checks only run on the types they are registered for
+    @self.add_iterable_check(hash_types=Base)
+    def _check(data):
+        return False
+    assert self._iterable_checks_for(Derived) == (_check,)
+    assert self._iterable_checks_for(int) == ()
+
+
+def test_hash_data_tree():
+    records = [{'id': i, 'box': [i, 2.5]} for i in range(100)]
+    hash1 = ub.hash_data(records, chunksize=16, hasher='sha1')
+    assert hash1 == ub.hash_data(records, chunksize=16, workers=3,
+                                 hasher='sha1')
+    assert hash1 == ub.hash_data(tuple(records), chunksize=16, hasher='sha1')
+    assert hash1 != ub.hash_data(records, chunksize=17, hasher='sha1')
+    assert hash1 != ub.hash_data(records, hasher='sha1')
+
+    # the documented combination of the chunk digests
+    root = hashlib.sha1(b'TREE' + ub.util_hash._int_to_bytes(16))
+    for chunk in ub.chunks(records, 16):
+        leaf = ub.hash_data(list(chunk), hasher='sha1', base='hex')
+        root.update(bytes(bytearray.fromhex(leaf)))
+    assert ub.hash_data(records, chunksize=16, hasher='sha1',
+                        base='hex') == root.hexdigest()
+
+    # an empty list has a single empty chunk
+    root = hashlib.sha1(b'TREE' + ub.util_hash._int_to_bytes(16))
+    root.update(hashlib.sha1(b'_[__]_').digest())
+    assert ub.hash_data([], chunksize=16, hasher='sha1',
+                        base='hex') == root.hexdigest()
+
+    # other data is hashed normally
+    assert ub.hash_data('abc', workers=2) == ub.hash_data('abc')
+
+    # memo and fingerprint are applied in each chunk
+    arr = np.arange(10 ** 5)
+    arr.flags.writeable = False
+    data = [arr, 1, arr, 2]
+    hash2 = ub.hash_data(data, chunksize=2, memo=True, fingerprint=True)
+    assert hash2.startswith('fp64x4096-')
+    assert hash2 == ub.hash_data(data, chunksize=2, memo=True,
+                                 fingerprint=True, workers=2)
+
+    # hasher instances are copied for each chunk, but cannot be sent to
+    # worker processes
+    assert hash1 == ub.hash_data(records, chunksize=16,
+                                 hasher=hashlib.sha1())
+    with pytest.raises(TypeError):
+        ub.hash_data(records, chunksize=16, workers=2,
+                     hasher=hashlib.sha1())
+
+    # workers are only used in tree mode and never change the flat hash
+    assert ub.hash_data(records, workers=2, hasher='sha1') == ub.hash_data(
+        records, hasher='sha1')
+
+
+def test_hash_data_tree_threads():
+    # concurrent tree hashes with workers do not see each other's data
+    from multiprocessing.pool import ThreadPool
+    datas = [[{'id': i, 'group': g} for i in range(50)] for g in range(4)]
+    want = [ub.hash_data(data, chunksize=8) for data in datas]
+    pool = ThreadPool(len(datas))
+    try:
+        got = pool.map(
+            lambda data: ub.hash_data(data, chunksize=8, workers=2), datas)
+    finally:
+        pool.close()
+        pool.join()
+    assert got == want
+
+
+def test_hash_data_tree_start_method():
+    import sys
+    import threading
+    from ubelt import util_hash
+    if sys.platform.startswith('win32') or sys.version_info[0] < 3:
+        pytest.skip('requires multiprocessing contexts')
+    # hashing with workers does not fix the start method of the program
+    code = ub.codeblock(
+        '''
+        import multiprocessing
+        import ubelt as ub
+        ub.hash_data(list(range(1000)), chunksize=100, workers=2)
+        assert multiprocessing.get_start_method(allow_none=True) is None
+        multiprocessing.set_start_method('spawn')
+        ''')
+    info = ub.cmd([sys.executable, '-c', code])
+    assert info['ret'] == 0, info['err']
+
+    # processes are not forked while other threads are running
+    event = threading.Event()
+    thread = threading.Thread(target=event.wait)
+    thread.start()
+    try:
+        context, forked = util_hash._pool_context()
+        assert not forked
+        records = list(range(100))
+        assert (ub.hash_data(records, chunksize=10, workers=2) ==
+                ub.hash_data(records, chunksize=10))
+    finally:
+        event.set()
+        thread.join()
+
+
 def test_no_prefix():
     full = b''.join(_hashable_sequence(1, use_prefix=True))
     part = b''.join(_hashable_sequence(1, use_prefix=False))
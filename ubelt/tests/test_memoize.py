@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import pickle
+import time
+import pytest
+import ubelt as ub
+
+
+def _make_counted(**kwargs):
+    calls = []
+
+    @ub.memoize(**kwargs)
+    def func(x):
+        calls.append(x)
+        return x
+    return func, calls
+
+
+def test_memoize_maxsize():
+    func, calls = _make_counted(maxsize=2)
+    func(1), func(2), func(1), func(3)
+    # 2 was the least recently used entry
+    func(1), func(2)
+    assert calls == [1, 2, 3, 2]
+    info = func.cache_info()
+    assert info == (2, 4, 2, 2)
+    assert info.currsize == len(func.cache) == 2
+
+    func.cache_clear()
+    assert func.cache_info() == (0, 0, 2, 0)
+    func(1)
+    assert calls == [1, 2, 3, 2, 1]
+
+
+def test_memoize_ttl():
+    func, calls = _make_counted(ttl=0.05)
+    func(1), func(1)
+    assert calls == [1]
+    time.sleep(0.06)
+    func(1)
+    assert calls == [1, 1]
+    # expired entries are dropped when new entries are added
+    func(2)
+    time.sleep(0.06)
+    func(3)
+    assert func.cache_info().currsize == 1
+
+
+def test_memoize_maxbytes():
+    func, calls = _make_counted(maxbytes=2500)
+    func(b'a' * 1000), func(b'b' * 1000), func(b'c' * 1000)
+    assert func.cache_info().currsize == 2
+    assert func.cache.nbytes <= 2500
+    # values that are larger than the budget are not kept
+    func(b'd' * 5000)
+    func(b'd' * 5000)
+    assert calls[-2:] == [b'd' * 5000] * 2
+    assert func.cache_info().currsize == 2
+
+
+def test_memoize_unhashable_args():
+    func, calls = _make_counted(maxsize=4)
+    func([1, 2]), func([1, 2]), func({'a': [1]}), func({'a': [1]})
+    assert calls == [[1, 2], {'a': [1]}]
+
+
+def test_memoize_unbounded():
+    func, calls = _make_counted()
+    for x in range(100):
+        func(x)
+    func(0)
+    assert func.cache_info() == (1, 100, None, 100)
+
+
+def test_memoize_cache_mapping():
+    # the cache attribute behaves like the dictionary it used to be
+    func, calls = _make_counted(maxsize=3)
+    func(1), func([2])
+    cache = func.cache
+    assert len(cache) == 2
+    key = ub.util_memoize._make_signature_key((1,), {})
+    assert key in cache
+    assert cache[key] == 1
+    assert cache.get(key) == 1
+    assert sorted(v for v in cache.values() if v == 1) == [1]
+    assert dict(cache.items())[key] == 1
+    cache[key] = 'injected'
+    assert func(1) == 'injected'
+    del cache[key]
+    assert key not in cache
+    assert func(1) == 1
+    assert calls == [1, [2], 1]
+    with pytest.raises(KeyError):
+        cache['missing']
+    cache.clear()
+    assert len(cache) == 0 and dict(cache) == {}
+
+
+class _Foo(object):
+    @ub.memoize_method(maxsize=1)
+    def square(self, x):
+        return x ** 2
+
+    @ub.memoize_method
+    def double(self, x):
+        return x * 2
+
+
+def test_memoize_method_policies():
+    foo1, foo2 = _Foo(), _Foo()
+    foo1.square(1), foo1.square(2), foo1.square(2)
+    foo2.square(3)
+    assert foo1.square.cache_info() == (1, 2, 1, 1)
+    assert foo2.square.cache_info() == (0, 1, 1, 1)
+    foo1.double(1), foo1.double(1)
+    assert foo1.double.cache_info() == (1, 1, None, 1)
+    foo1.square.cache_clear()
+    assert foo1.square.cache_info().currsize == 0
+    assert foo2.square.cache_info().currsize == 1
+
+    # instances with memoized results can still be pickled
+    foo3 = pickle.loads(pickle.dumps(foo2))
+    assert foo3.square(3) == 9
+    assert foo3.square.cache_info() == (1, 1, 1, 1)
+
+
+if __name__ == '__main__':
+    r"""
+    CommandLine:
+        pytest ubelt/tests/test_memoize.py
+    """
+    import xdoctest
+    xdoctest.doctest_module(__file__)
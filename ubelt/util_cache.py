@@ -1,10 +1,1713 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
+import contextlib
+import functools
+import inspect
+import io
 import os
-import hashlib
+import re
+import six
+import sys
+import threading
 from os.path import join, normpath, basename, exists
 from six.moves import cPickle as pickle
 import warnings
+from timeit import default_timer
+from ubelt import util_hash
+from ubelt.util_const import NoParam
+
+
+class CacheBackend(object):
+    """
+    Interface for the storage used by `Cacher`.
+
+    Entries are identified by a key, which is the file name the Cacher
+    would use (i.e. ``'{fname}_{cfgstr}{ext}'``, see `Cacher.get_fpath`).
+    Subclasses must implement all methods.
+    """
+
+    def exists(self, key):
+        """
+        Returns True if an entry is stored for `key`
+        """
+        raise NotImplementedError
+
+    def open_read(self, key):
+        """
+        Returns a readable binary file-like object for the entry.
+
+        Raises:
+            IOError: if the entry does not exist
+        """
+        raise NotImplementedError
+
+    def write(self, key, writer, info):
+        """
+        Stores an entry and its metadata record.
+
+        Args:
+            key (str): the entry key
+            writer (callable): called with a writable binary file-like
+                object, which receives the serialized data.
+            info (dict): metadata about the entry. Contains the keys fname,
+                cfgstr, condensed, timestamp, duration, hasher, version, and
+                meta (see `records`).
+
+        Returns:
+            int: the size of the stored entry in bytes
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Removes an entry and its metadata.
+
+        Returns:
+            bool: True if the entry existed
+        """
+        raise NotImplementedError
+
+    def keys(self, fname, ext):
+        """
+        Returns the keys of entries stored for `fname` with extension `ext`
+        """
+        raise NotImplementedError
+
+    def records(self, fname=None):
+        """
+        Returns the metadata records of the stored entries.
+
+        Args:
+            fname (str): if specified, only return records of this fname
+
+        Returns:
+            List[dict]: records with the keys: key, fname, cfgstr,
+                timestamp (seconds since the epoch), size (bytes), duration
+                (seconds taken to compute the data, or None if unknown),
+                hasher (used to condense the cfgstr), version (of ubelt),
+                hash_version (`ub.util_hash.HASH_VERSION`, which decides if
+                hashes in the cfgstr are still valid), meta, and accessed
+                (the time it was last saved or loaded through a
+                `CacheManager`).
+        """
+        raise NotImplementedError
+
+    def reconcile(self, fname=None, ext=''):
+        """
+        Synchronizes the metadata records with the stored entries, e.g.
+        after files were deleted or written by other programs.
+
+        Returns:
+            Dict[str, int]: the number of added and removed records
+        """
+        return {'added': 0, 'removed': 0}
+
+    def local_path(self, key):
+        """
+        Returns the path of a file that holds exactly the serialized entry,
+        or None if the backend does not store entries as files. Serializers
+        can use this to memory map the data.
+        """
+        return None
+
+    def size(self, key):
+        """
+        Returns the number of bytes used by an entry
+        """
+        local_fpath = self.local_path(key)
+        if local_fpath is not None:
+            return os.path.getsize(local_fpath)
+        with self.open_read(key) as file_:
+            return len(file_.read())
+
+
+# Columns of a metadata record (see `CacheBackend.records`)
+_RECORD_COLUMNS = [
+    ('key', 'TEXT PRIMARY KEY'),
+    ('fname', 'TEXT'),
+    ('cfgstr', 'TEXT'),
+    ('timestamp', 'REAL'),
+    ('size', 'INTEGER'),
+    ('duration', 'REAL'),
+    ('hasher', 'TEXT'),
+    ('version', 'TEXT'),
+    ('hash_version', 'INTEGER'),
+    ('meta', 'TEXT'),
+    ('accessed', 'REAL'),
+]
+_RECORD_NAMES = [name for name, _ in _RECORD_COLUMNS]
+_INSERT_RECORD = 'INTO records ({}) VALUES ({})'.format(
+    ', '.join(_RECORD_NAMES), ', '.join('?' * len(_RECORD_NAMES)))
+
+# Filesystems on which sqlite must not use write-ahead logging, because
+# its shared memory index does not work across machines.
+_NETWORK_FILESYSTEMS = {
+    'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afs', 'ncpfs', '9p', 'lustre',
+    'gpfs', 'ceph', 'glusterfs', 'fuse.glusterfs', 'fuse.sshfs',
+}
+
+
+def _is_network_path(dpath):
+    """
+    Heuristic check if a directory is on a network filesystem. On Linux the
+    filesystem type is read from ``/proc/mounts``. On Windows UNC paths are
+    considered network paths. Otherwise it returns False.
+
+    Example:
+        >>> import ubelt as ub
+        >>> assert _is_network_path(ub.ensure_app_cache_dir('ubelt')) in {
+        >>>     True, False}
+    """
+    dpath = os.path.realpath(dpath)
+    if sys.platform.startswith('win32'):  # nocover
+        return dpath.startswith('\\\\')
+    try:
+        with open('/proc/mounts', 'r') as file_:
+            lines = file_.readlines()
+    except (IOError, OSError):  # nocover
+        return False
+    best, fstype = '', None
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        # spaces in mount points are escaped as octal
+        mount = parts[1].replace('\\040', ' ')
+        prefix = mount.rstrip('/') + '/'
+        if ((dpath == mount or dpath.startswith(prefix)) and
+                len(mount) >= len(best)):
+            best, fstype = mount, parts[2]
+    return fstype in _NETWORK_FILESYSTEMS
+
+
+def _sqlite_connect(fpath):
+    """
+    Opens a sqlite database that can be used by many threads and processes
+    """
+    import sqlite3
+    conn = sqlite3.connect(fpath, timeout=60, isolation_level=None,
+                           check_same_thread=False)
+    # Rows replaced by INSERT OR REPLACE fire the delete triggers
+    conn.execute('PRAGMA recursive_triggers=ON')
+    if not _is_network_path(os.path.dirname(fpath) or '.'):
+        try:
+            # Write-ahead logging lets readers proceed during writes
+            conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError:  # nocover
+            pass
+    return conn
+
+
+def _sqlite_add_columns(conn, table, columns):
+    """
+    Adds columns to a table that was created with fewer columns
+
+    Returns:
+        List[str]: the names of the added columns
+    """
+    import sqlite3
+    have = {row[1] for row in conn.execute(
+        'PRAGMA table_info({})'.format(table))}
+    added = []
+    for name, type_ in columns:
+        if name not in have:
+            try:
+                conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table, name, type_.replace(' PRIMARY KEY', '')))
+            except sqlite3.OperationalError:  # nocover
+                pass  # another process added it first
+            else:
+                added.append(name)
+    return added
+
+
+def _make_record(key, info, size):
+    """
+    Returns the row of a metadata record in the order of `_RECORD_COLUMNS`
+    """
+    import json
+    meta = json.dumps(info.get('meta'), default=repr)
+    return (key, info['fname'], info['cfgstr'], info['timestamp'], size,
+            info.get('duration'), info.get('hasher'), info.get('version'),
+            info.get('hash_version'), meta, info['timestamp'])
+
+
+def _record_from_row(row):
+    """
+    Inverse of `_make_record`, which returns a dictionary
+    """
+    import json
+    record = dict(zip(_RECORD_NAMES, row))
+    for name in ['timestamp', 'accessed']:
+        if record[name] is not None:
+            record[name] = float(record[name])
+    if record['meta'] is not None:
+        try:
+            record['meta'] = json.loads(record['meta'])
+        except ValueError:
+            pass
+    return record
+
+
+class _MetadataIndex(object):
+    """
+    The sqlite index of a cache directory, which holds the metadata record
+    of every entry (see `CacheBackend.records`).
+
+    It is the single source of truth for a directory: `FileBackend` keeps
+    the records of its files in it, `SqliteBackend` also keeps the data of
+    its entries in it, and `CacheManager` reads sizes and save times and
+    records access times in it. The total size and number of entries are
+    maintained with triggers.
+
+    Use `_MetadataIndex.for_dpath` to share one connection between all
+    users of the same directory. The database is only created when the
+    first record is written. When it is created, the entries that older
+    versions described with `.meta` files are imported. Write-ahead logging
+    is not used on network filesystems.
+
+    Example:
+        >>> import ubelt as ub
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_metadata_index')
+        >>> self = _MetadataIndex.for_dpath(dpath)
+        >>> info = {'fname': 'a', 'cfgstr': 'b', 'timestamp': 0.0,
+        >>>         'meta': {'param': 1}}
+        >>> self.put('a_b.pkl', info, 4)
+        >>> record = self.records('a')[0]
+        >>> assert record['size'] == 4 and record['meta'] == {'param': 1}
+        >>> self.delete('a_b.pkl')
+        >>> assert self.records('a') == []
+    """
+    FNAME = 'cacher_index.sqlite'
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_fpath(cls, fpath):
+        """
+        Returns the shared index stored in `fpath`
+        """
+        fpath = normpath(fpath)
+        with cls._instances_lock:
+            try:
+                return cls._instances[fpath]
+            except KeyError:
+                self = cls._instances[fpath] = cls(fpath)
+                return self
+
+    @classmethod
+    def for_dpath(cls, dpath):
+        """
+        Returns the shared index of `dpath`
+        """
+        return cls.for_fpath(join(dpath, cls.FNAME))
+
+    def _connect(self, create=True):
+        """
+        Returns the connection of this process, or None if `create` is False
+        and the database does not exist yet (and there are no `.meta` files
+        to import).
+        """
+        # sqlite connections must not be shared with forked processes
+        if self._conn is None or self._pid != os.getpid():
+            is_new = not exists(self.fpath)
+            if is_new and not create and not self._has_meta_files():
+                return None
+            conn = _sqlite_connect(self.fpath)
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('CREATE TABLE IF NOT EXISTS records ({})'.format(
+                    ', '.join(' '.join(col) for col in _RECORD_COLUMNS)))
+                if 'accessed' in _sqlite_add_columns(conn, 'records',
+                                                     _RECORD_COLUMNS):
+                    conn.execute('UPDATE records SET accessed = timestamp')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS blobs ('
+                    'key TEXT PRIMARY KEY, data BLOB)')
+                for name, columns in [('fname_cfgstr', 'fname, cfgstr'),
+                                      ('fname_timestamp', 'fname, timestamp'),
+                                      ('timestamp', 'timestamp'),
+                                      ('accessed', 'accessed')]:
+                    conn.execute(
+                        'CREATE INDEX IF NOT EXISTS records_{} '
+                        'ON records ({})'.format(name, columns))
+                # The totals are maintained incrementally by triggers
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS totals ('
+                    'id INTEGER PRIMARY KEY, entries INTEGER, size INTEGER)')
+                conn.execute(
+                    'INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), '
+                    'COALESCE(SUM(size), 0) FROM records')
+                conn.execute(
+                    'CREATE TRIGGER IF NOT EXISTS records_insert '
+                    'AFTER INSERT ON records BEGIN UPDATE totals SET '
+                    'entries = entries + 1, '
+                    'size = size + COALESCE(NEW.size, 0); END')
+                conn.execute(
+                    'CREATE TRIGGER IF NOT EXISTS records_delete '
+                    'AFTER DELETE ON records BEGIN UPDATE totals SET '
+                    'entries = entries - 1, '
+                    'size = size - COALESCE(OLD.size, 0); END')
+                conn.execute(
+                    'CREATE TRIGGER IF NOT EXISTS records_update '
+                    'AFTER UPDATE OF size ON records BEGIN UPDATE totals SET '
+                    'size = size - COALESCE(OLD.size, 0) '
+                    '+ COALESCE(NEW.size, 0); END')
+                if is_new:
+                    self._import_meta_files(conn)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _has_meta_files(self):
+        dpath = os.path.dirname(self.fpath)
+        return any(f.endswith('.meta') for f in os.listdir(dpath))
+
+    def _query(self, query, params=()):
+        """
+        Returns the rows of a query, without creating the database
+        """
+        with self._lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                return []
+            return conn.execute(query, params).fetchall()
+
+    def _import_meta_files(self, conn):
+        """
+        Creates records for entries that have a `.meta` file, which contains
+        blocks of the form: saving <timestamp>, fname, condensed, cfgstr, and
+        meta lines.
+        """
+        import glob
+        dpath = os.path.dirname(self.fpath)
+        rows = []
+        for meta_fpath in glob.glob(join(dpath, '*.meta')):
+            data_fpath = meta_fpath[:-len('.meta')]
+            try:
+                with open(meta_fpath, 'r') as file_:
+                    block = file_.read().split('\n\nsaving ')[-1]
+                stat = os.stat(data_fpath)
+            except (IOError, OSError):
+                continue
+            lines = block.split('\n')
+            if len(lines) < 5:
+                continue
+            info = {'fname': lines[1], 'cfgstr': lines[3],
+                    'timestamp': stat.st_mtime, 'meta': lines[4]}
+            rows.append(_make_record(basename(data_fpath), info,
+                                     stat.st_size))
+        if rows:
+            conn.executemany('INSERT OR IGNORE ' + _INSERT_RECORD, rows)
+        return len(rows)
+
+    def reconcile(self, fname=None, ext=''):
+        """
+        Removes records of file entries whose files were deleted, and adds
+        records for files that are described by `.meta` files. If `fname` is
+        given, files named like its entries (``'{fname}_*{ext}'``) are also
+        added. Their cfgstr is the condensed cfgstr in the file name.
+
+        Returns:
+            Dict[str, int]: the number of added and removed records
+        """
+        dpath = os.path.dirname(self.fpath)
+        untracked = []
+        if fname is not None:
+            prefix = fname + '_'
+            untracked = [key for key in os.listdir(dpath)
+                         if key.startswith(prefix) and key.endswith(ext) and
+                         not key.endswith('.meta') and
+                         not key.startswith(self.FNAME)]
+        with self._lock:
+            has_meta = self._has_meta_files()
+            # The index is not created if there is nothing to record
+            conn = self._connect(create=bool(untracked or has_meta))
+            if conn is None:
+                return {'added': 0, 'removed': 0}
+            # Entries with data in the database are not files
+            keys = [key for key, in conn.execute(
+                'SELECT key FROM records WHERE key NOT IN '
+                '(SELECT key FROM blobs)')]
+            missing = [(key,) for key in keys
+                       if not exists(join(dpath, key))]
+            conn.executemany('DELETE FROM records WHERE key=?', missing)
+            num_before = conn.execute(
+                'SELECT COUNT(*) FROM records').fetchone()[0]
+            if has_meta:
+                self._import_meta_files(conn)
+            known = set(keys)
+            rows = []
+            for key in untracked:
+                if key in known:
+                    continue
+                condensed = key[len(prefix):len(key) - len(ext)]
+                try:
+                    stat = os.stat(join(dpath, key))
+                except OSError:  # nocover
+                    continue
+                info = {'fname': fname, 'cfgstr': condensed,
+                        'timestamp': stat.st_mtime}
+                rows.append(_make_record(key, info, stat.st_size))
+            conn.executemany('INSERT OR IGNORE ' + _INSERT_RECORD, rows)
+            num_after = conn.execute(
+                'SELECT COUNT(*) FROM records').fetchone()[0]
+        return {'added': num_after - num_before, 'removed': len(missing)}
+
+    def put(self, key, info, size, blob=None):
+        """
+        Stores the record of an entry, and its data if `blob` is given
+        """
+        import sqlite3
+        row = _make_record(key, info, size)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('INSERT OR REPLACE ' + _INSERT_RECORD, row)
+                if blob is not None:
+                    conn.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?)',
+                                 (key, sqlite3.Binary(blob)))
+
+    def delete(self, key):
+        """
+        Removes the record and the data of an entry
+
+        Returns:
+            bool: True if data of the entry was stored in the database
+        """
+        with self._lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                return False
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM records WHERE key=?', (key,))
+                cursor = conn.execute('DELETE FROM blobs WHERE key=?',
+                                      (key,))
+        return cursor.rowcount > 0
+
+    def keys(self, fname):
+        rows = self._query('SELECT key FROM records WHERE fname=?', (fname,))
+        return [key for key, in rows]
+
+    def records(self, fname=None):
+        query = 'SELECT {} FROM records'.format(', '.join(_RECORD_NAMES))
+        if fname is None:
+            rows = self._query(query)
+        else:
+            rows = self._query(query + ' WHERE fname=?', (fname,))
+        return [_record_from_row(row) for row in rows]
+
+
+class FileBackend(CacheBackend):
+    """
+    Stores each entry in its own file in `dpath`. This is the default
+    backend. The metadata records of all entries are kept in the sqlite
+    index of `dpath`, so listing versions and computing statistics does not
+    need to walk the directory.
+
+    Entries are written to a temporary file in `dpath`, which then atomically
+    replaces the entry, so readers never see a partially written file.
+
+    Example:
+        >>> import ubelt as ub
+        >>> import time
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_file_backend')
+        >>> self = FileBackend(dpath)
+        >>> info = {'fname': 'a', 'cfgstr': 'b', 'condensed': 'b',
+        >>>         'timestamp': time.time(), 'meta': None}
+        >>> self.write('a_b.pkl', lambda file: file.write(b'data'), info)
+        4
+        >>> assert self.exists('a_b.pkl')
+        >>> with self.open_read('a_b.pkl') as file:
+        >>>     assert file.read() == b'data'
+        >>> assert list(self.keys('a', '.pkl')) == ['a_b.pkl']
+        >>> assert self.records('a')[0]['cfgstr'] == 'b'
+        >>> assert self.delete('a_b.pkl')
+        >>> assert not self.delete('a_b.pkl')
+        >>> assert self.records('a') == []
+    """
+
+    def __init__(self, dpath):
+        self.dpath = dpath
+        self.index = _MetadataIndex.for_dpath(dpath)
+
+    def _fpath(self, key):
+        return join(self.dpath, key)
+
+    def local_path(self, key):
+        return self._fpath(key)
+
+    def exists(self, key):
+        return exists(self._fpath(key))
+
+    def open_read(self, key):
+        return open(self._fpath(key), 'rb')
+
+    def write(self, key, writer, info):
+        data_fpath = self._fpath(key)
+        _atomic_write(data_fpath, writer)
+        size = os.path.getsize(data_fpath)
+        self.index.put(key, info, size)
+        return size
+
+    def delete(self, key):
+        data_fpath = self._fpath(key)
+        self.index.delete(key)
+        if not exists(data_fpath):
+            return False
+        os.remove(data_fpath)
+        # Older versions appended metadata to an adjacent text file
+        meta_fpath = data_fpath + '.meta'
+        if exists(meta_fpath):
+            os.remove(meta_fpath)
+        return True
+
+    def keys(self, fname, ext):
+        return [key for key in self.index.keys(fname) if key.endswith(ext)]
+
+    def records(self, fname=None):
+        return self.index.records(fname)
+
+    def reconcile(self, fname=None, ext=''):
+        return self.index.reconcile(fname, ext)
+
+
+class SqliteBackend(CacheBackend):
+    """
+    Stores the data of all entries of a directory in its sqlite index (see
+    `_MetadataIndex`), next to their records. This avoids creating a file
+    per entry and makes listing the versions of an fname cheap.
+
+    Use `SqliteBackend.for_dpath` to share one connection between all
+    cachers that use the same directory. An entry is stored by one backend:
+    saving the same key with the file backend in the same directory
+    replaces it.
+
+    Args:
+        fpath (str): path to the database file
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_sqlite_backend')
+        >>> self = SqliteBackend(join(dpath, 'test.sqlite'))
+        >>> info = {'fname': 'a', 'cfgstr': 'b', 'condensed': 'b',
+        >>>         'timestamp': 0.0, 'meta': None}
+        >>> self.write('a_b.pkl', lambda file: file.write(b'data'), info)
+        4
+        >>> assert self.exists('a_b.pkl')
+        >>> with self.open_read('a_b.pkl') as file:
+        >>>     assert file.read() == b'data'
+        >>> assert list(self.keys('a', '.pkl')) == ['a_b.pkl']
+        >>> assert self.records('a')[0]['size'] == 4
+        >>> assert self.delete('a_b.pkl')
+        >>> assert not self.delete('a_b.pkl')
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.index = _MetadataIndex.for_fpath(fpath)
+
+    @classmethod
+    def for_dpath(cls, dpath):
+        """
+        Returns the shared backend that uses the index of `dpath`
+        """
+        fpath = normpath(join(dpath, _MetadataIndex.FNAME))
+        with cls._instances_lock:
+            try:
+                return cls._instances[fpath]
+            except KeyError:
+                self = cls._instances[fpath] = cls(fpath)
+                return self
+
+    def exists(self, key):
+        return bool(self.index._query('SELECT 1 FROM blobs WHERE key=?',
+                                      (key,)))
+
+    def open_read(self, key):
+        rows = self.index._query('SELECT data FROM blobs WHERE key=?', (key,))
+        if not rows:
+            raise IOError(2, 'No such cache entry: %r' % (key,))
+        return io.BytesIO(rows[0][0])
+
+    def write(self, key, writer, info):
+        buf = io.BytesIO()
+        writer(buf)
+        blob = buf.getvalue()
+        self.index.put(key, info, len(blob), blob=blob)
+        return len(blob)
+
+    def delete(self, key):
+        return self.index.delete(key)
+
+    def keys(self, fname, ext):
+        rows = self.index._query(
+            'SELECT key FROM records WHERE fname=? AND key IN '
+            '(SELECT key FROM blobs)', (fname,))
+        return [key for key, in rows if key.endswith(ext)]
+
+    def records(self, fname=None):
+        return self.index.records(fname)
+
+    def size(self, key):
+        rows = self.index._query(
+            'SELECT length(data) FROM blobs WHERE key=?', (key,))
+        if not rows:
+            raise IOError(2, 'No such cache entry: %r' % (key,))
+        return rows[0][0]
+
+    def find(self, fname, cfgstr):
+        """
+        Returns the keys of entries stored for an uncondensed cfgstr
+        """
+        rows = self.index._query(
+            'SELECT key FROM records WHERE fname=? AND cfgstr=? AND key IN '
+            '(SELECT key FROM blobs)', (fname, cfgstr))
+        return [key for key, in rows]
+
+
+# os.replace is atomic on all platforms, but is not available on python2
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _atomic_write(fpath, writer):
+    """
+    Calls `writer` with a temporary file and then moves it to `fpath`.
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_atomic_write')
+        >>> fpath = join(dpath, 'file.txt')
+        >>> _atomic_write(fpath, lambda file: file.write(b'data'))
+        >>> assert open(fpath, 'rb').read() == b'data'
+        >>> def _fail(file):
+        >>>     file.write(b'partial')
+        >>>     raise ValueError
+        >>> import pytest
+        >>> with pytest.raises(ValueError):
+        >>>     _atomic_write(fpath, _fail)
+        >>> assert open(fpath, 'rb').read() == b'data'
+        >>> assert os.listdir(dpath) == ['file.txt']
+    """
+    import uuid
+    dpath, fname = os.path.split(fpath)
+    # A unique name in the same directory (so it is on the same filesystem).
+    # Unlike tempfile, open respects the umask for the file permissions.
+    tmp_fpath = join(dpath, '.{}.{}.tmp'.format(fname, uuid.uuid4().hex))
+    try:
+        with open(tmp_fpath, 'wb') as file_:
+            writer(file_)
+        _replace(tmp_fpath, fpath)
+    except BaseException:
+        if exists(tmp_fpath):
+            os.remove(tmp_fpath)
+        raise
+
+
+@contextlib.contextmanager
+def _file_lock(lock_fpath):
+    """
+    Holds an exclusive advisory lock on `lock_fpath` while in the context.
+
+    The lock is shared by all threads and processes on this machine that
+    lock the same path. On platforms without `fcntl` (e.g. Windows) this does
+    nothing.
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_file_lock')
+        >>> with _file_lock(join(dpath, 'test.lock')):
+        >>>     pass
+    """
+    try:
+        import fcntl
+    except ImportError:  # nocover
+        yield
+        return
+    with open(lock_fpath, 'a') as file_:
+        fcntl.flock(file_.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file_.fileno(), fcntl.LOCK_UN)
+
+
+# Number of lock files that the entries of a directory are striped over
+_NUM_LOCK_STRIPES = 64
+
+# Records if the current thread holds a stripe lock
+_LOCK_STATE = threading.local()
+
+
+@contextlib.contextmanager
+def _held_lock(lock_fpath):
+    """
+    Like `_file_lock`, but marks the lock as held by the current thread
+    """
+    with _file_lock(lock_fpath):
+        _LOCK_STATE.held = True
+        try:
+            yield
+        finally:
+            _LOCK_STATE.held = False
+
+
+class _PickleSerializer(object):
+    """
+    The default serializer, which uses pickle with a fixed protocol
+    """
+
+    def __init__(self, protocol=2):
+        self.protocol = protocol
+
+    def dump(self, data, file):
+        pickle.dump(data, file, protocol=self.protocol)
+
+    def load(self, file):
+        return pickle.load(file)
+
+    def load_path(self, fpath):
+        with open(fpath, 'rb') as file:
+            return self.load(file)
+
+
+class _OutOfBandPickleSerializer(_PickleSerializer):
+    """
+    Pickle protocol 5 with out-of-band buffers (requires python 3.8).
+
+    Large buffers (e.g. the data of ndarrays) are written after the pickle
+    stream without being copied into it, and are aligned to 64 bytes. When
+    the entry is a local file, it is memory mapped and the loaded arrays are
+    read-only views into the mapping, so nothing is copied into RAM.
+
+    The layout is: a magic string, the number of buffers, the length of the
+    pickle stream and of each buffer (as 8 byte little endian integers),
+    the pickle stream, and then each buffer starting at an aligned offset.
+
+    Example:
+        >>> # xdoctest: +REQUIRES(module:numpy)
+        >>> import numpy as np
+        >>> self = _OutOfBandPickleSerializer()
+        >>> data = {'arr': np.arange(1000), 'name': 'feats'}
+        >>> file = io.BytesIO()
+        >>> self.dump(data, file)
+        >>> file.seek(0)
+        >>> recon = self.load(file)
+        >>> assert np.all(recon['arr'] == data['arr'])
+    """
+    MAGIC = b'UBELT-PKL5\n'
+    ALIGN = 64
+
+    def __init__(self):
+        super(_OutOfBandPickleSerializer, self).__init__(protocol=5)
+
+    def dump(self, data, file):
+        import struct
+        if getattr(pickle, 'HIGHEST_PROTOCOL', 0) < 5:
+            raise ValueError('out-of-band pickling requires python 3.8')
+        buffers = []
+        stream = pickle.dumps(data, protocol=5,
+                              buffer_callback=buffers.append)
+        views = [buf.raw() for buf in buffers]
+        header = self.MAGIC + struct.pack(
+            '<{}Q'.format(len(views) + 2), len(views), len(stream),
+            *[view.nbytes for view in views])
+        file.write(header)
+        file.write(stream)
+        offset = len(header) + len(stream)
+        for view in views:
+            pad = -offset % self.ALIGN
+            file.write(b'\x00' * pad)
+            file.write(view)
+            offset += pad + view.nbytes
+
+    def _loads(self, blob):
+        import struct
+        blob = memoryview(blob)
+        start = len(self.MAGIC)
+        if blob[:start].tobytes() != self.MAGIC:
+            raise IOError('not an out-of-band pickle')
+        nbufs, = struct.unpack_from('<Q', blob, start)
+        lens = struct.unpack_from('<{}Q'.format(nbufs + 1), blob, start + 8)
+        offset = start + 8 * (nbufs + 2)
+        stream = blob[offset:offset + lens[0]]
+        offset += lens[0]
+        buffers = []
+        for nbytes in lens[1:]:
+            offset += -offset % self.ALIGN
+            buffers.append(blob[offset:offset + nbytes])
+            offset += nbytes
+        return pickle.loads(stream, buffers=buffers)
+
+    def load(self, file):
+        return self._loads(file.read())
+
+    def load_path(self, fpath):
+        import mmap
+        with open(fpath, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                raise EOFError('empty file')
+            # The mapping stays open as long as loaded arrays refer to it
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._loads(mapped)
+
+
+class _NumpySerializer(object):
+    """
+    Stores a single ndarray in the `.npy` format. Local files are loaded with
+    ``mmap_mode='r'``, which returns a read-only memory map instead of
+    copying the array into RAM.
+    """
+
+    def dump(self, data, file):
+        import numpy as np
+        np.save(file, data, allow_pickle=False)
+
+    def load(self, file):
+        import numpy as np
+        return np.load(file, allow_pickle=False)
+
+    def load_path(self, fpath):
+        import numpy as np
+        return np.load(fpath, mmap_mode='r', allow_pickle=False)
+
+
+class _NumpyArchiveSerializer(object):
+    """
+    Stores a dictionary of ndarrays in the `.npz` format
+    """
+
+    def dump(self, data, file):
+        import numpy as np
+        np.savez(file, **data)
+
+    def load(self, file):
+        import numpy as np
+        with np.load(file, allow_pickle=False) as archive:
+            return {key: archive[key] for key in archive.files}
+
+    def load_path(self, fpath):
+        with open(fpath, 'rb') as file:
+            return self.load(file)
+
+
+class _JsonSerializer(object):
+    """
+    Stores json compatible data (e.g. small metadata) as utf8 text
+    """
+
+    def dump(self, data, file):
+        import json
+        file.write(json.dumps(data).encode('utf8'))
+
+    def load(self, file):
+        import json
+        return json.loads(file.read().decode('utf8'))
+
+    def load_path(self, fpath):
+        with open(fpath, 'rb') as file:
+            return self.load(file)
+
+
+def _open_compressed(compression, file, mode):
+    """
+    Wraps a binary file object with a compressing or decompressing stream
+    """
+    if compression == '.gz':
+        import gzip
+        return gzip.GzipFile(fileobj=file, mode=mode)
+    elif compression == '.xz':
+        import lzma
+        return lzma.LZMAFile(file, mode=mode)
+    elif compression == '.zst':
+        import zstandard
+        if mode == 'wb':
+            return zstandard.ZstdCompressor().stream_writer(file,
+                                                            closefd=False)
+        else:
+            return zstandard.ZstdDecompressor().stream_reader(file,
+                                                              closefd=False)
+    else:
+        raise KeyError(compression)
+
+
+class _CompressedSerializer(object):
+    """
+    Compresses the output of another serializer with zlib (`.gz`), lzma
+    (`.xz`), or zstd (`.zst`, which requires the `zstandard` module).
+    """
+
+    def __init__(self, serializer, compression):
+        self.serializer = serializer
+        self.compression = compression
+
+    def dump(self, data, file):
+        stream = _open_compressed(self.compression, file, 'wb')
+        try:
+            self.serializer.dump(data, stream)
+        finally:
+            # finishes the compressed stream, but leaves `file` open
+            stream.close()
+
+    def load(self, file):
+        stream = _open_compressed(self.compression, file, 'rb')
+        # Read everything so serializers that need to seek can use it
+        return self.serializer.load(io.BytesIO(stream.read()))
+
+    def load_path(self, fpath):
+        with open(fpath, 'rb') as file:
+            return self.load(file)
+
+
+_COMPRESSIONS = ('.gz', '.xz', '.zst')
+
+
+def _rectify_serializer(ext, protocol=2):
+    """
+    Chooses the serializer for an extension.
+
+    The extension can end with a compression suffix (e.g. '.pkl.gz' or
+    '.json.xz'). Extensions without a special serializer use pickle.
+
+    Example:
+        >>> assert isinstance(_rectify_serializer('.pkl'), _PickleSerializer)
+        >>> assert isinstance(_rectify_serializer('.cPkl'), _PickleSerializer)
+        >>> assert isinstance(_rectify_serializer('.npy'), _NumpySerializer)
+        >>> self = _rectify_serializer('.json.xz')
+        >>> assert isinstance(self.serializer, _JsonSerializer)
+    """
+    for compression in _COMPRESSIONS:
+        if ext.endswith(compression):
+            base = _rectify_serializer(ext[:-len(compression)], protocol)
+            return _CompressedSerializer(base, compression)
+    if ext == '.npy':
+        return _NumpySerializer()
+    elif ext == '.npz':
+        return _NumpyArchiveSerializer()
+    elif ext == '.json':
+        return _JsonSerializer()
+    elif ext == '.pkl5':
+        return _OutOfBandPickleSerializer()
+    else:
+        return _PickleSerializer(protocol)
+
+
+def _rectify_backend(backend, dpath):
+    """
+    Returns the `CacheBackend` instance for a `backend` key or instance
+
+    Example:
+        >>> import ubelt as ub
+        >>> dpath = ub.ensure_app_cache_dir('ubelt')
+        >>> assert isinstance(_rectify_backend('file', dpath), FileBackend)
+        >>> backend = _rectify_backend('sqlite', dpath)
+        >>> assert backend is _rectify_backend('sqlite', dpath)
+        >>> assert _rectify_backend(backend, dpath) is backend
+    """
+    if backend is None or backend == 'file':
+        return FileBackend(dpath)
+    elif backend == 'sqlite':
+        return SqliteBackend.for_dpath(dpath)
+    elif isinstance(backend, CacheBackend):
+        return backend
+    else:
+        raise KeyError('unknown backend={!r}'.format(backend))
+
+
+class CacheManager(object):
+    """
+    Bounds the size of a cache directory by evicting entries.
+
+    The manager reads the size and save time of the entries from the
+    metadata index of the directory (see `Cacher.records`), which is also
+    used to list versions and compute statistics, and records in it when
+    entries are loaded. The index maintains the total size and number of
+    entries with triggers, so enforcing the limits after a save only needs
+    a few indexed queries and never walks the directory.
+
+    When a limit is exceeded, the least recently used entries are evicted
+    until the cache is within its limits. Entries older than their
+    time-to-live are treated as missing when loaded. They are deleted by a
+    sweep that runs at most once every `sweep_interval` seconds after a
+    save, and on every explicit call to `evict`.
+
+    All entries in the index are managed, including entries that were saved
+    without a manager. Entries that were never loaded through a manager are
+    ordered by the time they were saved.
+
+    Args:
+        dpath (str): the cache directory
+        maxbytes (int): maximum total size of the entries
+        maxentries (int): maximum number of entries
+        ttl (float | dict): maximum age of entries in seconds. Either a
+            single value or a dictionary mapping fnames to values. Fnames
+            that are not in the dictionary do not expire.
+        backend (str | CacheBackend): the backend of the cachers that use
+            this manager (see `Cacher`). Entries are deleted through it.
+        sweep_interval (float): minimum number of seconds between the sweeps
+            of expired entries that run after saves.
+
+    Example:
+        >>> import ubelt as ub
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_cache_manager')
+        >>> manager = CacheManager(dpath, maxentries=2)
+        >>> manager.clear()
+        >>> for cfgstr in ['a', 'b', 'c']:
+        >>>     ub.Cacher('demo', cfgstr, manager=manager).save(cfgstr)
+        >>> assert manager.info()['entries'] == 2
+        >>> assert not ub.Cacher('demo', 'a', manager=manager).exists()
+        >>> assert ub.Cacher('demo', 'c', manager=manager).load() == 'c'
+    """
+
+    def __init__(self, dpath, maxbytes=None, maxentries=None, ttl=None,
+                 backend='file', sweep_interval=60):
+        self.dpath = dpath
+        self.maxbytes = maxbytes
+        self.maxentries = maxentries
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = None
+        self.backend = _rectify_backend(backend, dpath)
+        self.index = _MetadataIndex.for_dpath(dpath)
+        self._lock = threading.Lock()
+        # The in-memory layers of the cachers that use this manager
+        self._memories = []
+
+    def _track_memory(self, memory):
+        """
+        Registers an in-memory layer, which evicted entries are removed from
+        """
+        with self._lock:
+            if not any(other is memory for other in self._memories):
+                self._memories.append(memory)
+
+    def _ttl_for(self, fname):
+        if isinstance(self.ttl, dict):
+            return self.ttl.get(fname, None)
+        return self.ttl
+
+    def record(self, key, fname, size):
+        """
+        Records that an entry was saved, and then enforces the limits
+        """
+        import time
+        now = time.time()
+        index = self.index
+        with index._lock:
+            conn = index._connect()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                cursor = conn.execute(
+                    'UPDATE records SET size=?, accessed=? WHERE key=?',
+                    (size, now, key))
+                if cursor.rowcount == 0:
+                    # backends that do not write records to the index
+                    info = {'fname': fname, 'cfgstr': None, 'timestamp': now}
+                    conn.execute('INSERT ' + _INSERT_RECORD,
+                                 _make_record(key, info, size))
+        with self._lock:
+            # Expired entries are already missing when loaded, so they are
+            # only swept periodically instead of after every save
+            sweep = (self._last_sweep is None or
+                     now - self._last_sweep >= self.sweep_interval)
+        self.evict(keep=key, sweep=sweep)
+
+    def access(self, key, fname):
+        """
+        Records that an entry is loaded.
+
+        Returns:
+            bool: False if the entry expired, in which case it is evicted
+        """
+        import time
+        now = time.time()
+        ttl = self._ttl_for(fname)
+        index = self.index
+        with index._lock:
+            conn = index._connect()
+            expired = False
+            if ttl is not None:
+                row = conn.execute('SELECT timestamp FROM records WHERE key=?',
+                                   (key,)).fetchone()
+                if row is not None and row[0] < now - ttl:
+                    expired = True
+            if not expired:
+                conn.execute('UPDATE records SET accessed=? WHERE key=?',
+                             (now, key))
+        if expired:
+            self._evict_keys([key])
+            return False
+        return True
+
+    def forget(self, key):
+        """
+        Removes an entry from the index (but not from the backend)
+        """
+        index = self.index
+        with index._lock:
+            conn = index._connect(create=False)
+            if conn is not None:
+                conn.execute('DELETE FROM records WHERE key=?', (key,))
+
+    def info(self):
+        """
+        Returns:
+            dict: the total number of entries and bytes in the index
+        """
+        rows = self.index._query('SELECT entries, size FROM totals')
+        entries, size = rows[0] if rows else (0, 0)
+        return {'entries': entries, 'bytes': size}
+
+    def _evict_keys(self, keys):
+        for key in keys:
+            # the backend also removes the record from the index
+            self.backend.delete(key)
+            self.index.delete(key)
+            for memory in self._memories:
+                memory.pop(join(self.dpath, key))
+
+    def evict(self, keep=None, batchsize=64, sweep=True):
+        """
+        Evicts expired entries and then the least recently used entries
+        until the cache is within its limits.
+
+        Args:
+            keep (str): the key of an entry that is not evicted, even if it
+                alone exceeds the size limit.
+            batchsize (int): number of entries selected per query
+            sweep (bool): if False, expired entries are not evicted
+
+        Returns:
+            int: the number of evicted entries
+        """
+        import time
+        num = 0
+        # Expired entries
+        if sweep and self.ttl is not None:
+            now = time.time()
+            with self._lock:
+                self._last_sweep = now
+            if isinstance(self.ttl, dict):
+                conditions = [(fname, now - ttl)
+                              for fname, ttl in self.ttl.items()]
+            else:
+                conditions = [(None, now - self.ttl)]
+            for fname, cutoff in conditions:
+                if fname is None:
+                    rows = self.index._query(
+                        'SELECT key FROM records WHERE timestamp < ?',
+                        (cutoff,))
+                else:
+                    rows = self.index._query(
+                        'SELECT key FROM records WHERE fname=? AND '
+                        'timestamp < ?', (fname, cutoff))
+                keys = [key for key, in rows if key != keep]
+                self._evict_keys(keys)
+                num += len(keys)
+        # Least recently used entries
+        while True:
+            info = self.info()
+            excess_entries = excess_bytes = 0
+            if self.maxentries is not None:
+                excess_entries = info['entries'] - self.maxentries
+            if self.maxbytes is not None:
+                excess_bytes = info['bytes'] - self.maxbytes
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+            rows = self.index._query(
+                'SELECT key, size FROM records WHERE key != ? '
+                'ORDER BY accessed LIMIT ?', (keep or '', batchsize))
+            victims = []
+            for key, size in rows:
+                if excess_entries <= 0 and excess_bytes <= 0:
+                    break
+                victims.append(key)
+                excess_entries -= 1
+                excess_bytes -= size or 0
+            if not victims:
+                break
+            self._evict_keys(victims)
+            num += len(victims)
+        return num
+
+    def clear(self):
+        """
+        Evicts all entries in the index
+        """
+        rows = self.index._query('SELECT key FROM records')
+        self._evict_keys([key for key, in rows])
+
+
+class MemoryCache(object):
+    """
+    An in-process LRU layer in front of the disk cache of `Cacher`.
+
+    Entries are keyed by the full path of the cache entry and are bounded
+    by a byte budget. The size of an entry is the size of its serialized
+    data. A hit returns the previously loaded (or saved) object without any
+    I/O, so callers must not modify it. The layer is coherent with saves and
+    clears in this process, but not with changes made by other processes.
+
+    Counters of hits and misses for this layer and for the disk layer below
+    it are available via `info`.
+
+    Args:
+        maxbytes (int): the byte budget. Entries larger than this are not
+            kept in memory.
+
+    Example:
+        >>> self = MemoryCache(maxbytes=10)
+        >>> self.put('a', 'data-a', 4)
+        >>> self.put('b', 'data-b', 4)
+        >>> assert self.get('a') == (True, 'data-a')
+        >>> self.put('c', 'data-c', 4)  # evicts b, the least recently used
+        >>> assert self.get('b') == (False, None)
+        >>> assert self.info()['hits'] == 1 and self.info()['misses'] == 1
+        >>> assert self.info()['bytes'] == 8
+    """
+
+    def __init__(self, maxbytes=2 ** 28):
+        from collections import OrderedDict
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+    def get(self, key):
+        """
+        Returns:
+            Tuple[bool, object]: if the key was found and its value
+        """
+        with self._lock:
+            try:
+                value, nbytes = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return False, None
+            # reinsert to mark as most recently used
+            self._entries[key] = (value, nbytes)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value, nbytes):
+        """
+        Stores a value and evicts the least recently used entries that no
+        longer fit in the budget.
+        """
+        with self._lock:
+            self._pop(key)
+            if nbytes > self.maxbytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.maxbytes:
+                _, (_, old_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= old_nbytes
+
+    def count_disk(self, hit):
+        """
+        Counts a hit or miss of the disk layer below this one
+        """
+        with self._lock:
+            if hit:
+                self.disk_hits += 1
+            else:
+                self.disk_misses += 1
+
+    def _pop(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._nbytes -= item[1]
+
+    def pop(self, key):
+        """
+        Removes an entry if it exists
+        """
+        with self._lock:
+            self._pop(key)
+
+    def __contains__(self, key):
+        # Does not count as a hit or a miss
+        return key in self._entries
+
+    def clear(self):
+        """
+        Removes all entries (but does not reset the counters)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def info(self):
+        """
+        Returns:
+            dict: the hit and miss counters of the memory and disk layers,
+                and the number of entries and bytes in memory.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'disk_misses': self.disk_misses,
+                'entries': len(self._entries),
+                'bytes': self._nbytes,
+                'maxbytes': self.maxbytes,
+            }
+
+
+# The memory layer shared by all cachers created with memory=True
+_MEMORY_CACHE = MemoryCache()
+
+
+def _rectify_memory(memory):
+    if memory is None or memory is False:
+        return None
+    elif memory is True:
+        return _MEMORY_CACHE
+    elif isinstance(memory, MemoryCache):
+        return memory
+    else:
+        raise TypeError('memory must be a bool or MemoryCache, not {!r}'.format(
+            memory))
+
+
+class _BackgroundWriter(object):
+    """
+    Runs the writes of `Cacher(write_behind=True)` in a background thread.
+
+    Writes are queued in a bounded queue, so `submit` blocks while `maxsize`
+    writes are waiting. Until its write finishes, the data of an entry can be
+    retrieved with `get`. If an entry is submitted again before its previous
+    write started, only the newest data is written.
+
+    Example:
+        >>> writer = _BackgroundWriter()
+        >>> written = []
+        >>> writer.submit('key', lambda: written.append(1), 'data')
+        >>> writer.flush()
+        >>> assert written == [1]
+        >>> assert writer.get('key') == (False, None)
+    """
+
+    def __init__(self, maxsize=8):
+        from six.moves import queue
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._current = None
+        self._thread = None
+
+    def submit(self, key, write, data):
+        """
+        Queues `write`, which stores `data` as the entry `key`
+        """
+        token = object()
+        with self._cond:
+            self._pending[key] = (data, token)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='CacherWriter')
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((key, token, write))
+
+    def _run(self):
+        while True:
+            key, token, write = self._queue.get()
+            try:
+                with self._cond:
+                    pending = self._pending.get(key)
+                    if pending is None or pending[1] is not token:
+                        # The entry was saved again or cleared
+                        continue
+                    self._current = key
+                try:
+                    write()
+                except Exception as ex:
+                    warnings.warn('Background save of {} failed: {!r}'.format(
+                        key, ex), RuntimeWarning)
+                with self._cond:
+                    self._current = None
+                    pending = self._pending.get(key)
+                    if pending is not None and pending[1] is token:
+                        del self._pending[key]
+                    self._cond.notify_all()
+            finally:
+                self._queue.task_done()
+
+    def get(self, key):
+        """
+        Returns:
+            Tuple[bool, object]: a flag indicating if the write of `key` is
+                in flight, and its data
+        """
+        with self._cond:
+            pending = self._pending.get(key)
+        if pending is None:
+            return False, None
+        return True, pending[0]
+
+    def cancel(self, key):
+        """
+        Drops the in-flight write of `key`, or waits until it is written if
+        it already started
+        """
+        with self._cond:
+            self._pending.pop(key, None)
+            while self._current == key:
+                self._cond.wait()
+
+    def flush(self):
+        """
+        Waits until all queued writes are finished
+        """
+        self._queue.join()
+
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def _background_writer():
+    """
+    Returns the background writer of this process, which is flushed when the
+    interpreter exits.
+    """
+    global _WRITER
+    with _WRITER_LOCK:
+        # Threads do not survive a fork, so the child needs its own writer
+        if _WRITER is None or _WRITER.pid != os.getpid():
+            import atexit
+            _WRITER = _BackgroundWriter()
+            atexit.register(_WRITER.flush)
+    return _WRITER
+
+
+def _pending_write(fpath):
+    """
+    Returns the data of an in-flight background write of this process
+    """
+    writer = _WRITER
+    if writer is None or writer.pid != os.getpid():
+        return False, None
+    return writer.get(fpath)
+
+
+# Upper edges of the buckets of the timing histograms in seconds
+_HIST_EDGES = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1, 10, float('inf')]
+_HIST_LABELS = ['<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '<10s',
+                '>=10s']
+
+
+class CacheStats(object):
+    """
+    Collects per-name cache counters and timing histograms.
+
+    `Cacher` records events under its fname, and `memoize` and
+    `memoize_method` under the name of the function. The events are:
+        'hit' - data was found (for a Cacher, timed by the load)
+        'miss' - data was not found
+        'compute' - data was computed after a miss
+        'save' - a Cacher wrote data (with the number of bytes)
+
+    Collection is off by default. Use `ub.cache_stats(enable=True)` or set
+    the environment variable UBELT_CACHE_STATS=1 to turn it on.
+
+    Example:
+        >>> stats = CacheStats(enabled=True)
+        >>> stats.record('func', 'miss')
+        >>> stats.record('func', 'compute', 0.5)
+        >>> stats.record('func', 'save', 2e-3, nbytes=100)
+        >>> stats.record('func', 'hit', 1e-3)
+        >>> report = stats.report()['func']
+        >>> assert report['hits'] == 1 and report['misses'] == 1
+        >>> assert report['hit_rate'] == 0.5
+        >>> assert report['saved_bytes'] == 100
+        >>> assert report['compute']['hist']['<1s'] == 1
+        >>> assert not report['load_exceeds_compute']
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._names = {}
+
+    def record(self, name, event, seconds=None, nbytes=0):
+        """
+        Records an event. Does nothing unless the collector is enabled.
+
+        Args:
+            name (str): name of the cache
+            event (str): 'hit', 'miss', 'compute', or 'save'
+            seconds (float): time taken by the event, if known
+            nbytes (int): number of bytes involved in the event
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            try:
+                entry = self._names[name]
+            except KeyError:
+                entry = self._names[name] = {}
+            try:
+                counts = entry[event]
+            except KeyError:
+                counts = entry[event] = {
+                    'count': 0, 'bytes': 0, 'timed': 0, 'total': 0.0,
+                    'max': 0.0, 'hist': [0] * len(_HIST_EDGES)}
+            counts['count'] += 1
+            counts['bytes'] += nbytes
+            if seconds is not None:
+                counts['timed'] += 1
+                counts['total'] += seconds
+                counts['max'] = max(counts['max'], seconds)
+                for idx, edge in enumerate(_HIST_EDGES):
+                    if seconds < edge:
+                        counts['hist'][idx] += 1
+                        break
+
+    def reset(self):
+        """
+        Discards all recorded events
+        """
+        with self._lock:
+            self._names.clear()
+
+    @staticmethod
+    def _timing(counts):
+        import collections
+        if counts is None or counts['timed'] == 0:
+            return None
+        return collections.OrderedDict([
+            ('count', counts['timed']),
+            ('total', counts['total']),
+            ('mean', counts['total'] / counts['timed']),
+            ('max', counts['max']),
+            ('hist', collections.OrderedDict(
+                zip(_HIST_LABELS, counts['hist']))),
+        ])
+
+    def report(self):
+        """
+        Returns:
+            Dict[str, dict]: for each name, the number of hits and misses,
+                the hit rate, the number of saves and saved bytes, timing
+                summaries (count, total, mean, max, and histogram) of loads,
+                saves, and computations, and a flag that is True if loading
+                takes longer than computing on average.
+        """
+        import collections
+        with self._lock:
+            names = {name: {event: dict(counts, hist=list(counts['hist']))
+                            for event, counts in entry.items()}
+                     for name, entry in self._names.items()}
+        report = collections.OrderedDict()
+        for name in sorted(names):
+            entry = names[name]
+            hits = entry.get('hit', {}).get('count', 0)
+            misses = entry.get('miss', {}).get('count', 0)
+            load = self._timing(entry.get('hit'))
+            compute = self._timing(entry.get('compute'))
+            if load is None or compute is None:
+                slow = None
+            else:
+                slow = load['mean'] > compute['mean']
+            report[name] = collections.OrderedDict([
+                ('hits', hits),
+                ('misses', misses),
+                ('hit_rate', (hits / (hits + misses)
+                              if hits + misses else None)),
+                ('saves', entry.get('save', {}).get('count', 0)),
+                ('saved_bytes', entry.get('save', {}).get('bytes', 0)),
+                ('load', load),
+                ('save', self._timing(entry.get('save'))),
+                ('compute', compute),
+                ('load_exceeds_compute', slow),
+            ])
+        return report
+
+    def dump_json(self, fpath):
+        """
+        Writes the report to a json file
+        """
+        import json
+        with open(fpath, 'w') as file_:
+            json.dump(self.report(), file_, indent=4)
+
+
+_CACHE_STATS = CacheStats(
+    enabled=os.environ.get('UBELT_CACHE_STATS', '') not in ('', '0'))
+
+
+def cache_stats(enable=None, reset=False, fpath=None):
+    """
+    Reports the hits, misses, and timings of `Cacher`, `memoize`, and
+    `memoize_method` caches (see `CacheStats`).
+
+    Args:
+        enable (bool): if specified, turns the collection of stats on or off.
+            It is off by default, unless the environment variable
+            UBELT_CACHE_STATS is set to 1.
+        reset (bool): if True, discards the stats after reporting them
+        fpath (str): if specified, the report is also written to this path
+            as json
+
+    Returns:
+        Dict[str, dict]: the report of `CacheStats.report`, keyed by the
+            fname of a Cacher or the name of a memoized function.
+
+    Example:
+        >>> import ubelt as ub
+        >>> ub.cache_stats(enable=True, reset=True)
+        >>> cacher = ub.Cacher('test_cache_stats', 'cfg', verbose=0)
+        >>> cacher.clear()
+        >>> cacher.ensure(lambda: 'data')
+        >>> cacher.ensure(lambda: 'data')
+        >>> report = ub.cache_stats(enable=False, reset=True)
+        >>> stats = report['test_cache_stats']
+        >>> assert stats['hits'] == 1 and stats['misses'] == 1
+        >>> assert stats['saves'] == 1 and stats['saved_bytes'] > 0
+        >>> assert stats['compute']['count'] == 1
+    """
+    report = _CACHE_STATS.report()
+    if fpath is not None:
+        _CACHE_STATS.dump_json(fpath)
+    if reset:
+        _CACHE_STATS.reset()
+    if enable is not None:
+        _CACHE_STATS.enabled = enable
+    return report
+
+
+# The modification times of the directories of cachers that were
+# reconciled with the index, keyed by (dpath, fname, ext)
+_RECONCILED_MTIMES = {}
+
+
+@contextlib.contextmanager
+def _null_context():
+    yield
 
 
 class Cacher(object):
@@ -28,7 +1731,22 @@ class Cacher(object):
             Specifies a folder in the application resource directory where to
             cache the data if dpath is not specified.
 
-        ext (str): extension (default = '.pkl')
+        ext (str): extension, which also determines the serialization
+            format (default = '.pkl'):
+                '.npy' - a single ndarray, which is loaded as a read-only
+                    memory map when possible.
+                '.npz' - a dictionary of ndarrays.
+                '.json' - json compatible data.
+                '.pkl5' - pickle protocol 5 with out-of-band buffers, which
+                    lets ndarrays inside arbitrary data be memory mapped
+                    on load (requires python 3.8).
+                Any other extension uses pickle with `protocol`. A
+                compression suffix can be appended to any of these:
+                '.gz' (zlib), '.xz' (lzma), or '.zst' (zstd, requires the
+                zstandard module), e.g. '.pkl.gz'. Older versions of
+                ubelt pickled every entry regardless of the extension.
+                Such entries are still loaded with pickle, and entries
+                that cannot be decoded at all are treated as missing.
 
         meta (object): cfgstr metadata that is also saved with the cfgstr.
             This data is not used in the hash, but if useful to send in if the
@@ -46,6 +1764,47 @@ class Cacher(object):
             compatibility is not required, then it is better to use protocol 4.
             (default=2)
 
+        hasher (str): name of the hash algorithm used to condense long cfgstrs.
+            Any key accepted by `ub.hash_data` works (e.g. 'xxh64' or 'fast'),
+            but changing it changes the cache filenames. (default='sha256')
+
+        backend (str | CacheBackend): where entries are stored. Either
+            'file', which writes each entry to its own file in `dpath`,
+            'sqlite', which stores all entries of `dpath` in its sqlite
+            index, or a custom `CacheBackend` instance. (default='file')
+
+        lock (bool): if True, `ensure` holds a file lock while it computes
+            a missing entry, so concurrent workers (threads or processes)
+            that ensure the same cfgstr compute it only once. The others
+            wait and then load the result. Entries are mapped onto a fixed
+            set of 64 lock files in a `.locks` subdirectory of `dpath`, so
+            unrelated entries occasionally wait for each other. An `ensure`
+            nested in the computation of another does not lock, which
+            avoids deadlocks between stripes. (default=True)
+
+        manager (CacheManager): if specified, the index of `dpath` records
+            when entries are saved and loaded, and the manager
+            evicts entries to enforce its size and age limits. If `dpath` or
+            `backend` are unspecified, those of the manager are used.
+            Loads from the `memory` layer are also checked and recorded by
+            the manager, and entries it evicts are removed from the layer.
+
+        memory (bool | MemoryCache): if True, loaded and saved data is also
+            kept in a process-wide in-memory LRU layer (256 MiB), so repeated
+            loads in this process do not read or deserialize the entry
+            again. A `MemoryCache` instance can be given to use a separate
+            budget. Loaded objects are shared between callers, so they
+            must not be modified. (default=False)
+
+        write_behind (bool): if True, `save` (and therefore `ensure`) hands
+            the data to a background writer thread and returns immediately.
+            Until it is written, the data is returned by `load` in this
+            process. At most 8 writes are queued, after which saves block.
+            Pending writes are finished when the interpreter exits, or by
+            calling `flush`. Saved data must not be modified, and the lock
+            of `ensure` is released before the data is written.
+            (default=False)
+
     CommandLine:
         python -m ubelt.util_cache Cacher
 
@@ -78,15 +1837,31 @@ class Cacher(object):
         >>>     myvar = ('result of expensive process', 'another result')
         >>>     cacher.save(myvar)
         >>> assert cacher.exists(), 'should now exist'
+
+    Example:
+        >>> # Many small entries can be stored in a single database
+        >>> from ubelt.util_cache import Cacher
+        >>> cacher = Cacher('test_sqlite', 'cfg1', backend='sqlite')
+        >>> cacher.save({'small': 'data'})
+        >>> assert cacher.load() == {'small': 'data'}
+        >>> assert cacher.get_fpath() in list(cacher.existing_versions())
+        >>> cacher.clear()
+        >>> assert not cacher.exists()
     """
     VERBOSE = 1  # default verbosity
 
     def __init__(self, fname, cfgstr=None, dpath=None, appname='ubelt',
                  ext='.pkl', meta=None, verbose=None, enabled=True, log=None,
-                 protocol=2):
+                 protocol=2, hasher='sha256', backend=None, lock=True,
+                 manager=None, memory=False, write_behind=False):
         import ubelt as ub
         if verbose is None:
             verbose = self.VERBOSE
+        if manager is not None:
+            if dpath is None:
+                dpath = manager.dpath
+            if backend is None:
+                backend = manager.backend
         if dpath is None:  # pragma: no branch
             dpath = ub.ensure_app_cache_dir(appname)
         ub.ensuredir(dpath)
@@ -98,6 +1873,15 @@ class Cacher(object):
         self.meta = meta
         self.enabled = enabled
         self.protocol = protocol
+        self.hasher = hasher
+        self.backend = _rectify_backend(backend, dpath)
+        self.serializer = _rectify_serializer(ext, protocol)
+        self.lock = lock
+        self.manager = manager
+        self.memory = _rectify_memory(memory)
+        if manager is not None and self.memory is not None:
+            manager._track_memory(self.memory)
+        self.write_behind = write_behind
         self.log = print if log is None else log
 
         if len(self.ext) > 0 and self.ext[0] != '.':
@@ -118,7 +1902,7 @@ class Cacher(object):
         max_len = 32
         hashlen = 32
         if len(cfgstr) > max_len:
-            hasher = hashlib.sha256()
+            hasher = util_hash._rectify_hasher(self.hasher)()
             hasher.update(cfgstr.encode('utf8'))
             hashed_cfgstr = hasher.hexdigest()[:hashlen]
             condensed = hashed_cfgstr
@@ -126,6 +1910,13 @@ class Cacher(object):
             condensed = cfgstr
         return condensed
 
+    def _get_key(self, cfgstr=None):
+        """
+        The key of the entry in the backend, which is the file name
+        """
+        condensed = self._condense_cfgstr(cfgstr)
+        return '{}_{}{}'.format(self.fname, condensed, self.ext)
+
     def get_fpath(self, cfgstr=None):
         """
         Reports the filepath that the cacher will use.
@@ -143,8 +1934,7 @@ class Cacher(object):
             >>> self = Cacher('test_cacher3', cfgstr='cfg1' * 32)
             >>> self.get_fpath()
         """
-        condensed = self._condense_cfgstr(cfgstr)
-        fname_cfgstr = '{}_{}{}'.format(self.fname, condensed, self.ext)
+        fname_cfgstr = self._get_key(cfgstr)
         fpath = join(self.dpath, fname_cfgstr)
         fpath = normpath(fpath)
         return fpath
@@ -153,13 +1943,21 @@ class Cacher(object):
         """
         Check to see if the cache exists
         """
-        return exists(self.get_fpath())
+        if _pending_write(self.get_fpath(cfgstr))[0]:
+            return True
+        return self.backend.exists(self._get_key(cfgstr))
 
     def existing_versions(self):
         """
         Returns data with different cfgstr values that were previously computed
         with this cacher.
 
+        The versions are listed from the metadata index of the directory.
+        When the directory changed since it was last checked, the index is
+        first reconciled with it (see `reconcile`), so files that were
+        written without the index (e.g. by older versions of ubelt) are
+        listed as well.
+
         Example:
             >>> from ubelt.util_cache import Cacher
             >>> # Ensure that some data exists
@@ -180,28 +1978,128 @@ class Cacher(object):
 
             ['versioned_data_1.pkl', 'versioned_data_2.pkl']
         """
-        import glob
-        pattern = join(self.dpath, self.fname + '_*' + self.ext)
-        for fname in glob.iglob(pattern):
-            data_fpath = join(self.dpath, fname)
-            yield data_fpath
+        self._auto_reconcile()
+        for key in self.backend.keys(self.fname, self.ext):
+            # The index may list entries that were deleted by other programs
+            if self.backend.exists(key):
+                data_fpath = join(self.dpath, key)
+                yield data_fpath
+
+    def _auto_reconcile(self):
+        """
+        Calls `reconcile` if the directory was modified since the last call
+        in this process (or ever was).
+        """
+        import time
+        try:
+            mtime = os.stat(self.dpath).st_mtime
+        except OSError:  # nocover
+            return
+        key = (normpath(self.dpath), self.fname, self.ext)
+        if _RECONCILED_MTIMES.get(key) != mtime:
+            self.reconcile()
+            # Changes within the resolution of the modification time
+            # could be missed, so recent times are checked again
+            if time.time() - mtime > 2:
+                _RECONCILED_MTIMES[key] = mtime
+
+    def reconcile(self):
+        """
+        Synchronizes the metadata index with the saved versions of this fname
+        and ext. Records are added for files that were written without the
+        index (e.g. by older versions of ubelt), and records of deleted files
+        are removed. This happens automatically when versions or records are
+        listed after the directory changed.
+
+        Returns:
+            Dict[str, int]: the number of added and removed records
+
+        Example:
+            >>> import os
+            >>> from ubelt.util_cache import Cacher
+            >>> cacher = Cacher('test_reconcile', cfgstr='1')
+            >>> cacher.save('data')
+            >>> os.remove(cacher.get_fpath())
+            >>> info = cacher.reconcile()
+            >>> assert info['removed'] == 1
+            >>> assert cacher.records() == []
+        """
+        return self.backend.reconcile(self.fname, self.ext)
+
+    def records(self):
+        """
+        Returns the metadata records of all saved versions of this fname and
+        ext, ordered by the time they were saved. They are read from the
+        index of the cache directory in a single query.
+
+        Returns:
+            List[dict]: see `CacheBackend.records`. Each record also contains
+                the fpath of the entry.
+
+        Example:
+            >>> from ubelt.util_cache import Cacher
+            >>> cacher = Cacher('test_records', cfgstr='1', meta={'a': 1})
+            >>> cacher.clear()
+            >>> cacher.ensure(lambda: 'data1')
+            >>> record = [r for r in cacher.records() if r['cfgstr'] == '1'][0]
+            >>> assert record['meta'] == {'a': 1}
+            >>> assert record['size'] > 0
+            >>> assert record['duration'] is not None
+            >>> assert record['fpath'] == cacher.get_fpath()
+        """
+        self._auto_reconcile()
+        records = [r for r in self.backend.records(self.fname)
+                   if r['key'].endswith(self.ext) and
+                   self.backend.exists(r['key'])]
+        for record in records:
+            record['fpath'] = join(self.dpath, record['key'])
+        return sorted(records, key=lambda r: r['timestamp'])
+
+    def stats(self):
+        """
+        Summarizes the saved versions of this fname and ext
+
+        Returns:
+            dict: the number of entries, their total size in bytes, the total
+                time that was spent computing them, and the time the oldest
+                and newest entry was saved.
+
+        Example:
+            >>> from ubelt.util_cache import Cacher
+            >>> cacher = Cacher('test_stats', cfgstr='1')
+            >>> cacher.clear()
+            >>> cacher.ensure(lambda: 'data1')
+            >>> stats = cacher.stats()
+            >>> assert stats['entries'] >= 1 and stats['bytes'] > 0
+        """
+        records = self.records()
+        durations = [r['duration'] for r in records
+                     if r['duration'] is not None]
+        timestamps = [r['timestamp'] for r in records]
+        return {
+            'entries': len(records),
+            'bytes': sum(r['size'] or 0 for r in records),
+            'duration': sum(durations),
+            'oldest': min(timestamps) if timestamps else None,
+            'newest': max(timestamps) if timestamps else None,
+        }
 
     def clear(self, cfgstr=None):
         """
         Removes the saved cache and metadata from disk
         """
         data_fpath = self.get_fpath(cfgstr)
+        key = self._get_key(cfgstr)
+        if _WRITER is not None and _WRITER.pid == os.getpid():
+            _WRITER.cancel(data_fpath)
+        if self.memory is not None:
+            self.memory.pop(data_fpath)
         if self.verbose > 0:
             self.log('[cacher] clear cache')
-        if exists(data_fpath):
+        if self.backend.exists(key):
             if self.verbose > 0:
                 self.log('[cacher] removing {}'.format(data_fpath))
-            os.remove(data_fpath)
-
-            # Remove the metadata if it exists
-            meta_fpath = data_fpath + '.meta'
-            if exists(meta_fpath):
-                os.remove(meta_fpath)
+            self.backend.delete(key)
         else:
             if self.verbose > 0:
                 self.log('[cacher] ... nothing to clear')
@@ -251,9 +2149,18 @@ class Cacher(object):
             >>> assert cacher.tryload() is None
         """
         cfgstr = self._rectify_cfgstr(cfgstr)
+        if not _CACHE_STATS.enabled:
+            return self._load(cfgstr)
+        start = default_timer()
+        try:
+            data = self._load(cfgstr)
+        except IOError:
+            _CACHE_STATS.record(self.fname, 'miss')
+            raise
+        _CACHE_STATS.record(self.fname, 'hit', default_timer() - start)
+        return data
 
-        dpath = self.dpath
-        fname = self.fname
+    def _load(self, cfgstr):
         verbose = self.verbose
 
         if not self.enabled:
@@ -262,8 +2169,46 @@ class Cacher(object):
             raise IOError(3, 'Cache Loading Is Disabled')
 
         fpath = self.get_fpath(cfgstr=cfgstr)
+        key = self._get_key(cfgstr)
 
-        if not exists(fpath):
+        found, data = _pending_write(fpath)
+        if found:
+            if verbose > 1:
+                self.log('[cacher] ... pending write hit')
+            return data
+
+        if self.memory is not None:
+            if self.manager is not None and fpath in self.memory:
+                # The manager decides if the entry expired and tracks its use
+                if not self.manager.access(key, self.fname):
+                    if verbose > 2:
+                        self.log('[cacher] ... cache expired: '
+                                 'fname={}'.format(self.fname))
+                    raise IOError(2, 'Expired cache entry: %r' % (fpath,))
+            found, data = self.memory.get(fpath)
+            if found:
+                if verbose > 1:
+                    self.log('[cacher] ... memory cache hit')
+                return data
+            try:
+                data = self._load_from_backend(key, fpath, cfgstr)
+            except IOError:
+                self.memory.count_disk(hit=False)
+                raise
+            self.memory.count_disk(hit=True)
+            self.memory.put(fpath, data, self.backend.size(key))
+            return data
+        return self._load_from_backend(key, fpath, cfgstr)
+
+    def _load_from_backend(self, key, fpath, cfgstr):
+        """
+        Loads and deserializes an entry from the backend
+        """
+        dpath = self.dpath
+        fname = self.fname
+        verbose = self.verbose
+
+        if not self.backend.exists(key):
             if verbose > 2:
                 self.log('[cacher] ... cache does not exist: '
                          'dpath={} fname={} cfgstr={}'.format(
@@ -274,16 +2219,31 @@ class Cacher(object):
                 self.log('[cacher] ... cache exists: '
                          'dpath={} fname={} cfgstr={}'.format(
                              basename(dpath), fname, cfgstr))
+        if self.manager is not None and not self.manager.access(key, fname):
+            if verbose > 2:
+                self.log('[cacher] ... cache expired: fname={}'.format(fname))
+            raise IOError(2, 'Expired cache entry: %r' % (fpath,))
+        legacy = type(self.serializer) is not _PickleSerializer
         try:
-            with open(fpath, 'rb') as file_:
-                data = pickle.load(file_)
+            data = self._deserialize(key, self.serializer)
         except Exception as ex:
+            if legacy:
+                # Entries written before serializers were chosen by the
+                # extension are pickles, regardless of the extension.
+                try:
+                    data = self._deserialize(key, _PickleSerializer())
+                except Exception:
+                    pass
+                else:
+                    if verbose > 1:
+                        self.log('[cacher] ... legacy pickle cache hit')
+                    return data
             if verbose > 0:
                 self.log('CORRUPTED? fpath = %s' % (fpath,))
             if verbose > 1:
                 self.log('[cacher] ... CORRUPTED? dpath={} cfgstr={}'.format(
                     basename(dpath), cfgstr))
-            if isinstance(ex, (EOFError, IOError, ImportError)):
+            if legacy or isinstance(ex, (EOFError, IOError, ImportError)):
                 raise IOError(str(ex))
             else:
                 if verbose > 1:
@@ -296,12 +2256,20 @@ class Cacher(object):
                 self.log('[cacher] ... cache hit')
         return data
 
+    def _deserialize(self, key, serializer):
+        local_fpath = self.backend.local_path(key)
+        if local_fpath is not None:
+            return serializer.load_path(local_fpath)
+        else:
+            with self.backend.open_read(key) as file_:
+                return serializer.load(file_)
+
     def save(self, data, cfgstr=None):
         """
         Writes data to path specified by `self.fpath(cfgstr)`.
 
-        Metadata containing information about the cache will also be appended
-        to an adjacent file with the `.meta` suffix.
+        A metadata record of the entry (see `records`) is also stored in the
+        index of the cache directory.
 
         Example:
             >>> from ubelt.util_cache import *  # NOQA
@@ -310,17 +2278,23 @@ class Cacher(object):
             >>> cacher = Cacher('test_enabled_save', cfgstr)
             >>> cacher.save('data')
             >>> assert exists(cacher.get_fpath()), 'should be enabeled'
-            >>> assert exists(cacher.get_fpath() + '.meta'), 'missing metadata'
+            >>> record = cacher.records()[0]
+            >>> assert record['cfgstr'] == cfgstr, 'missing metadata'
             >>> # Setting the cacher as enabled=False turns it off
             >>> cacher2 = Cacher('test_disabled_save', 'params', enabled=False)
             >>> cacher2.save('data')
             >>> assert not exists(cacher2.get_fpath()), 'should be disabled'
         """
+        self._save(data, cfgstr)
+
+    def _save(self, data, cfgstr=None, duration=None):
         import ubelt as ub
+        import time
         if not self.enabled:
             return
         if self.verbose > 0:
-            self.log('[cacher] ... {} cache save'.format(self.fname))
+            self.log('[cacher] ... {} cache save{}'.format(
+                self.fname, ' (background)' if self.write_behind else ''))
 
         cfgstr = self._rectify_cfgstr(cfgstr)
         condensed = self._condense_cfgstr(cfgstr)
@@ -328,21 +2302,58 @@ class Cacher(object):
         # Make sure the cache directory exists
         ub.ensuredir(self.dpath)
 
-        data_fpath = self.get_fpath(cfgstr=cfgstr)
-        meta_fpath = data_fpath + '.meta'
+        key = self._get_key(cfgstr)
+        info = {
+            'fname': self.fname,
+            'cfgstr': cfgstr,
+            'condensed': condensed,
+            'timestamp': time.time(),
+            'duration': duration,
+            'hasher': self.hasher,
+            'version': ub.__version__,
+            'hash_version': util_hash.HASH_VERSION,
+            'meta': self.meta,
+        }
+        fpath = self.get_fpath(cfgstr)
+        if self.write_behind:
+            write = functools.partial(self._write, key, fpath, data, info)
+            _background_writer().submit(fpath, write, data)
+        else:
+            self._write(key, fpath, data, info)
 
-        # Also save metadata file to reconstruct hashing
-        with open(meta_fpath, 'a') as file_:
-            # TODO: maybe append this in json format?
-            file_.write('\n\nsaving {}\n'.format(ub.timestamp()))
-            file_.write(self.fname + '\n')
-            file_.write(condensed + '\n')
-            file_.write(cfgstr + '\n')
-            file_.write(str(self.meta) + '\n')
+    def _write(self, key, fpath, data, info):
+        start = default_timer()
+        size = self.backend.write(
+            key, functools.partial(self.serializer.dump, data), info)
+        if _CACHE_STATS.enabled:
+            if size is None:
+                size = self.backend.size(key)
+            _CACHE_STATS.record(self.fname, 'save', default_timer() - start,
+                                nbytes=size)
+        if self.manager is not None or self.memory is not None:
+            if size is None:
+                size = self.backend.size(key)
+            if self.manager is not None:
+                self.manager.record(key, self.fname, size)
+            if self.memory is not None:
+                self.memory.put(fpath, data, size)
+
+    def flush(self):
+        """
+        Waits until the background writes of this process are finished (see
+        `write_behind`).
 
-        with open(data_fpath, 'wb') as file_:
-            # Use protocol 2 to support python2 and 3
-            pickle.dump(data, file_, protocol=self.protocol)
+        Example:
+            >>> from ubelt.util_cache import *  # NOQA
+            >>> cacher = Cacher('test_write_behind', 'cfg', write_behind=True)
+            >>> cacher.save('data')
+            >>> assert cacher.load() == 'data'
+            >>> cacher.flush()
+            >>> assert exists(cacher.get_fpath())
+            >>> cacher.clear()
+        """
+        if _WRITER is not None and _WRITER.pid == os.getpid():
+            _WRITER.flush()
 
     def ensure(self, func, *args, **kwargs):
         r"""
@@ -367,17 +2378,50 @@ class Cacher(object):
             >>> assert data1 == data2
             >>> cacher.clear()
         """
-        data = self.tryload()
+        return self._ensure(None, func, args, kwargs)
+
+    def _ensure(self, cfgstr, func, args, kwargs):
+        data = self.tryload(cfgstr)
         if data is None:
-            data = func(*args, **kwargs)
-            self.save(data)
+            with self._lock(cfgstr):
+                # Another worker may have saved the data while we waited.
+                # This is not counted as another load in the stats.
+                try:
+                    data = self._load(self._rectify_cfgstr(cfgstr))
+                except IOError:
+                    data = None
+                if data is None:
+                    start = default_timer()
+                    data = func(*args, **kwargs)
+                    duration = default_timer() - start
+                    _CACHE_STATS.record(self.fname, 'compute', duration)
+                    self._save(data, cfgstr, duration)
         return data
 
+    def _lock(self, cfgstr=None):
+        """
+        Returns a context manager that holds the lock for an entry
+        """
+        if not self.lock or not self.enabled:
+            return _null_context()
+        if getattr(_LOCK_STATE, 'held', False):
+            # This thread already holds a stripe, and taking a second one
+            # could deadlock with a thread that nests in the other order.
+            return _null_context()
+        import ubelt as ub
+        import zlib
+        key = self._get_key(cfgstr)
+        stripe = zlib.crc32(key.encode('utf8')) % _NUM_LOCK_STRIPES
+        lock_dpath = ub.ensuredir(join(self.dpath, '.locks'))
+        lock_fname = 'stripe_{:02d}.lock'.format(stripe)
+        return _held_lock(join(lock_dpath, lock_fname))
+
     def __call__(self, func):
         """
         Allows Cacher to be used as a decorator for functions with no
         arguments. This mode of usage has much less control than others, so it
-        is only recommended for the simplest of cases.
+        is only recommended for the simplest of cases. Use `memoize_disk`
+        to cache functions with arguments.
 
         Args:
             func (Function): function to decorate. Must have no arguments.
@@ -404,6 +2448,197 @@ class Cacher(object):
         return _wrapper
 
 
+_SCALAR_TYPES = (bool, float, type(None)) + six.integer_types + six.string_types
+_SAFE_CFGSTR = re.compile(r"^[\w.,='+-]*$")
+
+
+def _make_binder(func):
+    """
+    Returns a function that maps the arguments of a call to `func` to a list
+    of (name, value) pairs sorted by name, with defaults applied. Entries of
+    a `**kwargs` parameter are treated like regular keyword arguments.
+    """
+    if six.PY2:  # nocover
+        varkw = inspect.getargspec(func).keywords
+
+        def _bind(args, kwargs):
+            return inspect.getcallargs(func, *args, **kwargs)
+    else:
+        sig = inspect.signature(func)
+        varkw = None
+        for param in sig.parameters.values():
+            if param.kind == param.VAR_KEYWORD:
+                varkw = param.name
+
+        def _bind(args, kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return dict(bound.arguments)
+
+    def binder(args, kwargs):
+        bound = _bind(args, kwargs)
+        if varkw is not None:
+            bound.update(bound.pop(varkw))
+        return sorted(bound.items())
+    return binder
+
+
+def _items_cfgstr(items, hasher='sha256'):
+    """
+    Builds a cfgstr from (name, value) pairs. Short scalars are written out
+    as a readable 'name=value' list, anything else is hashed with `hash_data`.
+
+    Example:
+        >>> from ubelt.util_cache import _items_cfgstr
+        >>> _items_cfgstr([('a', 1), ('b', 2.5), ('c', None)])
+        'a=1,b=2.5,c=None'
+        >>> cfgstr = _items_cfgstr([('a', [1, 2, 3])])
+        >>> assert cfgstr.isalpha()
+        >>> # values that are unsafe in a file name are hashed as well
+        >>> assert _items_cfgstr([('a', '../b')]) != _items_cfgstr([('a', '../c')])
+        >>> assert '/' not in _items_cfgstr([('a', '../b')])
+    """
+    if all(type(value) in _SCALAR_TYPES for _, value in items):
+        cfgstr = ','.join('{}={!r}'.format(name, value)
+                          for name, value in items)
+        if len(cfgstr) <= 64 and _SAFE_CFGSTR.match(cfgstr):
+            return cfgstr
+    return util_hash.hash_data(items, hasher=hasher)
+
+
+def _unique_func_name(func):
+    """
+    Returns the module and qualified name of a function, which identifies it
+    unless it is nested in another function or is a lambda.
+
+    Example:
+        >>> from ubelt.util_cache import _unique_func_name
+        >>> _unique_func_name(Cacher.save)
+        'ubelt.util_cache.Cacher.save'
+        >>> import pytest
+        >>> with pytest.raises(ValueError):
+        >>>     _unique_func_name(lambda: None)
+    """
+    # Python 2 functions do not know the class they are defined in
+    name = getattr(func, '__qualname__', func.__name__)
+    if '<' in name:
+        raise ValueError(
+            'Cannot make a unique fname for {!r}. Pass fname '
+            'explicitly'.format(name))
+    return '{}.{}'.format(func.__module__, name)
+
+
+def _pickles_objects(serializer):
+    """
+    Returns True if the serializer can store arbitrary objects
+    """
+    if isinstance(serializer, _CompressedSerializer):
+        serializer = serializer.serializer
+    return isinstance(serializer, _PickleSerializer)
+
+
+def memoize_disk(func=None, fname=None, include=None, exclude=None,
+                 depends=None, **kwargs):
+    """
+    Decorator that caches the results of a function on disk using a
+    `Cacher`. The cfgstr of each call is derived from its arguments.
+
+    The arguments of each call are bound to the function signature (so
+    positional, keyword, and default values are treated the same). If all
+    of them are short scalars (None, bool, int, float, and str), the cfgstr
+    is the readable 'name=value' list. Otherwise it is the `ub.hash_data` of
+    the arguments, so every argument must be hashable by `ub.hash_data`.
+
+    Results of None are cached as well if the serializer of `ext` is pickle
+    based. Other serializers (e.g. '.json') cannot store them, so functions
+    that return None are called again.
+
+    Args:
+        func (Function): function to decorate.
+
+        fname (str): the fname of the cacher. Defaults to the module and
+            qualified name of the function (e.g. 'mod.Class.method'). It
+            must be given for nested functions and lambdas (and for methods
+            on python 2), whose names are not unique.
+
+        include (List[str]): if specified, only these arguments are used
+            in the cfgstr.
+
+        exclude (List[str]): arguments that are not used in the cfgstr.
+            Use this for arguments that do not change the result (e.g.
+            verbosity) or that cannot be hashed (e.g. `self`).
+
+        depends (object): a version token that is part of every cfgstr.
+            Change it when the implementation of the function changes to
+            invalidate the old results. Any data `ub.hash_data` accepts can
+            be used.
+
+        **kwargs: passed to `Cacher` (e.g. dpath, appname, ext, backend,
+            manager, memory). The verbosity defaults to 0.
+
+    Returns:
+        Function: the wrapped function. Its `cacher` attribute is the
+            underlying `Cacher`, and its `cfgstr` attribute computes the
+            cfgstr of a call without running it.
+
+    Example:
+        >>> from ubelt.util_cache import *  # NOQA
+        >>> import ubelt as ub
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_memoize_disk')
+        >>> calls = []
+        >>> @memoize_disk(dpath=dpath, exclude=['verbose'], depends='v1')
+        >>> def func(a, b=2, verbose=0):
+        >>>     calls.append((a, b))
+        >>>     return a + b
+        >>> func.cacher.clear(func.cfgstr(1))
+        >>> assert func(1) == 3
+        >>> assert func(1, b=2, verbose=1) == 3
+        >>> assert func(a=1) == 3
+        >>> assert calls == [(1, 2)]
+        >>> print(func.cfgstr(1))
+        _depends='v1',a=1,b=2
+        >>> # non-scalar arguments are hashed
+        >>> assert func.cfgstr([1, 2], b=[3]).isalpha()
+    """
+    if func is None:
+        return functools.partial(memoize_disk, fname=fname, include=include,
+                                 exclude=exclude, depends=depends, **kwargs)
+    if include is not None and exclude is not None:
+        raise ValueError('Specify at most one of include and exclude')
+    if fname is None:
+        fname = _unique_func_name(func)
+    kwargs.setdefault('verbose', 0)
+    cacher = Cacher(fname, **kwargs)
+    # Pickle can store a sentinel for None, which would otherwise be a miss
+    store_none = _pickles_objects(cacher.serializer)
+
+    def _call(*args, **kw):
+        result = func(*args, **kw)
+        if result is None and store_none:
+            return NoParam
+        return result
+    binder = _make_binder(func)
+    include = None if include is None else set(include)
+    exclude = set() if exclude is None else set(exclude)
+
+    def _cfgstr(*args, **kw):
+        items = [(name, value) for name, value in binder(args, kw)
+                 if name not in exclude and
+                 (include is None or name in include)]
+        if depends is not None:
+            items.insert(0, ('_depends', depends))
+        return _items_cfgstr(items, hasher=cacher.hasher)
+
+    @functools.wraps(func)
+    def _wrapper(*args, **kw):
+        cfgstr = _cfgstr(*args, **kw)
+        data = cacher._ensure(cfgstr, _call, args, kw)
+        return None if data is NoParam else data
+    _wrapper.cacher = cacher
+    _wrapper.cfgstr = _cfgstr
+    return _wrapper
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
@@ -9,16 +9,23 @@ NOTE:
     future. When this happens the `HASH_VERSION` attribute will be incremented.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
+import base64
+import binascii
+import functools
 import hashlib
+import os
 import six
+import sys
+import threading
 import uuid
 import math
+import weakref
 from collections import OrderedDict
 from six.moves import zip
 # we will use NoParam instead of None because None is a valid hashlen setting
 from ubelt.util_const import NoParam
 
-__all__ = ['hash_data', 'hash_file']
+__all__ = ['Hasher', 'hash_data', 'hash_file', 'hash_files']
 
 HASH_VERSION = 1  # incremented when we make a change that modifies hashes
 
@@ -31,6 +38,15 @@ _ALPHABET_26 = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j',
                 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 't',
                 'u', 'v', 'w', 'x', 'y', 'z']
 
+# RFC 4648 base32 (lowercase) and url-safe base64 alphabets. Digests are
+# encoded with these using the bitwise RFC 4648 encodings.
+_ALPHABET_32 = _ALPHABET_26 + ['2', '3', '4', '5', '6', '7']
+
+_ALPHABET_36 = _ALPHABET_10 + _ALPHABET_26
+
+_ALPHABET_64 = ([c.upper() for c in _ALPHABET_26] + _ALPHABET_26 +
+                _ALPHABET_10 + ['-', '_'])
+
 if six.PY2:
     _stringlike = (basestring, bytes)  # NOQA
     _intlike = (int, long)  # NOQA
@@ -43,6 +59,11 @@ else:
 DEFAULT_ALPHABET = _ALPHABET_26
 DEFAULT_HASHER = hashlib.sha512  # note: using sha1 is a bit faster
 DEFAULT_HASHLEN = None
+DEFAULT_CHUNKSIZE = 2 ** 24  # suggested leaf size for tree hashing of files
+DEFAULT_ITEM_CHUNKSIZE = 2 ** 12  # suggested leaf size for tree hashed lists
+# Default number of evenly spaced samples and the number of bytes in each
+# sample that are hashed in fingerprint mode.
+DEFAULT_FINGERPRINT = (64, 2 ** 12)
 
 
 if six.PY2:
@@ -120,6 +141,71 @@ else:
         return int_
 
 
+# Non-hashlib hash algorithms that can be selected by name. These are mostly
+# fast non-cryptographic hashes, which are appropriate for content addressing
+# but not for security. Each value is a callable returning an object with the
+# hashlib ``update`` / ``digest`` / ``hexdigest`` interface.
+_HASHERS = OrderedDict()
+
+# In order of preference, the names that the 'fast' hasher will resolve to.
+_FAST_HASHER_PREFERENCE = ['xxh3_64', 'xxh64', 'blake3', 'blake2b', 'sha1']
+
+
+def _register_hasher(name, hasher):
+    """
+    Makes a hash algorithm available by name to `hash_data` and `hash_file`.
+
+    Args:
+        name (str): key used to select this algorithm
+        hasher (callable): returns a new instance with a hashlib-like API
+
+    Example:
+        >>> _register_hasher('_demo_md5', hashlib.md5)
+        >>> assert _rectify_hasher('_demo_md5') is hashlib.md5
+        >>> del _HASHERS['_demo_md5']
+    """
+    _HASHERS[name] = hasher
+    return hasher
+
+
+try:
+    import xxhash
+except ImportError:  # nocover
+    xxhash = None
+else:
+    for _name in ['xxh32', 'xxh64', 'xxh3_64', 'xxh3_128', 'xxh128']:
+        if hasattr(xxhash, _name):
+            _register_hasher(_name, getattr(xxhash, _name))
+    del _name
+
+try:
+    import blake3
+except ImportError:  # nocover
+    blake3 = None
+else:
+    _register_hasher('blake3', blake3.blake3)
+
+if hasattr(hashlib, 'blake2b'):
+    # blake2b is in the standard library for Python 3.6+. On CPUs without
+    # SHA hardware extensions it is faster than sha512, and it makes a good
+    # choice when third party libraries are missing.
+    _register_hasher('blake2b', hashlib.blake2b)
+
+
+def _fast_hasher():
+    """
+    Returns the fastest registered hasher, falling back to sha1.
+
+    Example:
+        >>> hasher = _fast_hasher()
+        >>> assert hasattr(hasher(), 'hexdigest')
+    """
+    for name in _FAST_HASHER_PREFERENCE:
+        if name in _HASHERS:
+            return _HASHERS[name]
+    return hashlib.sha1
+
+
 def _rectify_hasher(hasher):
     """
     Convert a string-based key into a hasher class
@@ -128,9 +214,11 @@ def _rectify_hasher(hasher):
         In terms of speed on 64bit systems, sha1 is the fastest followed by md5
         and sha512. The slowest algorithm is sha256.
 
-    TODO:
-        - [ ]: Should we optionally incorporate xxHash algorithms, which
-               are much faster than hashlib algorithms.
+        Non-cryptographic algorithms such as xxHash (``pip install xxhash``)
+        or blake3 (``pip install blake3``) are much faster than hashlib
+        algorithms. If installed, they can be selected by name (e.g. 'xxh64').
+        The key 'fast' selects the fastest available algorithm, but note that
+        the resulting hash will then depend on which libraries are installed.
 
     Example:
         >>> assert _rectify_hasher(NoParam) is DEFAULT_HASHER
@@ -140,6 +228,7 @@ def _rectify_hasher(hasher):
         >>> assert _rectify_hasher('md5') is hashlib.md5
         >>> assert _rectify_hasher(hashlib.sha1) is hashlib.sha1
         >>> assert _rectify_hasher(hashlib.sha1())().name == 'sha1'
+        >>> assert _rectify_hasher('fast') is _fast_hasher()
         >>> import pytest
         >>> assert pytest.raises(KeyError, _rectify_hasher, '42')
         >>> #assert pytest.raises(TypeError, _rectify_hasher, object)
@@ -147,7 +236,11 @@ def _rectify_hasher(hasher):
     if hasher is NoParam or hasher == 'default':
         hasher = DEFAULT_HASHER
     elif isinstance(hasher, six.string_types):
-        if hasher not in hashlib.algorithms_available:
+        if hasher == 'fast':
+            hasher = _fast_hasher()
+        elif hasher in _HASHERS:
+            hasher = _HASHERS[hasher]
+        elif hasher not in hashlib.algorithms_available:
             raise KeyError('unknown hasher: {}'.format(hasher))
         else:
             hasher = getattr(hashlib, hasher)
@@ -159,6 +252,51 @@ def _rectify_hasher(hasher):
     return hasher
 
 
+def _hasher_identity(hasher):
+    """
+    Returns a string that identifies the algorithm of a hasher class, which
+    is used to key persistent and memoized digests. It consists of the
+    qualified name of the callable, the arguments bound by
+    `functools.partial`, and the name and digest size of an instance.
+
+    Args:
+        hasher (callable): a hasher class (not an instance)
+
+    Returns:
+        str | None: None if the callable has no stable name (e.g. lambdas,
+            local functions, or methods of hasher instances)
+
+    Example:
+        >>> ident = _hasher_identity(hashlib.sha1)
+        >>> assert ident == _hasher_identity(hashlib.sha1)
+        >>> assert ident != _hasher_identity(hashlib.sha256)
+        >>> assert _hasher_identity(lambda: hashlib.sha1()) is None
+        >>> # xdoctest: +REQUIRES(PY3)
+        >>> import functools
+        >>> short = functools.partial(hashlib.blake2b, digest_size=16)
+        >>> assert _hasher_identity(short) != _hasher_identity(hashlib.blake2b)
+    """
+    func = hasher
+    bound = []
+    while isinstance(func, functools.partial):
+        bound.append((func.args, sorted((func.keywords or {}).items())))
+        func = func.func
+    if getattr(func, '__self__', None) is not None and not isinstance(
+            func.__self__, type(os)):
+        # a method of an object (e.g. ``instance.copy``) depends on its state
+        return None
+    name = getattr(func, '__qualname__', getattr(func, '__name__', None))
+    if name is None or '<' in name:
+        return None
+    instance = hasher()
+    ident = '{}.{}:{}:{}'.format(getattr(func, '__module__', None), name,
+                                 getattr(instance, 'name', None),
+                                 getattr(instance, 'digest_size', None))
+    if bound:
+        ident += ':' + repr(bound)
+    return ident
+
+
 def _rectify_base(base):
     """
     transforms base shorthand into the full list representation
@@ -168,6 +306,8 @@ def _rectify_base(base):
         >>> assert _rectify_base('hex') is _ALPHABET_16
         >>> assert _rectify_base('abc') is _ALPHABET_26
         >>> assert _rectify_base(10) is _ALPHABET_10
+        >>> assert _rectify_base('base32') is _ALPHABET_32
+        >>> assert _rectify_base(64) is _ALPHABET_64
         >>> assert _rectify_base(['1', '2']) == ['1', '2']
         >>> import pytest
         >>> assert pytest.raises(TypeError, _rectify_base, 'uselist')
@@ -180,6 +320,12 @@ def _rectify_base(base):
         return _ALPHABET_16
     elif base in [10, 'dec']:
         return _ALPHABET_10
+    elif base in [32, 'base32']:
+        return _ALPHABET_32
+    elif base in [36, 'base36']:
+        return _ALPHABET_36
+    elif base in [64, 'base64']:
+        return _ALPHABET_64
     else:
         if not isinstance(base, (list, tuple)):
             raise TypeError(
@@ -207,6 +353,11 @@ class HashableExtensions(object):
     def __init__(self):
         self.keyed_extensions = {}
         self.iterable_checks = []
+        # the types each iterable check applies to (None means all types)
+        self._iterable_check_types = []
+        # per-class caches of the resolved hash function and iterable checks
+        self._dispatch_cache = {}
+        self._iterable_check_cache = {}
 
     def register(self, hash_types):
         # ensure iterable
@@ -216,16 +367,71 @@ class HashableExtensions(object):
             for hash_type in hash_types:
                 key = (hash_type.__module__, hash_type.__name__)
                 self.keyed_extensions[key] = (hash_type, hash_func)
+            self._clear_caches()
             return hash_func
         return _wrap
 
-    def add_iterable_check(self, func):
+    def add_iterable_check(self, func=None, hash_types=None):
         """
         Registers a function that detects when a type is iterable
+
+        Args:
+            func (callable): returns True if its argument must be iterated
+            hash_types (type | Tuple[type]): if specified, `func` is only
+                called for instances of these types. Otherwise it is called
+                for every value that is not a list or tuple.
+
+        Example:
+            >>> self = HashableExtensions()
+            >>> @self.add_iterable_check(hash_types=set)
+            >>> def is_big_set(data):
+            >>>     return len(data) > 2
+            >>> assert self._iterable_checks_for(set) == (is_big_set,)
+            >>> assert self._iterable_checks_for(int) == ()
         """
+        if func is None:
+            import functools
+            return functools.partial(self.add_iterable_check,
+                                     hash_types=hash_types)
+        if isinstance(hash_types, list):
+            hash_types = tuple(hash_types)
         self.iterable_checks.append(func)
+        self._iterable_check_types.append(hash_types)
+        self._clear_caches()
         return func
 
+    def _clear_caches(self):
+        self._dispatch_cache.clear()
+        self._iterable_check_cache.clear()
+
+    def _iterable_checks_for(self, cls):
+        """
+        Returns the iterable checks that apply to instances of `cls`
+        """
+        try:
+            return self._iterable_check_cache[cls]
+        except KeyError:
+            checks = tuple(
+                check for check, hash_types in zip(self.iterable_checks,
+                                                   self._iterable_check_types)
+                if hash_types is None or issubclass(cls, hash_types))
+            self._iterable_check_cache[cls] = checks
+            return checks
+
+    def _resolve(self, cls):
+        """
+        Finds the hash function registered for `cls` or the nearest class in
+        its method resolution order.
+        """
+        for base in getattr(cls, '__mro__', (cls,)):
+            key = (base.__module__, base.__name__)
+            try:
+                hash_type, hash_func = self.keyed_extensions[key]
+            except KeyError:
+                continue
+            return hash_func
+        return None
+
     def lookup(self, data):
         """
         Returns an appropriate function to hash `data` if one has been
@@ -259,14 +465,21 @@ class HashableExtensions(object):
 
             >>> data = uuid.uuid4()
             >>> self.lookup(data)
+
+            >>> # Subclasses use the function of their nearest registered base
+            >>> class MyDict(OrderedDict):
+            >>>     pass
+            >>> assert self.lookup(MyDict()) is self.lookup(OrderedDict())
         """
-        # Maybe try using functools.singledispatch instead?
-        # First try fast O(1) lookup
+        # The function for each class is resolved through its MRO once and
+        # then cached, so later lookups are O(1).
         query_hash_type = data.__class__
-        key = (query_hash_type.__module__, query_hash_type.__name__)
         try:
-            hash_type, hash_func = self.keyed_extensions[key]
+            hash_func = self._dispatch_cache[query_hash_type]
         except KeyError:
+            hash_func = self._resolve(query_hash_type)
+            self._dispatch_cache[query_hash_type] = hash_func
+        if hash_func is None:
             raise TypeError('No registered hash func for hashable type=%r' % (
                     query_hash_type))
         return hash_func
@@ -280,7 +493,7 @@ class HashableExtensions(object):
         if hasattr(np, 'float128'):  # nocover
             numpy_floating_types = numpy_floating_types + (np.float128,)
 
-        @self.add_iterable_check
+        @self.add_iterable_check(hash_types=np.ndarray)
         def is_object_ndarray(data):
             # ndarrays of objects cannot be hashed directly.
             return isinstance(data, np.ndarray) and data.dtype.kind == 'O'
@@ -302,11 +515,12 @@ class HashableExtensions(object):
                 msg = 'directly hashing ndarrays with dtype=object is unstable'
                 raise TypeError(msg)
             else:
-                # tobytes() views the array in 1D (via ravel())
-                # encode the shape as well
+                # The array is hashed as if it were tobytes() (i.e. in C
+                # order), but its buffer is streamed to the hasher instead of
+                # being copied. Encode the shape and dtype as well.
                 header = b''.join(_hashable_sequence((len(data.shape), data.shape)))
                 dtype = b''.join(_hashable_sequence(data.dtype.descr))
-                hashable = header + dtype + data.tobytes()
+                hashable = _NdarrayChunks(data, header + dtype)
             prefix = b'NDARR'
             return prefix, hashable
 
@@ -345,6 +559,14 @@ class HashableExtensions(object):
             qjspicvv
 
             gpxtclct
+
+        Example:
+            >>> # dicts and sets are hashed independent of their order
+            >>> data1 = {'a': 1, 'b': [2, {3, 4}], 5: frozenset(['c'])}
+            >>> data2 = {5: frozenset(['c']), 'b': [2, {4, 3}], 'a': 1}
+            >>> assert hash_data(data1) == hash_data(data2)
+            >>> assert hash_data({1, 2}) == hash_data(frozenset([2, 1]))
+            >>> assert hash_data({'a': 1}) != hash_data(OrderedDict(a=1))
         """
         @self.register(uuid.UUID)
         def _hash_uuid(data):
@@ -355,19 +577,175 @@ class HashableExtensions(object):
         @self.register(OrderedDict)
         def _hash_ordered_dict(data):
             """
-            Note, we should not be hashing dicts because they are unordered
+            Note, unlike dicts, the order of the items is part of the hash
             """
             hashable = b''.join(_hashable_sequence(list(data.items())))
             prefix = b'ODICT'
             return prefix, hashable
 
+        @self.register(dict)
+        def _hash_dict(data):
+            """
+            Dictionaries are hashed in a canonical order by sorting the items
+            by the bytes of their keys. Each key and value is only encoded
+            once, so large mappings remain cheap.
+            """
+            items = sorted((_hashable_bytes(key), _hashable_bytes(value))
+                           for key, value in data.items())
+            hashable = b''.join([key + b'_:_' + value + b'_,_'
+                                 for key, value in items])
+            prefix = b'DICT'
+            return prefix, hashable
+
+        @self.register((set, frozenset))
+        def _hash_set(data):
+            """
+            Sets are hashed in a canonical order by sorting the bytes of their
+            items.
+            """
+            items = sorted(_hashable_bytes(item) for item in data)
+            hashable = b''.join([item + b'_,_' for item in items])
+            prefix = b'SET'
+            return prefix, hashable
+
+
 _HASHABLE_EXTENSIONS = HashableExtensions()
 _HASHABLE_EXTENSIONS._register_builtin_class_extensions()
 try:
     import numpy as np
     _HASHABLE_EXTENSIONS._register_numpy_extensions()
 except ImportError:  # nocover
-    pass
+    np = None
+
+
+class _HashableChunks(object):
+    """
+    A hashable byte representation that is fed to the hasher as a sequence of
+    chunks instead of being joined into a single bytes object in memory.
+
+    Extensions can return this instead of bytes when the representation of
+    an object is large. Iterating produces bytes-like chunks by calling
+    ``func(*args)``.
+
+    Example:
+        >>> hashable = _HashableChunks(iter, [b'a', b'bc'])
+        >>> assert hashable.tobytes() == b'abc'
+        >>> assert hashable.tobytes() == b'abc'
+    """
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __iter__(self):
+        return iter(self.func(*self.args))
+
+    def tobytes(self):
+        return b''.join(self)
+
+    def fingerprint(self, nsamples, samplesize):
+        """
+        Returns chunks that only sample this representation (see
+        `_fingerprint_ranges`). By default nothing is skipped.
+        """
+        return self
+
+
+class _NdarrayChunks(_HashableChunks):
+    """
+    The chunked representation of a non-object ndarray and its header
+    """
+    __slots__ = ()
+
+    def __init__(self, data, header):
+        super(_NdarrayChunks, self).__init__(_iter_ndarray_chunks, data,
+                                             header)
+
+    def fingerprint(self, nsamples, samplesize):
+        data, header = self.args
+        return _HashableChunks(_iter_ndarray_fingerprint, data, header,
+                               nsamples, samplesize)
+
+
+# Non-contiguous arrays are copied into contiguous chunks of at most this
+# many bytes before they are hashed.
+_NDARRAY_CHUNKSIZE = 2 ** 20
+
+
+def _iter_ndarray_chunks(data, header=b'', chunksize=None):
+    """
+    Generates chunks of bytes that concatenate to ``header + data.tobytes()``
+
+    C-contiguous arrays are viewed in place as a single flat uint8 buffer.
+    Other arrays are split along their leading axes and each piece is copied
+    into a buffer of at most `chunksize` bytes (unless a single item is
+    larger), so the memory used does not depend on the size of the array.
+
+    Example:
+        >>> data = np.arange(2 * 3 * 4).reshape(2, 3, 4)
+        >>> for arr in [data, data.T, data[:, ::2], data[::-1, 1]]:
+        >>>     for chunksize in [1, 8, 50, 10000]:
+        >>>         chunks = list(_iter_ndarray_chunks(arr, b'H', chunksize))
+        >>>         assert b''.join(chunks) == b'H' + arr.tobytes()
+        >>> chunks = list(_iter_ndarray_chunks(data.T, b'', 16))
+        >>> assert max(c.nbytes for c in chunks) == 16
+    """
+    if chunksize is None:
+        chunksize = _NDARRAY_CHUNKSIZE
+    if header:
+        yield header
+    if data.flags.c_contiguous:
+        # A flat uint8 view supports the buffer protocol for any dtype
+        yield data.reshape(-1).view(np.uint8)
+    elif data.nbytes <= chunksize or data.ndim == 0:
+        yield np.ascontiguousarray(data).reshape(-1).view(np.uint8)
+    else:
+        row_nbytes = data.nbytes // data.shape[0]
+        step = max(1, chunksize // max(1, row_nbytes))
+        if step == 1 and data.ndim > 1:
+            # A single row is too big, so split each row on its next axis
+            for row in data:
+                for chunk in _iter_ndarray_chunks(row, b'', chunksize):
+                    yield chunk
+        else:
+            for start in range(0, data.shape[0], step):
+                part = data[start:start + step]
+                yield np.ascontiguousarray(part).reshape(-1).view(np.uint8)
+
+
+def _iter_ndarray_fingerprint(data, header, nsamples, samplesize):
+    """
+    Generates chunks that sample the bytes of ``data.tobytes()``.
+
+    The samples are taken at the same relative positions as in
+    `_hash_file_fingerprint`, but are aligned to whole items. Only the
+    sampled items are copied.
+
+    Example:
+        >>> data = np.arange(100000)
+        >>> chunks = list(_iter_ndarray_fingerprint(data, b'H', 4, 64))
+        >>> assert sum(len(c) for c in chunks) < 64 * 8
+        >>> small = list(_iter_ndarray_fingerprint(data[:10], b'H', 4, 64))
+        >>> assert b''.join(small).endswith(data[:10].tobytes())
+    """
+    yield header
+    itemsize = data.itemsize
+    yield b'FPRINT' + b'_,_'.join([
+        _int_to_bytes(data.nbytes), _int_to_bytes(nsamples),
+        _int_to_bytes(samplesize)])
+    if itemsize == 0 or data.size == 0:
+        return
+    ranges = _fingerprint_ranges(data.size, nsamples,
+                                 max(1, samplesize // itemsize))
+    if len(ranges) == 1:
+        # small arrays are hashed in full
+        for chunk in _iter_ndarray_chunks(data):
+            yield chunk
+    else:
+        flat = data.flat
+        for start, stop in ranges:
+            yield flat[start:stop].view(np.uint8)
 
 
 class _HashTracer(object):
@@ -396,6 +774,27 @@ def _hashable_sequence(data, use_prefix=True):
     return hasher.sequence
 
 
+def _hashable_bytes(data):
+    """
+    Returns the bytes that `_update_hasher` would feed to the hasher.
+
+    This is equivalent to ``b''.join(_hashable_sequence(data))``, but faster
+    for non-iterable data.
+
+    Example:
+        >>> for data in [1, 'a', [1, (2, 3)], {'a': {1}}]:
+        >>>     want = b''.join(_hashable_sequence(data))
+        >>>     assert _hashable_bytes(data) == want
+    """
+    if _needs_iteration(data):
+        return b''.join(_hashable_sequence(data))
+    else:
+        prefix, hashable = _convert_to_hashable(data)
+        if isinstance(hashable, _HashableChunks):
+            hashable = hashable.tobytes()
+        return prefix + hashable
+
+
 def _convert_to_hashable(data, use_prefix=True):
     r"""
     Converts `data` into a hashable byte representation if an appropriate
@@ -408,7 +807,8 @@ def _convert_to_hashable(data, use_prefix=True):
     Returns:
         tuple(bytes, bytes): prefix, hashable:
             a prefix hinting the original data type and the byte representation
-            of `data`.
+            of `data`. For large objects (e.g. ndarrays) hashable may be a
+            `_HashableChunks` that generates the bytes in several pieces.
 
     Raises:
         TypeError : if data has no registered hash methods
@@ -450,7 +850,175 @@ def _convert_to_hashable(data, use_prefix=True):
         return b'', hashable
 
 
-def _update_hasher(hasher, data, use_prefix=True):
+# Sequences with at least this many items are checked for homogeneous numeric
+# types, which are then encoded in bulk. Bulk encoding works on chunks of
+# this many items at a time to bound memory usage.
+_NUMERIC_FASTPATH_MINLEN = 64
+_NUMERIC_FASTPATH_CHUNKSIZE = 2 ** 16
+
+
+def _numeric_sequence_type(data):
+    """
+    Returns `int` or `float` if every item in `data` has exactly that type,
+    otherwise returns None.
+
+    Example:
+        >>> assert _numeric_sequence_type([1] * 100) is int
+        >>> assert _numeric_sequence_type([1.0] * 100) is float
+        >>> assert _numeric_sequence_type([1.0] * 100 + [1]) is None
+        >>> assert _numeric_sequence_type([True] * 100) is None
+        >>> assert _numeric_sequence_type([1] * 10) is None
+    """
+    try:
+        if len(data) < _NUMERIC_FASTPATH_MINLEN:
+            return None
+        first_type = type(data[0])
+    except (TypeError, IndexError, KeyError):
+        return None
+    if first_type is not int and first_type is not float:
+        return None
+    if len(set(map(type, data))) != 1:
+        return None
+    return first_type
+
+
+def _int64_byte_columns(arr):
+    """
+    Vectorized `_int_to_bytes` for an int64 array.
+
+    Returns:
+        Tuple[ndarray, ndarray]: (n, 8) big-endian bytes and a mask of the
+            bytes `_int_to_bytes` would keep for each value.
+
+    Raises:
+        OverflowError: if the array contains the minimum int64
+    """
+    if np.any(arr == np.iinfo(np.int64).min):
+        # _int_to_bytes encodes -2 ** 63 using 9 bytes
+        raise OverflowError('value requires more than 8 bytes')
+    cols = arr.astype('>i8').view(np.uint8).reshape(-1, 8)
+    mag = np.abs(arr)
+    # _int_to_bytes uses ceil((bit_length + 1) / 8) bytes, which is greater
+    # than k exactly when the magnitude is at least 2 ** (8k - 1).
+    nbytes = np.ones(len(arr), dtype=np.int64)
+    for k in range(1, 8):
+        nbytes += mag >= 2 ** (8 * k - 1)
+    keep = np.arange(8)[None, :] >= (8 - nbytes)[:, None]
+    return cols, keep
+
+
+def _pow2_byte_columns(exponents):
+    """
+    Vectorized `_int_to_bytes` for an array of powers of two ``2 ** k``.
+
+    Returns:
+        Tuple[ndarray, ndarray]: (n, w) big-endian bytes and a mask of the
+            bytes `_int_to_bytes` would keep for each value.
+    """
+    nbytes = (exponents + 9) // 8
+    width = int(nbytes.max()) if len(nbytes) else 1
+    cols = np.zeros((len(exponents), width), dtype=np.uint8)
+    rows = np.arange(len(exponents))
+    cols[rows, width - 1 - exponents // 8] = 1 << (exponents % 8)
+    keep = np.arange(width)[None, :] >= (width - nbytes)[:, None]
+    return cols, keep
+
+
+def _encode_numeric_chunk(chunk, type_, prefix, sep):
+    """
+    Vectorized encoding of a homogeneous chunk of ints or floats. This
+    produces exactly the same bytes as encoding each item with
+    `_convert_to_hashable` and appending `sep`.
+
+    Raises:
+        OverflowError: if an item cannot be vectorized
+
+    Example:
+        >>> # xdoctest: +REQUIRES(module:numpy)
+        >>> chunk = [0, 1, -1, 127, 128, -128, -129, 2 ** 63 - 1, -2 ** 63 + 1]
+        >>> got = _encode_numeric_chunk(chunk, int, b'INT', b'_,_')
+        >>> want = b''.join(b''.join(_convert_to_hashable(x)) + b'_,_'
+        >>>                 for x in chunk)
+        >>> assert got == want
+        >>> chunk = [0.0, -0.0, 0.1, -2.5, 1e-300, 3e17, 5e-324]
+        >>> got = _encode_numeric_chunk(chunk, float, b'FLT', b'_,_')
+        >>> want = b''.join(b''.join(_convert_to_hashable(x)) + b'_,_'
+        >>>                 for x in chunk)
+        >>> assert got == want
+    """
+    n = len(chunk)
+    # Each block is either a constant row of bytes or a (cols, keep) pair
+    blocks = [prefix]
+    if type_ is int:
+        # raises OverflowError if any value does not fit in an int64
+        arr = np.array(chunk, dtype=np.int64)
+        blocks.append(_int64_byte_columns(arr))
+    else:
+        arr = np.array(chunk, dtype=np.float64)
+        # Only handle values where the numerator fits in an int64
+        if not np.all(np.abs(arr) < 2.0 ** 62):
+            raise OverflowError('float is too large to vectorize')
+        # Replicate float.as_integer_ratio: x = numer / 2 ** k
+        mantissa, exponent = np.frexp(arr)
+        numer = (mantissa * 2.0 ** 53).astype(np.int64)
+        nonzero = numer != 0
+        lowbit = (numer & -numer)[nonzero]
+        trailing = np.zeros(n, dtype=np.int64)
+        trailing[nonzero] = np.frexp(lowbit.astype(np.float64))[1] - 1
+        numer = numer >> trailing
+        exp2 = np.where(nonzero, exponent - 53 + trailing, 0)
+        numer = np.where(exp2 > 0, numer << np.maximum(exp2, 0), numer)
+        denom_exp = np.maximum(-exp2, 0)
+        blocks.append(_int64_byte_columns(numer))
+        blocks.append(b'/')
+        blocks.append(_pow2_byte_columns(denom_exp))
+    blocks.append(sep)
+
+    widths = [len(b) if isinstance(b, bytes) else b[0].shape[1]
+              for b in blocks]
+    cols = np.empty((n, sum(widths)), dtype=np.uint8)
+    keep = np.ones((n, sum(widths)), dtype=bool)
+    offset = 0
+    for block, width in zip(blocks, widths):
+        if isinstance(block, bytes):
+            cols[:, offset:offset + width] = np.frombuffer(block, np.uint8)
+        else:
+            cols[:, offset:offset + width] = block[0]
+            keep[:, offset:offset + width] = block[1]
+        offset += width
+    # boolean indexing flattens in row-major order, which concatenates the
+    # kept bytes of each item in sequence order.
+    return cols[keep].tobytes()
+
+
+def _update_hasher_numeric(hasher, data, type_, use_prefix, sep):
+    """
+    Hashes every item in a homogeneous sequence of ints or floats followed by
+    `sep`, with one hasher update per chunk.
+    """
+    if type_ is int:
+        prefix = b'INT' if use_prefix else b''
+    else:
+        prefix = b'FLT' if use_prefix else b''
+    chunksize = _NUMERIC_FASTPATH_CHUNKSIZE
+    for start in range(0, len(data), chunksize):
+        chunk = data[start:start + chunksize]
+        binary_data = None
+        if np is not None:
+            try:
+                binary_data = _encode_numeric_chunk(chunk, type_, prefix, sep)
+            except OverflowError:
+                pass
+        if binary_data is None:
+            # Fallback for big numbers or when numpy is unavailable
+            binary_data = b''.join([
+                b''.join(_convert_to_hashable(item, use_prefix)) + sep
+                for item in chunk])
+        hasher.update(binary_data)
+
+
+def _update_hasher(hasher, data, use_prefix=True, memo=None,
+                   fingerprint=None):
     """
     Converts `data` into a byte representation and calls update on the hasher
     `hashlib.HASH` algorithm.
@@ -459,6 +1027,11 @@ def _update_hasher(hasher, data, use_prefix=True):
         hasher (HASH): instance of a hashlib algorithm
         data (object): ordered data with structure
         use_prefix (bool): include type prefixes in the hash
+        memo (_HashMemo): if specified, nested immutable values are replaced
+            by their (cached) digests. This changes the resulting hash.
+        fingerprint (Tuple[int, int]): if specified, large values with a
+            chunked representation (i.e. ndarrays) are only sampled. This is
+            the (nsamples, samplesize) returned by `_rectify_fingerprint`.
 
     Example:
         >>> hasher = hashlib.sha512()
@@ -469,42 +1042,254 @@ def _update_hasher(hasher, data, use_prefix=True):
 
         2ba8d82b
     """
-    # Determine if the data should be hashed directly or iterated through
+    # Denote that we are hashing over an iterable
+    # Multiple structure bytes makes it harder accidently make conflicts
+    SEP = b'_,_'
+    ITER_PREFIX = b'_[_'
+    ITER_SUFFIX = b'_]_'
+
+    # Nested iterables are traversed with an explicit stack instead of
+    # recursion, so the nesting depth is not limited by the recursion limit.
+    # Each frame is a list: [iterator, is_slow, sep_after].
+    # While a frame is not slow, its items are assumed to be non-iterable and
+    # are converted directly. When the first item fails to convert the frame
+    # becomes slow and that item is traversed without a trailing separator.
+    # Every later item in a slow frame is traversed and followed by SEP. This
+    # is the byte stream produced by earlier recursive implementations.
+    stack = []
+    item = data
+    sep_after = False
+    while True:
+        # Hash the current item or enter it if it is iterable
+        if memo is not None and stack and memo.is_memoizable(item):
+            binary_data = memo.encode(item)
+            hasher.update(binary_data + SEP if sep_after else binary_data)
+        elif _needs_iteration(item):
+            hasher.update(ITER_PREFIX)
+            numeric_type = _numeric_sequence_type(item)
+            if numeric_type is not None:
+                # fast path for long sequences of ints or floats
+                _update_hasher_numeric(hasher, item, numeric_type, use_prefix,
+                                       SEP)
+                hasher.update(ITER_SUFFIX + SEP if sep_after else ITER_SUFFIX)
+            else:
+                stack.append([iter(item), False, sep_after])
+        else:
+            prefix, hashable = _convert_to_hashable(item, use_prefix)
+            if isinstance(hashable, _HashableChunks):
+                if fingerprint is not None:
+                    hashable = hashable.fingerprint(*fingerprint)
+                _update_hasher_chunks(hasher, prefix, hashable,
+                                      SEP if sep_after else b'')
+            else:
+                binary_data = prefix + hashable
+                hasher.update(binary_data + SEP if sep_after else binary_data)
+
+        # Find the next item that needs to be traversed
+        while stack:
+            frame = stack[-1]
+            iter_ = frame[0]
+            if not frame[1]:
+                # first, try to nest quickly without traversal
+                # (this works if all data in the sequence is a non-iterable)
+                try:
+                    for item in iter_:
+                        if memo is not None and memo.is_memoizable(item):
+                            hasher.update(memo.encode(item) + SEP)
+                            continue
+                        prefix, hashable = _convert_to_hashable(item, use_prefix)
+                        if isinstance(hashable, _HashableChunks):
+                            if fingerprint is not None:
+                                hashable = hashable.fingerprint(*fingerprint)
+                            _update_hasher_chunks(hasher, prefix, hashable, SEP)
+                        else:
+                            hasher.update(prefix + hashable + SEP)
+                except TypeError:
+                    frame[1] = True
+                    sep_after = False
+                    break
+            else:
+                item = next(iter_, _EXHAUSTED)
+                if item is not _EXHAUSTED:
+                    sep_after = True
+                    break
+            # The iterable in this frame is exhausted
+            stack.pop()
+            hasher.update(ITER_SUFFIX + SEP if frame[2] else ITER_SUFFIX)
+        else:
+            break
+
+
+def _update_hasher_chunks(hasher, prefix, hashable, suffix):
+    """
+    Updates the hasher with a `_HashableChunks` without joining its chunks
+    """
+    if prefix:
+        hasher.update(prefix)
+    for chunk in hashable:
+        hasher.update(chunk)
+    if suffix:
+        hasher.update(suffix)
+
+
+def _needs_iteration(data):
+    """
+    Determine if the data should be hashed directly or iterated through
+    """
     if isinstance(data, (tuple, list, zip)):
-        needs_iteration = True
+        return True
     else:
-        needs_iteration = any(check(data) for check in
-                              _HASHABLE_EXTENSIONS.iterable_checks)
-
-    if needs_iteration:
-        # Denote that we are hashing over an iterable
-        # Multiple structure bytes makes it harder accidently make conflicts
-        SEP = b'_,_'
-        ITER_PREFIX = b'_[_'
-        ITER_SUFFIX = b'_]_'
-
-        iter_ = iter(data)
-        hasher.update(ITER_PREFIX)
-        # first, try to nest quickly without recursive calls
-        # (this works if all data in the sequence is a non-iterable)
-        try:
-            for item in iter_:
-                prefix, hashable = _convert_to_hashable(item, use_prefix)
-                binary_data = prefix + hashable + SEP
-                hasher.update(binary_data)
-        except TypeError:
-            # need to use recursive calls
-            # Update based on current item
-            _update_hasher(hasher, item, use_prefix)
-            for item in iter_:
-                # Ensure the items have a spacer between them
-                _update_hasher(hasher, item, use_prefix)
-                hasher.update(SEP)
-        hasher.update(ITER_SUFFIX)
-    else:
-        prefix, hashable = _convert_to_hashable(data, use_prefix)
-        binary_data = prefix + hashable
-        hasher.update(binary_data)
+        checks = _HASHABLE_EXTENSIONS._iterable_checks_for(data.__class__)
+        return bool(checks) and any(check(data) for check in checks)
+
+
+# sentinel denoting the end of an iterator in _update_hasher
+_EXHAUSTED = object()
+
+# types that cannot contain mutable data
+_IMMUTABLE_SCALAR_TYPES = (type(None), bool, float, complex) + _intlike + _stringlike
+
+
+class _HashMemoStore(object):
+    """
+    Process-wide cache of the digests of immutable values used by
+    ``hash_data(memo=True)``.
+
+    Entries are keyed by object identity. Read-only ndarrays are referenced
+    weakly and their entries disappear when they are garbage collected.
+    Tuples cannot be weakly referenced, so they are held in a bounded LRU
+    cache, which also ensures their ids are not reused while cached.
+
+    Args:
+        maxsize (int): maximum number of tuples to remember
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._weak = {}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data, key):
+        """
+        Returns the cached digest of data or None
+        """
+        with self._lock:
+            if isinstance(data, tuple):
+                entry = self._lru.pop(key, None)
+                if entry is not None:
+                    # move to the end to mark as most recently used
+                    self._lru[key] = entry
+                    obj = entry[0]
+            else:
+                entry = self._weak.get(key, None)
+                if entry is not None:
+                    obj = entry[0]()
+            if entry is not None and obj is data:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, data, key, digest):
+        with self._lock:
+            if isinstance(data, tuple):
+                self._lru[key] = (data, digest)
+                while len(self._lru) > self.maxsize:
+                    self._lru.popitem(last=False)
+            else:
+                def _remove(ref, key=key, weak=self._weak):
+                    entry = weak.get(key, None)
+                    if entry is not None and entry[0] is ref:
+                        weak.pop(key, None)
+                self._weak[key] = (weakref.ref(data, _remove), digest)
+
+    def clear(self):
+        with self._lock:
+            self._weak.clear()
+            self._lru.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_HASH_MEMO_STORE = _HashMemoStore()
+
+
+class _HashMemo(object):
+    """
+    Replaces immutable values nested in hashed data with their digests, which
+    are computed once and then reused from a `_HashMemoStore`.
+
+    Read-only (``flags.writeable == False``) non-object ndarrays and tuples
+    that only contain immutable values are memoized. The caller is
+    responsible for not modifying a read-only array through a writeable view.
+
+    Args:
+        hasher (callable): the hasher class used to digest memoized values
+        use_prefix (bool): include type prefixes in the hash
+        store (_HashMemoStore): defaults to a process-wide store
+        fingerprint (Tuple[int, int]): see `_update_hasher`
+
+    Example:
+        >>> store = _HashMemoStore()
+        >>> memo = _HashMemo(hashlib.sha1, store=store)
+        >>> data = (1, 'a', 2.0, None)
+        >>> assert memo.is_memoizable(data)
+        >>> assert memo.is_memoizable((1, (2, 'b')))
+        >>> assert not memo.is_memoizable((1, [2]))
+        >>> encoded = memo.encode(data)
+        >>> assert memo.encode(data) == encoded
+        >>> assert store.hits == 1 and store.misses == 1
+    """
+
+    def __init__(self, hasher, use_prefix=True, store=None,
+                 fingerprint=None):
+        self.hasher = hasher
+        self.use_prefix = use_prefix
+        self.store = _HASH_MEMO_STORE if store is None else store
+        self.fingerprint = fingerprint
+        # Hashers without a stable identity are told apart by the callable
+        # itself, so digests are never shared between different algorithms
+        ident = _hasher_identity(hasher)
+        if ident is None:
+            ident = hasher
+        self._key = (ident, use_prefix, fingerprint)
+
+    def is_memoizable(self, data):
+        if isinstance(data, tuple):
+            # only tuples that are immutable all the way down
+            stack = [data]
+            while stack:
+                for item in stack.pop():
+                    if isinstance(item, _IMMUTABLE_SCALAR_TYPES):
+                        continue
+                    elif isinstance(item, tuple):
+                        stack.append(item)
+                    elif not self._is_readonly_array(item):
+                        return False
+            return True
+        return self._is_readonly_array(data)
+
+    @staticmethod
+    def _is_readonly_array(data):
+        return (np is not None and isinstance(data, np.ndarray) and
+                not data.flags.writeable and data.dtype.kind != 'O')
+
+    def encode(self, data):
+        """
+        Returns the bytes that represent the memoizable `data`
+        """
+        key = (id(data),) + self._key
+        digest = self.store.get(data, key)
+        if digest is None:
+            sub_hasher = self.hasher()
+            _update_hasher(sub_hasher, data, self.use_prefix, memo=self,
+                           fingerprint=self.fingerprint)
+            digest = sub_hasher.digest()
+            self.store.set(data, key, digest)
+        return b'MEMO' + digest
 
 
 def _convert_hexstr_base(hexstr, base):
@@ -566,27 +1351,175 @@ def _convert_hexstr_base(hexstr, base):
     return newbase_str
 
 
+# cache of ``(len(base), exponent) -> len(base) ** exponent``
+_BASE_POWERS = {}
+
+
+def _base_power(baselen, exponent):
+    key = (baselen, exponent)
+    try:
+        return _BASE_POWERS[key]
+    except KeyError:
+        value = _BASE_POWERS[key] = baselen ** exponent
+        return value
+
+
+def _int_to_base(x, base):
+    """
+    Converts a non-negative integer into a string of symbols in `base`.
+
+    Large integers are first split into pieces of several digits that fit
+    in a machine word, which avoids a big-integer division per digit.
+
+    Example:
+        >>> assert _int_to_base(0, _ALPHABET_10) == '0'
+        >>> assert _int_to_base(12345678901234567890, _ALPHABET_10) == '12345678901234567890'
+        >>> assert _int_to_base(10 ** 40, _ALPHABET_10) == '1' + '0' * 40
+    """
+    baselen = len(base)
+    if x == 0:
+        return '0'
+    # number of digits that fit in a 63 bit integer
+    width = max(1, int(63 * math.log(2) / math.log(baselen)))
+    piece_base = _base_power(baselen, width)
+    pieces = []
+    while x:
+        x, piece = divmod(x, piece_base)
+        pieces.append(piece)
+    digits = []
+    for index, piece in enumerate(pieces):
+        is_last = index == len(pieces) - 1
+        count = 0
+        while piece or (not is_last and count < width):
+            piece, rem = divmod(piece, baselen)
+            digits.append(base[rem])
+            count += 1
+    digits.reverse()
+    return ''.join(digits)
+
+
+def _num_base_digits(x, baselen):
+    """
+    Returns the number of digits of a positive integer in a base
+
+    Example:
+        >>> assert _num_base_digits(1, 10) == 1
+        >>> assert _num_base_digits(999, 10) == 3
+        >>> assert _num_base_digits(1000, 10) == 4
+        >>> assert _num_base_digits(2 ** 512 - 1, 2) == 512
+    """
+    ndigits = max(1, int(x.bit_length() * math.log(2) / math.log(baselen)))
+    # correct for floating point error in the estimate
+    while _base_power(baselen, ndigits) <= x:
+        ndigits += 1
+    while ndigits > 1 and _base_power(baselen, ndigits - 1) > x:
+        ndigits -= 1
+    return ndigits
+
+
+def _encode_digest(digest, hashlen, base):
+    """
+    Encodes the bytes of a digest as text in `base`, truncated to `hashlen`.
+
+    For hex, base32 and base64 the bytes are encoded bitwise (as in RFC
+    4648). Other bases use the digits of the digest interpreted as a
+    big-endian integer, which is equivalent to ``_convert_hexstr_base``.
+    Only the leading `hashlen` symbols are computed.
+
+    Args:
+        digest (bytes): output of ``hasher.digest()``
+        hashlen (int | None): maximum number of symbols to return
+        base (list): list of symbols
+
+    Example:
+        >>> import hashlib
+        >>> digest = hashlib.sha512(b'data').digest()
+        >>> hexstr = hashlib.sha512(b'data').hexdigest()
+        >>> for base in [_ALPHABET_10, _ALPHABET_16, _ALPHABET_26, ['0', '1']]:
+        >>>     for hashlen in [None, 1, 8, 32, 1000]:
+        >>>         want = _convert_hexstr_base(hexstr, base)[:hashlen]
+        >>>         assert _encode_digest(digest, hashlen, base) == want
+        >>> print(_encode_digest(digest, 8, _ALPHABET_32))
+        >>> print(_encode_digest(digest, 8, _ALPHABET_64))
+        >>> print(_encode_digest(digest, 8, _ALPHABET_36))
+    """
+    if hashlen is not None and hashlen < 0:
+        # negative lengths are handled by slicing the full text
+        return _encode_digest(digest, None, base)[:hashlen]
+    if base is _ALPHABET_16:
+        # already in hex, no conversion needed
+        nbytes = len(digest) if hashlen is None else (hashlen + 1) // 2
+        return binascii.hexlify(digest[:nbytes]).decode('ascii')[:hashlen]
+    if base is _ALPHABET_32 or base is _ALPHABET_64:
+        # bitwise encodings only need enough bytes for the leading symbols
+        bits = 5 if base is _ALPHABET_32 else 6
+        if hashlen is not None:
+            digest = digest[:(hashlen * bits + 7) // 8]
+        if base is _ALPHABET_32:
+            text = base64.b32encode(digest).decode('ascii').lower()
+        else:
+            text = base64.urlsafe_b64encode(digest).decode('ascii')
+        return text.rstrip('=')[:hashlen]
+    if six.PY2:  # nocover
+        x = int(binascii.hexlify(digest) or '0', 16)
+    else:
+        x = int.from_bytes(digest, 'big')
+    if x != 0 and hashlen is not None:
+        # drop the trailing digits that would be truncated anyway
+        baselen = len(base)
+        ndigits = _num_base_digits(x, baselen)
+        if hashlen < ndigits:
+            x //= _base_power(baselen, ndigits - hashlen)
+    return _int_to_base(x, base)[:hashlen]
+
+
 def _digest_hasher(hasher, hashlen, base):
     """ counterpart to _update_hasher """
-    # Get a 128 character hex string
-    hex_text = hasher.hexdigest()
-    # Shorten length of string (by increasing base)
-    base_text = _convert_hexstr_base(hex_text, base)
-    # Truncate
-    text = base_text[:hashlen]
-    return text
+    return _encode_digest(hasher.digest(), hashlen, base)
+
 
+def _digest_hexstr(hex_text, hashlen, base):
+    """ Converts a hex digest into the requested base and length """
+    return _encode_digest(binascii.unhexlify(hex_text), hashlen, base)
 
-def hash_data(data, hasher=NoParam, hashlen=NoParam, base=NoParam):
+
+def hash_data(data, hasher=NoParam, hashlen=NoParam, base=NoParam,
+              memo=False, fingerprint=False, chunksize=None, workers=0):
     r"""
     Get a unique hash depending on the state of the data.
 
     Args:
         data (object): any sort of loosely organized data
-        hasher (HASH): hash algorithm from hashlib, defaults to `sha512`.
+        hasher (str | HASH): hash algorithm from hashlib, defaults to `sha512`.
+            Registered non-cryptographic hashers (e.g. 'xxh64', 'blake3') and
+            the special key 'fast' are also accepted.
         hashlen (int): maximum number of symbols in the returned hash. If
             not specified, all are returned.
-        base (list): list of symbols or shorthand key. Defaults to base 26
+        base (list): list of symbols or shorthand key. Defaults to base 26.
+            Other keys are 'hex', 'dec', 'base32', 'base36', and 'base64'.
+        memo (bool): if True, nested read-only ndarrays and tuples of
+            immutable values are represented by their own digests, which are
+            cached by object identity. Hashing a structure that reuses
+            previously seen values then only costs the new parts. Hashes
+            computed with memo=True differ from those computed without it.
+            Ignored if `hasher` is an instance.
+        fingerprint (bool | int | Tuple[int, int]): if truthy, ndarrays are
+            not hashed in full. Only their size and shape, head, tail, and
+            evenly spaced samples are hashed (see `hash_file`). The result is
+            prefixed with the fingerprint parameters.
+        chunksize (int): if specified and `data` is a list or tuple, it is
+            hashed as a tree: the items are split into chunks of this many
+            items (see `ub.chunks`), each chunk is hashed as a list, and the
+            ordered digests of the chunks are hashed to form the root. The
+            resulting hash depends on `chunksize` and is different from the
+            default flat hash. Other data is hashed normally.
+            `DEFAULT_ITEM_CHUNKSIZE` is a good value for long lists.
+        workers (int): number of processes used to hash chunks in tree
+            mode. It only has an effect when `chunksize` is specified, so it
+            never changes the hash. Requires a hasher that can be pickled
+            (i.e. not an instance). Processes are started with the start
+            method of the program (or the platform default), except that
+            they are not forked while other threads are running.
 
     Returns:
         str: text -  hash string
@@ -596,37 +1529,585 @@ def hash_data(data, hasher=NoParam, hashlen=NoParam, base=NoParam):
         iugjngof
 
         frqkjbsq
+
+    Example:
+        >>> # xdoctest: +REQUIRES(module:numpy)
+        >>> import numpy as np
+        >>> big = np.zeros(1000)
+        >>> big.flags.writeable = False
+        >>> hash1 = hash_data([big, 'config1'], memo=True)
+        >>> hash2 = hash_data([big, 'config2'], memo=True)  # reuses big
+        >>> assert hash1 != hash2
+        >>> other = big.copy()
+        >>> other.flags.writeable = False
+        >>> assert hash1 == hash_data([other, 'config1'], memo=True)
+        >>> assert hash1 != hash_data([big, 'config1'])
+
+    Example:
+        >>> # xdoctest: +REQUIRES(module:numpy)
+        >>> import numpy as np
+        >>> data = np.arange(10 ** 6)
+        >>> hashid = hash_data(data, fingerprint=True, hashlen=8)
+        >>> print(hashid)
+        fp64x4096-...
+        >>> assert hashid == hash_data(data.copy(), fingerprint=True, hashlen=8)
+
+    Example:
+        >>> # Tree hashes of lists are the same for any number of workers
+        >>> records = [{'id': i, 'box': [i, i, 10, 10]} for i in range(1000)]
+        >>> hash1 = hash_data(records, chunksize=100)
+        >>> hash2 = hash_data(records, chunksize=100, workers=2)
+        >>> assert hash1 == hash2
+        >>> assert hash1 != hash_data(records)
+        >>> # Without a chunksize, workers do not change the flat hash
+        >>> assert hash_data(records, workers=2) == hash_data(records)
     """
     base = _rectify_base(base)
     hashlen = _rectify_hashlen(hashlen)
-    hasher = _rectify_hasher(hasher)()
+    fingerprint = _rectify_fingerprint(fingerprint)
+    if chunksize is not None and isinstance(data, (list, tuple)):
+        if workers and isinstance(hasher, HASH):
+            raise TypeError('hash_data with workers requires a hasher type, '
+                            'not an instance')
+        if isinstance(hasher, HASH):
+            # every chunk needs a fresh copy of the pristine hasher
+            hasher_type = hasher.copy
+        else:
+            hasher_type = _rectify_hasher(hasher)
+            hasher = hasher_type()
+        hasher = _hash_data_tree(data, hasher, hasher_type, chunksize,
+                                 workers, memo, fingerprint)
+        text = _digest_hasher(hasher, hashlen, base)
+        if fingerprint is not None:
+            text = _fingerprint_tag(fingerprint) + text
+        return text
+    if memo and not isinstance(hasher, HASH):
+        hasher = _rectify_hasher(hasher)
+        memo = _HashMemo(hasher, fingerprint=fingerprint)
+        hasher = hasher()
+    else:
+        memo = None
+        hasher = _rectify_hasher(hasher)()
     # Feed the data into the hasher
-    _update_hasher(hasher, data)
+    _update_hasher(hasher, data, memo=memo, fingerprint=fingerprint)
     # Get the hashed representation
     text = _digest_hasher(hasher, hashlen, base)
+    if fingerprint is not None:
+        text = _fingerprint_tag(fingerprint) + text
     return text
 
 
-def hash_file(fpath, blocksize=65536, stride=1, hasher=NoParam,
-              hashlen=NoParam, base=NoParam):
+# The data hashed by `_hash_data_tree` in a forked worker process. It is only
+# ever set in the worker by `_init_hash_data_worker`, never in the parent.
+_FORKED_DATA = None
+
+
+def _init_hash_data_worker(data):
+    """
+    Initializer of the forked worker processes of `_hash_data_tree`. The
+    forked process inherits `data` from the memory of the pool that created
+    it, so it does not need to be pickled.
+    """
+    global _FORKED_DATA
+    _FORKED_DATA = data
+
+
+def _hash_data_leaf(task):
+    """
+    Returns the digest of one chunk of items, hashed as a list. This is the
+    task of a worker process in `_hash_data_tree`.
+    """
+    chunk, start, stop, hasher_type, memo, fingerprint = task
+    if chunk is None:
+        chunk = _FORKED_DATA[start:stop]
+    hasher = hasher_type()
+    if memo:
+        memo = _HashMemo(hasher_type, fingerprint=fingerprint)
+    else:
+        memo = None
+    _update_hasher(hasher, list(chunk), memo=memo, fingerprint=fingerprint)
+    return hasher.digest()
+
+
+def _pool_context():
+    """
+    Returns the multiprocessing context of the process pool of
+    `_hash_data_tree`, and whether its workers are forked.
+
+    The start method set by the program is used if there is one, otherwise
+    the platform default. It is never fixed as a side effect, so the program
+    can still call `multiprocessing.set_start_method` later. Forking a
+    process that already runs other threads can deadlock the children (on
+    locks held by those threads), so then the 'forkserver' method is used.
+
+    Example:
+        >>> context, forked = _pool_context()
+        >>> assert hasattr(context, 'Pool')
+    """
+    import multiprocessing
+    if six.PY2:  # nocover
+        return multiprocessing, hasattr(os, 'fork')
+    method = multiprocessing.get_start_method(allow_none=True)
+    if method is None:
+        if sys.platform in ('win32', 'darwin'):
+            method = 'spawn'
+        else:
+            method = 'fork'
+    if method == 'fork' and threading.active_count() > 1:
+        method = 'forkserver'
+    return multiprocessing.get_context(method), method == 'fork'
+
+
+def _hash_data_tree(data, hasher, hasher_type, chunksize, workers, memo=False,
+                    fingerprint=None):
+    """
+    Merkle-style hash of a sequence. The items are split into chunks of
+    `chunksize` items, each chunk is hashed independently as a list, and the
+    ordered digests of the chunks are hashed to form the root, i.e. the root
+    is updated with ``b'TREE' + _int_to_bytes(chunksize)`` followed by the
+    digest of every chunk. An empty sequence has a single empty chunk.
+
+    Chunks are hashed in a process pool when workers > 0 (see
+    `_pool_context`). If processes are forked, workers read the chunks from
+    memory they inherit from their own pool, otherwise chunks are pickled and
+    sent to the workers. When other threads are running, processes are not
+    forked, which is slower to start, and if `memo` is True the chunks are
+    then hashed serially. Concurrent calls from several threads do not share
+    any state. The result depends on `chunksize` but not on `workers`.
+
+    Args:
+        data (list | tuple): the items to hash
+        hasher (HASH): the root hasher
+        hasher_type (callable): creates a new hasher for each chunk
+        chunksize (int): number of items in each chunk
+        workers (int): number of processes. If 0, chunks are hashed serially.
+        memo (bool): if True, each chunk is hashed with a `_HashMemo`
+        fingerprint (Tuple[int, int]): see `_update_hasher`
+
+    Returns:
+        HASH: the root hasher
+
+    Example:
+        >>> data = list(range(100)) + ['a', [1, 2]]
+        >>> root = _hash_data_tree(data, hashlib.sha1(), hashlib.sha1, 50, 0)
+        >>> want = hashlib.sha1(b'TREE' + _int_to_bytes(50))
+        >>> for chunk in [data[0:50], data[50:100], data[100:]]:
+        >>>     leaf = hashlib.sha1()
+        >>>     _update_hasher(leaf, chunk)
+        >>>     want.update(leaf.digest())
+        >>> assert root.hexdigest() == want.hexdigest()
+    """
+    from ubelt import util_list
+    if chunksize < 1:
+        raise ValueError('chunksize must be positive')
+    nchunks = max(1, int(math.ceil(len(data) / chunksize)))
+    if workers > 0 and nchunks > 1:
+        context, forked = _pool_context()
+        if memo and not forked:
+            # Pickling loses the read-only flag of arrays, which decides what
+            # is memoized, so the chunks are hashed in this process instead
+            workers = 0
+    if workers > 0 and nchunks > 1:
+        if forked:
+            # forked workers inherit the data, only send the ranges
+            tasks = [(None, start, start + chunksize, hasher_type, memo,
+                      fingerprint)
+                     for start in range(0, len(data), chunksize)]
+            pool = context.Pool(min(workers, nchunks),
+                                _init_hash_data_worker, (data,))
+        else:
+            tasks = [(chunk, None, None, hasher_type, memo, fingerprint)
+                     for chunk in util_list.chunks(data, chunksize)]
+            pool = context.Pool(min(workers, nchunks))
+        try:
+            digests = pool.map(_hash_data_leaf, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        chunks = list(util_list.chunks(data, chunksize)) or [[]]
+        digests = [_hash_data_leaf((chunk, None, None, hasher_type, memo,
+                                    fingerprint))
+                   for chunk in chunks]
+    root = hasher
+    root.update(b'TREE' + _int_to_bytes(chunksize))
+    for digest in digests:
+        root.update(digest)
+    return root
+
+
+class Hasher(object):
+    """
+    Incrementally computes the hash of a stream of data and files.
+
+    Each call to `update` feeds the same bytes to the underlying algorithm as
+    `hash_data` would, and `update_file` feeds the same bytes as `hash_file`.
+    Thus the digest of a single update matches the corresponding one-shot
+    function. Multiple updates are concatenated, so the result is not the
+    same as hashing a list of the same items.
+
+    Args:
+        hasher (str | HASH): hash algorithm, see `hash_data`.
+
+    Example:
+        >>> import ubelt as ub
+        >>> def records():
+        >>>     for i in range(100):
+        >>>         yield {'id': i, 'name': 'record{}'.format(i)}
+        >>> hasher = ub.Hasher('sha1')
+        >>> for record in records():
+        >>>     hasher.update(record)
+        >>> print(hasher.digest(hashlen=8))
+        >>> # Digests of a single update match the one-shot functions
+        >>> assert ub.Hasher().update([1, 2]).digest() == ub.hash_data([1, 2])
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+        >>> ub.writeto(fpath, 'foobar')
+        >>> hasher = ub.Hasher().update_file(fpath)
+        >>> assert hasher.digest() == ub.hash_file(fpath)
+        >>> # copies are independent of the original
+        >>> other = hasher.copy().update('more data')
+        >>> assert other.digest() != hasher.digest()
+        >>> assert hasher.digest(hashlen=8, base='hex') == ub.hash_file(
+        >>>     fpath, hashlen=8, base='hex')
+    """
+
+    def __init__(self, hasher=NoParam):
+        self._hasher = _rectify_hasher(hasher)()
+
+    def update(self, data):
+        """
+        Hashes data, which can be anything supported by `hash_data`.
+
+        Returns:
+            Hasher: self
+        """
+        _update_hasher(self._hasher, data)
+        return self
+
+    def update_file(self, fpath, blocksize=None, use_mmap=False):
+        """
+        Hashes the contents of a file, see `hash_file`.
+
+        Returns:
+            Hasher: self
+        """
+        filesize = os.path.getsize(fpath)
+        blocksize = _rectify_blocksize(blocksize, filesize)
+        _hash_file_range(fpath, self._hasher, 0, filesize, blocksize,
+                         use_mmap=use_mmap)
+        return self
+
+    def copy(self):
+        """
+        Returns:
+            Hasher: an independent hasher with the same state
+        """
+        new = self.__class__.__new__(self.__class__)
+        new._hasher = self._hasher.copy()
+        return new
+
+    def digest(self, hashlen=NoParam, base=NoParam):
+        """
+        Returns the hash of everything seen so far. Updates can continue
+        after a digest is computed.
+
+        Args:
+            hashlen (int): maximum number of symbols in the returned hash. If
+                not specified, all are returned.
+            base (list): list of symbols or shorthand key. Defaults to base 26
+
+        Returns:
+            str: text -  hash string
+        """
+        return _digest_hasher(self._hasher, _rectify_hashlen(hashlen),
+                              _rectify_base(base))
+
+
+def _rectify_fingerprint(fingerprint):
+    """
+    Normalizes the `fingerprint` argument into an (nsamples, samplesize)
+    tuple, or None if fingerprinting is disabled.
+
+    Example:
+        >>> assert _rectify_fingerprint(False) is None
+        >>> assert _rectify_fingerprint(True) == DEFAULT_FINGERPRINT
+        >>> assert _rectify_fingerprint(8) == (8, DEFAULT_FINGERPRINT[1])
+        >>> assert _rectify_fingerprint((8, 16)) == (8, 16)
+        >>> import pytest
+        >>> assert pytest.raises(ValueError, _rectify_fingerprint, (8, 0))
+    """
+    if fingerprint is None or fingerprint is False:
+        return None
+    elif fingerprint is True:
+        return DEFAULT_FINGERPRINT
+    elif isinstance(fingerprint, six.integer_types):
+        nsamples, samplesize = fingerprint, DEFAULT_FINGERPRINT[1]
+    else:
+        nsamples, samplesize = fingerprint
+    if nsamples < 0 or samplesize < 1:
+        raise ValueError('invalid fingerprint={!r}'.format(fingerprint))
+    return (int(nsamples), int(samplesize))
+
+
+def _fingerprint_tag(fingerprint):
+    """
+    The prefix that records the fingerprint parameters in a result
+
+    Example:
+        >>> print(_fingerprint_tag((64, 4096)))
+        fp64x4096-
+    """
+    return 'fp{}x{}-'.format(*fingerprint)
+
+
+def _fingerprint_ranges(size, nsamples, samplesize):
+    """
+    Returns the [start, stop) ranges sampled by a fingerprint of `size` units:
+    the head, `nsamples` evenly spaced samples, and the tail. If these would
+    cover everything, a single range over the entire data is returned.
+
+    Example:
+        >>> print(_fingerprint_ranges(100, 3, 10))
+        [(0, 10), (22, 32), (45, 55), (67, 77), (90, 100)]
+        >>> print(_fingerprint_ranges(50, 3, 10))
+        [(0, 50)]
+    """
+    if size <= (nsamples + 2) * samplesize:
+        return [(0, size)]
+    last = size - samplesize
+    starts = [0] + [(i * last) // (nsamples + 1)
+                    for i in range(1, nsamples + 1)] + [last]
+    return [(start, start + samplesize) for start in starts]
+
+
+def _hash_file_fingerprint(fpath, hasher, nsamples, samplesize):
+    """
+    Updates `hasher` with the size of a file and samples of its contents.
+
+    Only ``(nsamples + 2) * samplesize`` bytes are read, so the time does not
+    depend on the size of the file.
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+        >>> ub.writeto(fpath, 'foobar' * 100)
+        >>> hash1 = _hash_file_fingerprint(fpath, hashlib.sha1(), 2, 4).hexdigest()
+        >>> ub.writeto(fpath, 'foobar' * 50 + 'FOOBAR' + 'foobar' * 49)
+        >>> hash2 = _hash_file_fingerprint(fpath, hashlib.sha1(), 2, 4).hexdigest()
+        >>> assert hash1 == hash2  # the change was not sampled
+    """
+    filesize = os.path.getsize(fpath)
+    hasher.update(b'FPRINT' + b'_,_'.join([
+        _int_to_bytes(filesize), _int_to_bytes(nsamples),
+        _int_to_bytes(samplesize)]))
+    ranges = _fingerprint_ranges(filesize, nsamples, samplesize)
+    if len(ranges) == 1:
+        return _hash_file_range(fpath, hasher, 0, filesize,
+                                _rectify_blocksize(None, filesize))
+    buf = bytearray(samplesize)
+    view = memoryview(buf)
+    with open(fpath, 'rb') as file:
+        for start, stop in ranges:
+            file.seek(start)
+            nbytes = file.readinto(view)
+            hasher.update(view[:nbytes])
+    return hasher
+
+
+def _rectify_blocksize(blocksize, filesize, stride=1):
+    """
+    Chooses the number of bytes to read at a time when hashing a file.
+
+    Larger reads amortize per-call overhead, but there is little benefit
+    beyond a few MiB, and small files should not allocate large buffers.
+    When stride > 1 the blocksize influences the hash, so the historical
+    default of 2 ** 16 is kept in that case.
+
+    Example:
+        >>> assert _rectify_blocksize(None, 10) == 2 ** 16
+        >>> assert _rectify_blocksize(None, 2 ** 30) == 2 ** 22
+        >>> assert _rectify_blocksize(None, 2 ** 30, stride=2) == 2 ** 16
+        >>> assert _rectify_blocksize(7, 2 ** 30) == 7
+    """
+    if blocksize is None:
+        if stride > 1:
+            blocksize = 2 ** 16
+        else:
+            blocksize = max(2 ** 16, min(2 ** 22, filesize // 16))
+    return blocksize
+
+
+def _hash_file_range(fpath, hasher, start, stop, blocksize, stride=1,
+                     use_mmap=False):
+    """
+    Updates `hasher` with the bytes of a file in the range [start, stop).
+
+    Blocks of `blocksize` bytes are hashed, and when stride > 1 the next
+    ``blocksize * (stride - 1)`` bytes after each block are skipped.
+
+    If `use_mmap` is True the file is memory mapped and slices of the mapping
+    are passed to the hasher directly, otherwise blocks are read into a
+    reusable buffer. In both cases no intermediate bytes objects are created.
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+        >>> ub.writeto(fpath, 'foobar')
+        >>> hasher = _hash_file_range(fpath, hashlib.sha1(), 1, 4, 2)
+        >>> assert hasher.hexdigest() == hashlib.sha1(b'oob').hexdigest()
+        >>> hasher = _hash_file_range(fpath, hashlib.sha1(), 1, 4, 2,
+        >>>                           use_mmap=True)
+        >>> assert hasher.hexdigest() == hashlib.sha1(b'oob').hexdigest()
+        >>> hasher = _hash_file_range(fpath, hashlib.sha1(), 0, 6, 1,
+        >>>                           stride=2, use_mmap=True)
+        >>> assert hasher.hexdigest() == hashlib.sha1(b'foa').hexdigest()
+    """
+    step = blocksize * stride
+    with open(fpath, 'rb') as file:
+        if use_mmap and stop > start:
+            import mmap
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                view = memoryview(mapped)
+                stop = min(stop, len(view))
+                try:
+                    for offset in range(start, stop, step):
+                        hasher.update(view[offset:min(offset + blocksize, stop)])
+                finally:
+                    # the view must be released before the map is closed
+                    view.release()
+            finally:
+                mapped.close()
+        else:
+            buf = bytearray(min(blocksize, max(stop - start, 0)))
+            view = memoryview(buf)
+            for offset in range(start, stop, step):
+                file.seek(offset)
+                nbytes = file.readinto(view[:min(blocksize, stop - offset)])
+                if not nbytes:
+                    break
+                hasher.update(view[:nbytes])
+    return hasher
+
+
+def _hash_file_tree(fpath, hasher, chunksize, blocksize, workers,
+                    use_mmap=False):
+    """
+    Merkle-style hash of a file. The file is split into ranges of `chunksize`
+    bytes, each range is hashed independently, and the ordered digests of the
+    ranges are hashed to form the root. Ranges are hashed concurrently in a
+    thread pool, which is effective because hashlib releases the GIL on large
+    updates. The result depends on `chunksize` but not on `workers`.
+
+    Args:
+        fpath (str): file path string
+        hasher (HASH): an unused hasher instance, which serves as a template
+            for the range hashers and then becomes the root hasher.
+        chunksize (int): number of bytes in each leaf range
+        blocksize (int): number of bytes read at a time within each range
+        workers (int): number of threads. If 0, ranges are hashed serially.
+        use_mmap (bool): if True, ranges are read through a memory map.
+
+    Returns:
+        HASH: the root hasher
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+        >>> ub.writeto(fpath, 'foobar' * 100)
+        >>> root1 = _hash_file_tree(fpath, hashlib.sha1(), 64, 8, workers=0)
+        >>> root2 = _hash_file_tree(fpath, hashlib.sha1(), 64, 8, workers=4)
+        >>> assert root1.hexdigest() == root2.hexdigest()
+    """
+    filesize = os.path.getsize(fpath)
+    starts = list(range(0, filesize, chunksize)) or [0]
+    # Copy the pristine hasher to create independent leaf hashers in the main
+    # thread before dispatching any work.
+    leaves = [hasher.copy() for _ in starts]
+    tasks = [(leaf, start, min(start + chunksize, filesize))
+             for leaf, start in zip(leaves, starts)]
+
+    def _worker(task):
+        leaf, start, stop = task
+        return _hash_file_range(fpath, leaf, start, stop, blocksize,
+                                use_mmap=use_mmap).digest()
+
+    if workers > 0 and len(tasks) > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(workers, len(tasks)))
+        try:
+            digests = pool.map(_worker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        digests = list(map(_worker, tasks))
+
+    root = hasher
+    root.update(b'TREE' + _int_to_bytes(chunksize))
+    for digest in digests:
+        root.update(digest)
+    return root
+
+
+def hash_file(fpath, blocksize=None, stride=1, hasher=NoParam,
+              hashlen=NoParam, base=NoParam, chunksize=None, workers=0,
+              use_mmap=False, cache=False, fingerprint=False):
     """
     Hashes the data in a file on disk.
 
     Args:
         fpath (str):  file path string
-        blocksize (int): 2 ** 16. Affects speed of reading file
+        blocksize (int): number of bytes to read at a time. Affects speed of
+            reading file. If unspecified, it is chosen based on the file
+            size (2 ** 16 to 2 ** 22), or is 2 ** 16 when stride > 1.
         stride (int): strides > 1 skip data to hash, useful for faster
                       hashing, but less accurate, also makes hash dependant on
                       blocksize.
-        hasher (HASH): hash algorithm from hashlib, defaults to `sha512`.
+        hasher (str | HASH): hash algorithm from hashlib, defaults to `sha512`.
+            Registered non-cryptographic hashers (e.g. 'xxh64', 'blake3') and
+            the special key 'fast' are also accepted.
         hashlen (int): maximum number of symbols in the returned hash. If
             not specified, all are returned.
         base (list): list of symbols or shorthand key. Defaults to base 26
+        chunksize (int): if specified, the file is hashed as a tree of ranges
+            of this many bytes (see `workers`). The resulting hash depends on
+            `chunksize` and is different from the default flat hash.
+            `DEFAULT_CHUNKSIZE` (16 MiB) is a good value for large files.
+        workers (int): number of threads used to hash ranges in tree mode.
+            It only has an effect when `chunksize` is specified, because the
+            flat hash cannot be split, so it never changes the hash.
+        use_mmap (bool): if True, the file is memory mapped and passed to the
+            hasher without copying it into intermediate buffers. This does
+            not change the resulting hash. It is typically faster for files
+            larger than a few MiB and slower for small files.
+        cache (bool): if True, the hash is stored in a persistent index in
+            the ubelt cache directory. Later calls return the stored hash
+            without reading the file, as long as its path, inode, size,
+            and modification time are unchanged. Ignored if `hasher` is
+            an instance or a callable without a stable name (e.g. a lambda).
+        fingerprint (bool | int | Tuple[int, int]): if truthy, only the size
+            of the file, its head, its tail, and evenly spaced samples are
+            hashed. An int specifies the number of samples and a tuple
+            specifies (nsamples, samplesize) in bytes. True uses
+            `DEFAULT_FINGERPRINT`, which reads 264 KiB. The result is
+            prefixed with these parameters (e.g. ``'fp64x4096-'``), so only
+            fingerprints with the same parameters compare equal. Files that
+            are smaller than the samples are hashed in full. Unlike `stride`,
+            this does not depend on `blocksize`.
 
     Notes:
         For better hashes keep stride = 1
         For faster hashes set stride > 1
         blocksize matters when stride > 1
+        For large files on fast disks use chunksize and workers > 1
 
     References:
         http://stackoverflow.com/questions/3431825/md5-checksum-of-a-file
@@ -639,27 +2120,372 @@ def hash_file(fpath, blocksize=65536, stride=1, hasher=NoParam,
         >>> ub.writeto(fpath, 'foobar')
         >>> print(ub.hash_file(fpath, hasher='sha512', hashlen=8))
         vkiodmcj
+
+    Example:
+        >>> # Tree hashes are the same for any number of workers
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+        >>> ub.writeto(fpath, 'foobar' * 1000)
+        >>> hash1 = ub.hash_file(fpath, chunksize=1024)
+        >>> hash2 = ub.hash_file(fpath, chunksize=1024, workers=4)
+        >>> assert hash1 == hash2
+        >>> assert hash1 != ub.hash_file(fpath)
+        >>> # Without a chunksize, workers do not change the flat hash
+        >>> assert ub.hash_file(fpath, workers=4) == ub.hash_file(fpath)
+
+    Example:
+        >>> # Cached hashes are reused until the file changes
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+        >>> ub.writeto(fpath, 'foobar')
+        >>> hash1 = ub.hash_file(fpath, cache=True)
+        >>> assert hash1 == ub.hash_file(fpath, cache=True)
+        >>> assert hash1 == ub.hash_file(fpath)
+
+    Example:
+        >>> # Fingerprints of large files only read a few samples
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> fpath = join(ub.ensure_app_cache_dir('ubelt'), 'tmp.txt')
+        >>> ub.writeto(fpath, 'foobar' * 100000)
+        >>> print(ub.hash_file(fpath, fingerprint=True, hashlen=8))
+        fp64x4096-...
+        >>> print(ub.hash_file(fpath, fingerprint=(8, 16), hashlen=8))
+        fp8x16-...
     """
     base = _rectify_base(base)
     hashlen = _rectify_hashlen(hashlen)
-    hasher = _rectify_hasher(hasher)()
-    with open(fpath, 'rb') as file:
-        buf = file.read(blocksize)
-        if stride > 1:
-            # skip blocks when stride is greater than 1
-            while len(buf) > 0:
-                hasher.update(buf)
-                file.seek(blocksize * (stride - 1), 1)
-                buf = file.read(blocksize)
-        else:
-            # otherwise hash the entire file
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = file.read(blocksize)
+    fingerprint = _rectify_fingerprint(fingerprint)
+    if chunksize is not None and stride > 1:
+        raise ValueError('stride > 1 is not supported with chunksize')
+    if fingerprint is not None and (chunksize is not None or stride > 1):
+        raise ValueError('fingerprint is not supported with chunksize or '
+                         'stride > 1')
+    if isinstance(hasher, HASH):
+        # the state of an instance is unknown, so its results are not cached
+        cache = False
+    hasher = _rectify_hasher(hasher)
+    text = _hash_file_worker(fpath, hasher, hashlen, base, blocksize, stride,
+                             chunksize, workers, use_mmap, cache, fingerprint)
+    return text
+
+
+def _hash_file_worker(fpath, hasher, hashlen, base, blocksize=None, stride=1,
+                      chunksize=None, workers=0, use_mmap=False, cache=False,
+                      fingerprint=None):
+    """
+    The body of `hash_file`, which expects arguments that have already been
+    rectified. This lets `hash_files` do the setup only once per batch.
+
+    Args:
+        hasher (callable): a hasher class (not an instance)
+        cache (bool): if True, use the persistent `_HashFileCache`
+        fingerprint (Tuple[int, int] | None): (nsamples, samplesize)
+    """
+    if cache:
+        ident = _hasher_identity(hasher)
+        # hashers without a stable identity could reuse each other's results
+        cache = ident is not None
+    hasher = hasher()
+    if cache:
+        # The blocksize only influences the hash when stride > 1
+        params = '{},{},{},{}'.format(ident, stride,
+                                      blocksize if stride > 1 else None,
+                                      chunksize)
+        if fingerprint is not None:
+            params += ',' + _fingerprint_tag(fingerprint)
+        stat_key = _HashFileCache._stat_key(fpath)
+        hex_text = _HASH_FILE_CACHE.lookup(stat_key, params)
+        if hex_text is not None:
+            text = _digest_hexstr(hex_text, hashlen, base)
+            if fingerprint is not None:
+                text = _fingerprint_tag(fingerprint) + text
+            return text
+    filesize = os.path.getsize(fpath)
+    blocksize = _rectify_blocksize(blocksize, filesize, stride)
+    if fingerprint is not None:
+        hasher = _hash_file_fingerprint(fpath, hasher, *fingerprint)
+    elif chunksize is not None:
+        hasher = _hash_file_tree(fpath, hasher, chunksize, blocksize, workers,
+                                 use_mmap=use_mmap)
+    else:
+        hasher = _hash_file_range(fpath, hasher, 0, filesize, blocksize,
+                                  stride=stride, use_mmap=use_mmap)
+    hex_text = hasher.hexdigest()
+    if cache:
+        # Only store the result if the file did not change while hashing
+        if _HashFileCache._stat_key(fpath) == stat_key:
+            _HASH_FILE_CACHE.store(stat_key, params, hex_text)
     # Get the hashed representation
-    text = _digest_hasher(hasher, hashlen, base)
+    text = _digest_hexstr(hex_text, hashlen, base)
+    if fingerprint is not None:
+        text = _fingerprint_tag(fingerprint) + text
     return text
 
+
+class _HashFileCache(object):
+    """
+    Persistent index of `hash_file` results keyed by file stat information.
+
+    A stored hash is reused only if the real path, inode, size, and
+    modification time of the file are unchanged and the hashing parameters
+    are the same. This is the same assumption tools like make and rsync rely
+    on. Entries for files with a different stat are evicted when found.
+
+    The index is a sqlite database, which handles locking when multiple
+    processes read and write it at the same time.
+
+    Args:
+        fpath (str): path to the database. Defaults to a file in the ubelt
+            application cache directory.
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_hash_cache')
+        >>> self = _HashFileCache(join(dpath, 'index.sqlite'))
+        >>> self.clear()
+        >>> fpath = join(dpath, 'file.txt')
+        >>> ub.writeto(fpath, 'foobar')
+        >>> stat_key = self._stat_key(fpath)
+        >>> assert self.lookup(stat_key, 'sha1') is None
+        >>> self.store(stat_key, 'sha1', 'abcdef')
+        >>> assert self.lookup(stat_key, 'sha1') == 'abcdef'
+        >>> ub.delete(fpath)
+        >>> assert self.prune() == 1
+        >>> assert self.lookup(stat_key, 'sha1') is None
+    """
+
+    def __init__(self, fpath=None):
+        self.fpath = fpath
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stat_key(fpath):
+        """
+        Returns the realpath and the stat tuple that identify a file's state
+        """
+        realpath = os.path.realpath(fpath)
+        st = os.stat(realpath)
+        mtime_ns = getattr(st, 'st_mtime_ns', None)
+        if mtime_ns is None:  # nocover
+            mtime_ns = int(st.st_mtime * 1e9)
+        return realpath, (st.st_ino, st.st_size, mtime_ns)
+
+    def _connect(self):
+        # sqlite connections must not be shared with forked processes
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3
+            if self.fpath is None:
+                from ubelt import util_platform
+                dpath = util_platform.ensure_app_cache_dir('ubelt')
+                self.fpath = os.path.join(
+                    dpath, 'hash_file_cache_v{}.sqlite'.format(HASH_VERSION))
+            conn = sqlite3.connect(self.fpath, timeout=60,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            try:
+                # Write-ahead logging lets readers proceed during writes
+                conn.execute('PRAGMA journal_mode=WAL')
+            except sqlite3.DatabaseError:  # nocover
+                pass
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                'fpath TEXT, params TEXT, inode INTEGER, size INTEGER, '
+                'mtime_ns INTEGER, hexdigest TEXT, '
+                'PRIMARY KEY (fpath, params))')
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def lookup(self, stat_key, params):
+        """
+        Returns the stored hex digest if the file is unchanged, otherwise None
+        """
+        realpath, stat = stat_key
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT inode, size, mtime_ns, hexdigest FROM hashes '
+                'WHERE fpath=? AND params=?', (realpath, params)).fetchone()
+            if row is None:
+                return None
+            if tuple(row[0:3]) != stat:
+                conn.execute('DELETE FROM hashes WHERE fpath=? AND params=?',
+                             (realpath, params))
+                return None
+            return row[3]
+
+    def store(self, stat_key, params, hexdigest):
+        """
+        Records the hex digest of a file and evicts its stale entries
+        """
+        realpath, (inode, size, mtime_ns) = stat_key
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    'DELETE FROM hashes WHERE fpath=? AND '
+                    '(inode!=? OR size!=? OR mtime_ns!=?)',
+                    (realpath, inode, size, mtime_ns))
+                conn.execute(
+                    'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)',
+                    (realpath, params, inode, size, mtime_ns, hexdigest))
+
+    def prune(self):
+        """
+        Evicts entries for files that no longer exist or have changed.
+
+        Returns:
+            int: number of evicted entries
+        """
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                'SELECT fpath, params, inode, size, mtime_ns FROM hashes'
+            ).fetchall()
+            stale = []
+            for realpath, params, inode, size, mtime_ns in rows:
+                try:
+                    _, stat = self._stat_key(realpath)
+                except OSError:
+                    stat = None
+                if stat != (inode, size, mtime_ns):
+                    stale.append((realpath, params))
+            with conn:
+                conn.executemany(
+                    'DELETE FROM hashes WHERE fpath=? AND params=?', stale)
+        return len(stale)
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM hashes')
+
+
+_HASH_FILE_CACHE = _HashFileCache()
+
+
+def _hash_files_task(fpath, **kwargs):
+    """ Top level function so it can be pickled for process pools """
+    return fpath, _hash_file_worker(fpath, **kwargs)
+
+
+def _walk_files(dpath):
+    """
+    Yields the paths of all files in a directory tree in a stable order
+    """
+    for root, dnames, fnames in os.walk(dpath):
+        dnames.sort()
+        for fname in sorted(fnames):
+            yield os.path.join(root, fname)
+
+
+def hash_files(paths, workers=0, mode='thread', blocksize=None, stride=1,
+               hasher=NoParam, hashlen=NoParam, base=NoParam, use_mmap=False,
+               cache=False, fingerprint=False):
+    """
+    Hashes many files concurrently.
+
+    This is faster than calling `hash_file` in a loop, especially for many
+    small files, because the hashing options are processed only once and
+    file I/O overlaps across workers. Each resulting hash is the same as the
+    one `hash_file` returns with the same options.
+
+    Args:
+        paths (str | List[str]): a list of file paths, or a directory path,
+            in which case all files in the directory tree are hashed.
+        workers (int): number of parallel workers. If 0, files are hashed
+            serially in the current thread.
+        mode (str): either 'thread' or 'process'. Threads are usually
+            sufficient because hashlib releases the GIL on large updates.
+            Processes can help for many small files or for hashers that do
+            not release the GIL.
+        blocksize (int): see `hash_file`
+        stride (int): see `hash_file`
+        hasher (str | HASH): hash algorithm, see `hash_file`. Instances
+            of a hasher are not supported.
+        hashlen (int): see `hash_file`
+        base (list): see `hash_file`
+        use_mmap (bool): see `hash_file`
+        cache (bool): see `hash_file`
+        fingerprint (bool | int | Tuple[int, int]): see `hash_file`
+
+    Returns:
+        Iterator[Tuple[str, str]]: (fpath, hashid) pairs. When workers > 0
+            these are yielded in the order they complete, not in the input
+            order. The arguments are checked when `hash_files` is called,
+            but files are only hashed as the iterator is consumed.
+
+    Example:
+        >>> import ubelt as ub
+        >>> from os.path import join
+        >>> dpath = ub.ensure_app_cache_dir('ubelt', 'test_hash_files')
+        >>> fpaths = [join(dpath, 'file{}.txt'.format(i)) for i in range(5)]
+        >>> for i, fpath in enumerate(fpaths):
+        >>>     ub.writeto(fpath, 'data{}'.format(i))
+        >>> result = dict(ub.hash_files(fpaths, workers=2, hashlen=8))
+        >>> assert result == {p: ub.hash_file(p, hashlen=8) for p in fpaths}
+        >>> assert dict(ub.hash_files(dpath, hashlen=8)) == result
+    """
+    if isinstance(hasher, HASH):
+        raise TypeError('hash_files requires a hasher type, not an instance')
+    if fingerprint and stride > 1:
+        raise ValueError('fingerprint is not supported with stride > 1')
+    if mode not in {'thread', 'process'}:
+        raise KeyError('unknown mode={}'.format(mode))
+    if workers < 0:
+        raise ValueError('workers must be non-negative')
+    if isinstance(paths, six.string_types):
+        paths = list(_walk_files(paths))
+    else:
+        paths = list(paths)
+    hasher = _rectify_hasher(hasher)
+    kwargs = dict(
+        hasher=hasher,
+        hashlen=_rectify_hashlen(hashlen),
+        base=_rectify_base(base),
+        blocksize=blocksize,
+        stride=stride,
+        use_mmap=use_mmap,
+        cache=cache,
+        fingerprint=_rectify_fingerprint(fingerprint),
+    )
+    return _hash_files_iter(paths, workers, mode, kwargs)
+
+
+def _hash_files_iter(paths, workers, mode, kwargs):
+    """
+    The generator returned by `hash_files`, which expects arguments that
+    have already been checked and rectified.
+    """
+    if workers > 0 and len(paths) > 1:
+        if mode == 'thread':
+            from multiprocessing.pool import ThreadPool as Pool
+        else:
+            from multiprocessing import Pool
+        task = functools.partial(_hash_files_task, **kwargs)
+        # Batch small files together to reduce per-task overhead
+        batchsize = max(1, min(64, len(paths) // (workers * 4)))
+        pool = Pool(min(workers, len(paths)))
+        try:
+            for item in pool.imap_unordered(task, paths, batchsize):
+                yield item
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for fpath in paths:
+            yield _hash_files_task(fpath, **kwargs)
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
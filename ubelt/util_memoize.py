@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
+import collections
 import functools
 import sys
+import threading
+import time
+try:
+    from collections import abc
+except ImportError:  # nocover
+    import collections as abc
+from timeit import default_timer
 from ubelt import util_hash
+from ubelt.util_cache import _CACHE_STATS
 
 
 def _hashable(item):
@@ -37,8 +46,10 @@ def _make_signature_key(args, kwargs):
         >>>     import collections as abc
         >>> else:
         >>>     from collections import abc
-        >>> with pytest.raises(TypeError):
-        >>>     _make_signature_key((4, [1, 2], {1: 2, 'a': 'b'}), kwargs={})
+        >>> # dicts and sets are hashed independent of their order
+        >>> key1 = _make_signature_key((4, [1, 2], {1: 2, 'a': 'b'}), {})
+        >>> key2 = _make_signature_key((4, [1, 2], {'a': 'b', 1: 2}), {})
+        >>> assert key1 == key2
         >>> class Dummy(abc.MutableSet):
         >>>     def __contains__(self, item): return None
         >>>     def __iter__(self): return iter([])
@@ -63,18 +74,211 @@ def _make_signature_key(args, kwargs):
     return key
 
 
-def memoize(func):
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+def _sizeof(value):
+    """
+    Estimates the memory used by a value: the `nbytes` of arrays, otherwise
+    the shallow size reported by `sys.getsizeof`.
+    """
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(value)
+
+
+class _MemoCache(abc.MutableMapping):
+    """
+    The cache of `memoize` and `memoize_method`.
+
+    Entries are kept in an OrderedDict in least recently used order, so
+    lookups, insertions, and evictions take constant time. Without `maxsize`
+    or `maxbytes` the cache grows without bounds.
+
+    It is a mapping from signature keys to results, like the dictionary that
+    was used before, so results can be read, set, and removed directly.
+    Only `lookup` counts hits and misses and updates the recency order.
+
+    Args:
+        maxsize (int): maximum number of entries
+        ttl (float): seconds after which an entry expires. Expired entries
+            are removed when they are looked up or reach the front of the
+            eviction order.
+        maxbytes (int): maximum total size of the values as estimated by
+            their `nbytes` attribute or `sys.getsizeof`. Larger values are
+            not cached.
+
+    Example:
+        >>> cache = _MemoCache(maxsize=2)
+        >>> cache['a'] = 1
+        >>> cache['b'] = 2
+        >>> assert cache.lookup('a') == (True, 1)
+        >>> cache['c'] = 3
+        >>> assert cache.lookup('b') == (False, None)
+        >>> assert sorted(cache.keys()) == ['a', 'c']
+        >>> assert cache['a'] == 1 and cache.get('b') is None
+        >>> cache.info()
+        CacheInfo(hits=1, misses=1, maxsize=2, currsize=2)
+    """
+
+    def __init__(self, maxsize=None, ttl=None, maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Only reorder entries on hits if something is evicted by recency
+        self._reorder = maxsize is not None or maxbytes is not None
+
+    def __getstate__(self):
+        # Memoized methods are stored on the instance, which may be pickled
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._get_entry(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        self.store(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self._entries:
+                raise KeyError(key)
+            self._pop(key)
+
+    def _get_entry(self, key):
+        entry = self._entries.get(key, None)
+        if entry is not None and self.ttl is not None:
+            if entry[2] <= time.time():
+                self._pop(key)
+                entry = None
+        return entry
+
+    def lookup(self, key):
+        """
+        Returns:
+            Tuple[bool, object]: a flag indicating if the key is cached, and
+                its value
+        """
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if self._reorder:
+                del self._entries[key]
+                self._entries[key] = entry
+            self.hits += 1
+            return True, entry[0]
+
+    def store(self, key, value):
+        nbytes = 0 if self.maxbytes is None else _sizeof(value)
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if self.maxbytes is not None and nbytes > self.maxbytes:
+                return
+            self._entries[key] = (value, nbytes, expires)
+            self.nbytes += nbytes
+            self._evict()
+
+    def _pop(self, key):
+        entry = self._entries.pop(key)
+        self.nbytes -= entry[1]
+
+    def _evict(self):
+        entries = self._entries
+        if self.ttl is not None:
+            now = time.time()
+            while entries:
+                key = next(iter(entries))
+                if entries[key][2] > now:
+                    break
+                self._pop(key)
+        if self.maxsize is not None:
+            while len(entries) > self.maxsize:
+                self._pop(next(iter(entries)))
+        if self.maxbytes is not None:
+            while self.nbytes > self.maxbytes:
+                self._pop(next(iter(entries)))
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+def _func_name(func):
+    """
+    Returns the name of a function in cache stats
+    """
+    return '{}.{}'.format(func.__module__,
+                          getattr(func, '__qualname__', func.__name__))
+
+
+def _compute(name, func, args, kwargs):
+    """
+    Calls func and records the miss and its time in the cache stats
+    """
+    if not _CACHE_STATS.enabled:
+        return func(*args, **kwargs)
+    _CACHE_STATS.record(name, 'miss')
+    start = default_timer()
+    value = func(*args, **kwargs)
+    _CACHE_STATS.record(name, 'compute', default_timer() - start)
+    return value
+
+
+def memoize(func=None, maxsize=None, ttl=None, maxbytes=None):
     """
     memoization decorator that respects args and kwargs
 
+    By default the cache grows without bounds. The `maxsize`, `ttl`, and
+    `maxbytes` policies bound it by evicting the least recently used
+    entries (see `_MemoCache`).
+
     References:
         https://wiki.python.org/moin/PythonDecoratorLibrary#Memoize
 
     Args:
         func (function): live python function
+        maxsize (int): maximum number of cached results
+        ttl (float): seconds after which a cached result expires
+        maxbytes (int): maximum total size of the cached results, as
+            estimated by their `nbytes` attribute or `sys.getsizeof`
 
     Returns:
-        func: memoized wrapper
+        func: memoized wrapper. Like `functools.lru_cache`, it has the
+            methods `cache_info` and `cache_clear`.
 
     CommandLine:
         python -m ubelt.util_decor memoize
@@ -101,15 +305,36 @@ def memoize(func):
         >>> assert foo('a') == 0 and foo('c') == 1
         >>> assert incr[0] == 6
         >>> assert foo_memo('a') == 'b' and foo_memo('c') == 'd'
+
+    Example:
+        >>> import ubelt as ub
+        >>> @ub.memoize(maxsize=2)
+        >>> def square(x):
+        >>>     return x ** 2
+        >>> square(1), square(2), square(1), square(3)
+        >>> square.cache_info()
+        CacheInfo(hits=1, misses=3, maxsize=2, currsize=2)
+        >>> square.cache_clear()
+        >>> assert square.cache_info().currsize == 0
     """
-    cache = {}
+    if func is None:
+        return functools.partial(memoize, maxsize=maxsize, ttl=ttl,
+                                 maxbytes=maxbytes)
+    cache = _MemoCache(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes)
+    name = _func_name(func)
     @functools.wraps(func)
     def memoizer(*args, **kwargs):
         key = _make_signature_key(args, kwargs)
-        if key not in cache:
-            cache[key] = func(*args, **kwargs)
-        return cache[key]
+        found, value = cache.lookup(key)
+        if not found:
+            value = _compute(name, func, args, kwargs)
+            cache.store(key, value)
+        elif _CACHE_STATS.enabled:
+            _CACHE_STATS.record(name, 'hit')
+        return value
     memoizer.cache = cache
+    memoizer.cache_info = cache.info
+    memoizer.cache_clear = cache.clear
     return memoizer
 
 
@@ -117,6 +342,16 @@ class memoize_method(object):
     """
     memoization decorator for a method that respects args and kwargs
 
+    Each instance has its own cache, which accepts the `maxsize`, `ttl`, and
+    `maxbytes` policies of `memoize`.
+
+    Args:
+        func (function): the method
+        maxsize (int): maximum number of cached results per instance
+        ttl (float): seconds after which a cached result expires
+        maxbytes (int): maximum total size of the cached results of an
+            instance
+
     References:
         http://code.activestate.com/recipes/577452-a-memoize-decorator-for-instance-methods/
 
@@ -154,10 +389,33 @@ class memoize_method(object):
         >>> assert incr[0] == 7
         >>> self2.foo_memo('a')
         >>> assert incr[0] == 7
+        >>> self2.foo_memo.cache_info()
+        CacheInfo(hits=1, misses=1, maxsize=None, currsize=1)
+
+    Example:
+        >>> import ubelt as ub
+        >>> class Foo(object):
+        >>>     @ub.memoize_method(maxsize=1)
+        >>>     def square(self, x):
+        >>>         return x ** 2
+        >>> self = Foo()
+        >>> self.square(1), self.square(2), self.square(2)
+        >>> self.square.cache_info()
+        CacheInfo(hits=1, misses=2, maxsize=1, currsize=1)
+        >>> self.square.cache_clear()
+        >>> assert self.square.cache_info().currsize == 0
     """
-    def __init__(self, func):
+    def __new__(cls, func=None, maxsize=None, ttl=None, maxbytes=None):
+        if func is None:
+            return functools.partial(cls, maxsize=maxsize, ttl=ttl,
+                                     maxbytes=maxbytes)
+        return super(memoize_method, cls).__new__(cls)
+
+    def __init__(self, func, maxsize=None, ttl=None, maxbytes=None):
         self._func = func
         self._cache_name = '_cache__' + func.__name__
+        self._stats_name = _func_name(func)
+        self._policy = {'maxsize': maxsize, 'ttl': ttl, 'maxbytes': maxbytes}
 
     def __get__(self, instance, cls=None):
         """
@@ -175,13 +433,42 @@ class memoize_method(object):
         """
         The wrapped function call
         """
-        cache = self._instance.__dict__.setdefault(self._cache_name, {})
+        cache = self._get_cache()
         key = _make_signature_key(args, kwargs)
-        if key in cache:
-            return cache[key]
+        found, value = cache.lookup(key)
+        if found:
+            if _CACHE_STATS.enabled:
+                _CACHE_STATS.record(self._stats_name, 'hit')
         else:
-            value = cache[key] = self._func(self._instance, *args, **kwargs)
-            return value
+            value = _compute(self._stats_name, self._func,
+                             (self._instance,) + args, kwargs)
+            cache.store(key, value)
+        return value
+
+    def _get_cache(self):
+        """
+        Returns the cache of the current instance
+        """
+        instance_dict = self._instance.__dict__
+        try:
+            return instance_dict[self._cache_name]
+        except KeyError:
+            cache = _MemoCache(**self._policy)
+            return instance_dict.setdefault(self._cache_name, cache)
+
+    def cache_info(self):
+        """
+        Returns:
+            CacheInfo: the hits, misses, maxsize, and current size of the
+                cache of the instance
+        """
+        return self._get_cache().info()
+
+    def cache_clear(self):
+        """
+        Clears the cache of the instance
+        """
+        self._get_cache().clear()
 
 if __name__ == '__main__':
     r"""